@@ -21,6 +21,9 @@ from py_svm.synk.abc import DatabaseAPI, BaseDB
 from pathlib import Path
 from pydantic import BaseConfig, BaseSettings, Field, validator
 from py_svm.synk.backends import sql as sqlq
+from py_svm.synk.backends.duck import (DuckStorage, StepBatch, decode_values,
+                                      fetch_table, keyset_pages, typed_values,
+                                      value_type)
 from py_svm.core.agent import Agent
 import gym
 import vaex
@@ -48,9 +51,13 @@ class DuckSettings(BaseSettings):
 
 
 class StateDB(ABC):
-    def __init__(self, db: BaseDB) -> None:
+    """Writes go into a `StepBatch`, which is appended in one statement when
+    the context moves on or before the next read."""
+
+    def __init__(self, db: BaseDB, batch: StepBatch | None = None) -> None:
         super().__init__()
         self._db = db
+        self._batch = batch if batch is not None else DuckStorage(db.conn).batch()
         self._address: Address | None = None
         self._ctx: StateCtx | None = None
         self.reset()
@@ -68,26 +75,23 @@ class StateDB(ABC):
         return []
 
     def set_state_ctx(self, _ctx: StateCtx) -> None:
+        self.flush()
         self._ctx = _ctx
 
+    def flush(self) -> None:
+        if len(self._batch):
+            self._batch.flush()
+
     def set_value(self, slot: str, value: Any) -> None:
         self._check_ctx(True)
-        self._db.run_query(
-            sqlq.INSERT_STORAGE,
-            (
-                self._ctx.episode,
-                self._ctx.address,
-                slot,
-                value,
-                value,
-                self._ctx.timestamp,
-            ),
+        self._batch.set_value(
+            self._ctx.episode, self._ctx.address, slot, value, self._ctx.timestamp
         )
 
 
 class LedgerDB(StateDB):
-    def __init__(self, db: BaseDB) -> None:
-        super().__init__(db)
+    def __init__(self, db: BaseDB, batch: StepBatch | None = None) -> None:
+        super().__init__(db, batch)
 
     @property
     def init_queries(self) -> List[str]:
@@ -95,100 +99,66 @@ class LedgerDB(StateDB):
 
     def set_value(self, slot, value: float) -> None:
         self._check_ctx(True)
-        self._db.execute(
-            sqlq.INSERT_ACCOUNT_STATE.format(
-                address=self._ctx.address,
-                episode=self._ctx.episode,
-                balance=value,
-                timestamp=self._ctx.timestamp,
-            ),
+        self._batch.set_balance(
+            self._ctx.episode, self._ctx.address, value, self._ctx.timestamp
         )
 
     def get_value(self, slot: str) -> float:
         self._check_ctx(True)
+        self.flush()
         arr = (
             self._db.execute(
-                sqlq.SELECT_ACCOUNT_ONE.format(
-                    address=self._ctx.address,
-                    episode=self._ctx.episode,
-                    timestamp=self._ctx.timestamp,
-                )
+                sqlq.SELECT_ACCOUNT_ONE,
+                [self._ctx.episode, self._ctx.address, self._ctx.timestamp],
             )[slot][0],
         )
         convert = arr[0].as_py() if arr else None
 
         return convert
 
-    def get_history(self, slot: str) -> pd.DataFrame:
+    def get_history(self, slot: str) -> Iterator[pa.Table]:
         self._check_ctx(True)
-        return self._db.execute(
-            sqlq.SELECT_ACCOUNT_HIST.format(
-                address=self._ctx.address,
-                episode=self._ctx.episode,
-                # timestamp=self._ctx.timestamp,
-            )
+        self.flush()
+        return keyset_pages(
+            self._db.execute,
+            sqlq.SELECT_ACCOUNT_HIST_PAGE,
+            sqlq.SELECT_ACCOUNT_HIST_AFTER,
+            [self._ctx.episode, self._ctx.address],
+            sqlq.ACCOUNT_HISTORY_KEYS,
         )
 
 
 class StorageDB(StateDB):
-    def __init__(self, db: BaseDB) -> None:
-        super().__init__(db)
+    def __init__(self, db: BaseDB, batch: StepBatch | None = None) -> None:
+        super().__init__(db, batch)
 
     @property
     def init_queries(self) -> List[str]:
         return [sqlq.CREATE_STORAGE]
 
     def _get_type(self, value: Any):
-        match value:
-            case str() | bytes():
-                return "String"
-            case int() | float() | Decimal():
-                return "Numeric"
-            case bool():
-                return "BOOLEAN"
-            case dict():
-                return "STRUCT"
-            case None:
-                return "NULL"
-
-    def set_value(self, slot, value: Any) -> None:
-        self._check_ctx(True)
-        self._db.execute(
-            sqlq.INSERT_STORAGE.format(
-                address=self._ctx.address,
-                episode=self._ctx.episode,
-                slot=slot,
-                value=value,
-                vtype=self._get_type(value),
-                timestamp=self._ctx.timestamp,
-            ),
-        )
+        return value_type(value)
 
     def get_value(self, slot: str) -> float:
         self._check_ctx(True)
-
-        store_arr = (
-            self._db.execute(
-                sqlq.GET_STORAGE_ONE.format(
-                    address=self._ctx.address,
-                    episode=self._ctx.episode,
-                    timestamp=self._ctx.timestamp,
-                )
-            ),
+        self.flush()
+        store_arr = self._db.execute(
+            sqlq.GET_STORAGE_ONE,
+            [self._ctx.episode, self._ctx.address, slot, self._ctx.timestamp],
         )
-        print(store_arr)
-        _resp = store_arr[0].as_py() if store_arr else None
+        return typed_values(store_arr)[0] if store_arr.num_rows else None
 
-        return _resp
-
-    def get_history(self, slot: str) -> pd.DataFrame:
+    def get_history(self, slot: str) -> Iterator[pa.Table]:
         self._check_ctx(True)
-        return self._db.execute(
-            sqlq.GET_STORAGE_HISTORY.format(
-                address=self._ctx.address,
-                episode=self._ctx.episode,
-            )
+        self.flush()
+        pages = keyset_pages(
+            self._db.execute,
+            sqlq.GET_STORAGE_HISTORY,
+            sqlq.GET_STORAGE_HISTORY_AFTER,
+            [self._ctx.episode, self._ctx.address],
+            sqlq.STORAGE_HISTORY_KEYS,
         )
+        return (decode_values(page.drop(["id"])) for page in pages)
 
     def __setattr__(self, slot: str, _value: Any) -> None:
         return super().__setattr__(slot, _value)
@@ -204,7 +174,7 @@ class DuckDB(BaseDB):
         return duckdb.connect(path_str)
 
     def run_query(self, query: str) -> pa.Table:
-        return self.conn.execute(query).fetch_arrow_table()
+        return fetch_table(self.conn.execute(query))
 
     def execute(
         self,
@@ -214,11 +184,13 @@ class DuckDB(BaseDB):
         *args,
         **kwargs,
     ) -> pa.Table:
-        return self.conn.execute(
-            query,
-            parameters=parameters,
-            multiple_parameter_sets=multiple_parameter_sets,
-        ).fetch_arrow_table()
+        return fetch_table(
+            self.conn.execute(
+                query,
+                parameters=parameters,
+                multiple_parameter_sets=multiple_parameter_sets,
+            )
+        )
 
     def __setstate__(self, d) -> None:
         settings = d.get("settings", {})
@@ -249,8 +221,10 @@ class Storage:
 
     def __post_init__(self) -> None:
         if self.store is None or self.ledger is None:
-            self.store = StorageDB(self.db)
-            self.ledger = LedgerDB(self.db)
+            # Both tables share one batch, appended once per step.
+            batch = DuckStorage(self.db.conn).batch()
+            self.store = StorageDB(self.db, batch)
+            self.ledger = LedgerDB(self.db, batch)
 
     def __setattr__(self, __name: str, __value: Any) -> None:
         super().__setattr__(__name, __value)
@@ -350,7 +324,11 @@ class MockAgent(Agent):
         self.test_calls()
         self.test_calls()
         self.test_calls()
-        log.info(vaex.from_arrow_table(self.storage.store.get_history("blueboy")))
+        log.info(
+            vaex.from_arrow_table(
+                pa.concat_tables(self.storage.store.get_history("blueboy"))
+            )
+        )
 
     def test_calls(self):
         # self.unique_id: str = str(uuid.uuid4().hex)
@@ -416,7 +394,9 @@ class Contract:
     @property
     def history(self):
         print(
-            vaex.from_arrow_table(self.account.storage.store.get_history("principle"))
+            vaex.from_arrow_table(
+                pa.concat_tables(self.account.storage.store.get_history("principle"))
+            )
         )
 
     @property
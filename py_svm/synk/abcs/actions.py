@@ -1,7 +1,7 @@
 # Standard Library
 import abc
 import uuid
-from typing import Any, ClassVar, Dict, List, Set
+from typing import Any, ClassVar, Dict, List, Set, Optional
 from decimal import Decimal
 import datetime
 
@@ -11,11 +11,14 @@ from jinja2 import PackageLoader
 from loguru import logger as log
 from pydantic import BaseModel, Field
 import inflection
+import orjson
 from py_svm.utils import isattr
 
 from py_svm.typings import DictAny
 from py_svm.synk.abcs.engine import BaseResponse, SurrealEngine
 from py_svm.synk.abcs.engine import AbstractEngine
+from py_svm.synk.indexes import conditions
+from py_svm.synk.storage import SearchDB, search_db
 
 jinja_env = Environment(loader=PackageLoader("py_svm", "templates"),
                         trim_blocks=True,
@@ -128,10 +131,31 @@ def strip_query(query: str) -> str:
     return query.replace("\n", " ").strip().strip(',')
 
 
+SURREAL_OPERATORS = {
+    "==": "=",
+    "!=": "!=",
+    ">": ">",
+    ">=": ">=",
+    "<": "<",
+    "<=": "<=",
+    "in": "INSIDE",
+}
+
+
 class DBActions(BaseActions):
+    """Saves and queries the records of a module.
+
+    Modules that set `__searchable__` also keep their saved records in the
+    search tier, where `find`, `find_unique` and `delete_many` are
+    answered. The tier holds every record in memory, so it's opt-in.
+    `__indexes__` declares the secondary indexes of the module's table,
+    mapping a field to `hash` (equality) or `sorted` (ranges too).
+    """
     __filterable_fields__ = [
         'context', 'episode', 'module_name', 'module_type', 'get_name'
     ]
+    __searchable__: ClassVar[bool] = False
+    __indexes__: ClassVar[Dict[str, str]] = {'timestep': 'sorted'}
     # module_name: str
     module_type: str = 'db'
     timestep: int = 0
@@ -167,11 +191,7 @@ class DBActions(BaseActions):
             raise ValueError(
                 "Context is not set: timestep, episode_id, module_name, module_type"
             )
-        input_values = self.input_values(alter)
-        input_values['timestep'] = self.gettime(timestep)
-        input_values['episode'] = self.episode
-        # input_values['module_name'] = self.module_name
-        input_values['module_type'] = self.module_type
+        input_values = self.record_values(alter, timestep)
 
         latest_item = self.template(file_name)
         query = latest_item.render(
@@ -180,6 +200,28 @@ class DBActions(BaseActions):
         query = strip_query(query)
         return query
 
+    def record_values(self,
+                      alter: Dict[str, Any] = {},
+                      timestep: int = -1) -> Dict[str, Any]:
+        """The values of the record `save` writes, context included."""
+        input_values = self.input_values(alter)
+        input_values['timestep'] = self.gettime(timestep)
+        input_values['episode'] = self.episode
+        # input_values['module_name'] = self.module_name
+        input_values['module_type'] = self.module_type
+        return input_values
+
+    def get_value_str(self, value: Any) -> str:
+        if isinstance(value, (list, tuple, set)):
+            return f"[{', '.join(self.get_value_str(item) for item in value)}]"
+        return self.get_input_str({'_': value}).split('=', 1)[1]
+
+    def get_where_str(self, filter: Dict[str, Any]) -> str:
+        """Renders a `find` filter as a SurrealQL condition."""
+        return ' and '.join(
+            f"{field} {SURREAL_OPERATORS[op]} {self.get_value_str(operand)}"
+            for field, op, operand in conditions(filter))
+
     def get_input_str(self, input_vals: dict, join_key: str = ', ') -> str:
         input_list = []
         for key, value in input_vals.items():
@@ -217,6 +259,23 @@ class DBActions(BaseActions):
             exclude_defaults=exclude_defaults,
             exclude_none=exclude_none)
 
+    @property
+    def search(self) -> SearchDB:
+        """The search tier, with the indexes of the module declared."""
+        if not self.__searchable__:
+            raise ValueError(
+                f"{type(self).__name__} isn't searchable, set __searchable__")
+        db = search_db()
+        for field, kind in self.__indexes__.items():
+            db.create_index(self.module_name, field, kind)
+        return db
+
+    def search_filter(self, alter: Dict[str, Any] = {}) -> Dict[str, Any]:
+        """Scopes a filter to the episode of the module."""
+        if self.episode is None:
+            return dict(alter)
+        return {'episode': self.episode, **alter}
+
     @property
     def engine(self) -> AbstractEngine:
         global ACTIVE_ENGINE
@@ -242,6 +301,8 @@ class DBActions(BaseActions):
         query: str = self.get_query('save.sur.j2', alter=alter)
         # log.info(query)
         info: 'BaseResponse' = self.engine.execute(query)
+        if self.__searchable__:
+            self.search.insert(self.module_name, self.record_values(alter))
         return info
 
     def latest(self, alter: DictAny = {}):
@@ -292,9 +353,31 @@ class DBActions(BaseActions):
         res = self.engine.execute(query)
         return res
 
-    def save_many(self, data: List[Dict[str, Any]]):
-
-        raise NotImplementedError
+    def save_many(self, data: List[Dict[str, Any]]) -> BaseResponse:
+        """Inserts every record in `data` alongside context using one query."""
+        if not self.check():
+            raise ValueError(
+                "Context is not set: timestep, episode_id, module_name, module_type"
+            )
+        context = {
+            'timestep': self.timestep,
+            'episode': self.episode,
+            'module_type': self.module_type
+        }
+        records = [{**record, **context} for record in data]
+        template = self.template('save_many.sur.j2')
+        query = strip_query(
+            template.render(module_name=self.module_name,
+                            module_records=orjson.dumps(
+                                records,
+                                default=str,
+                                option=orjson.OPT_SERIALIZE_NUMPY).decode()))
+        res = self.engine.execute(query)
+        if self.__searchable__:
+            search = self.search
+            for record in records:
+                search.insert(self.module_name, record)
+        return res
 
     def count(self, alter: Dict[str, Any] = {}) -> int:
         """Gets the total number of records given a query."""
@@ -317,23 +400,19 @@ class DBActions(BaseActions):
 
         return 0
 
-    def find(self, alter: Dict[str, Any] = {}) -> bool:
-        input_values = self.input_values(alter)
-        template = self.template('find.sur.j2')
-        module_name = input_values.pop('module_type')
-        query_str = strip_query(
-            template.render(module_name=module_name, timestep=3))
-        res = self.engine.execute(query_str)
-        return False
+    def find(self, alter: Dict[str, Any] = {}) -> List[DictAny]:
+        """Gets the saved records of the episode that match `alter`.
 
-    def find_unique(self, alter: Dict[str, Any] = {}) -> bool:
-        input_values = self.input_values(alter)
-        template = self.template('find_unique.sur.j2')
-        module_name = input_values.pop('module_type')
-        query_str = strip_query(
-            template.render(module_name=module_name, timestep=3))
-        res = self.engine.execute(query_str)
-        return False
+        `alter` maps fields to a value, or to operators (`==`, `!=`, `>`,
+        `>=`, `<`, `<=`, `in`) and their operands, e.g.
+        `{'timestep': {'>=': 3, '<': 10}}`.
+        """
+        return self.search.find(self.module_name, self.search_filter(alter))
+
+    def find_unique(self, alter: Dict[str, Any] = {}) -> Optional[DictAny]:
+        """Gets the only saved record of the episode that matches `alter`."""
+        return self.search.find_unique(self.module_name,
+                                       self.search_filter(alter))
 
     def delete_one(self, alter: Dict[str, Any] = {}) -> bool:
         input_values = self.input_values(alter)
@@ -344,14 +423,19 @@ class DBActions(BaseActions):
         res = self.engine.execute(query_str)
         return False
 
-    def delete_many(self, alter: Dict[str, Any] = {}) -> bool:
-        input_values = self.input_values(alter)
+    def delete_many(self, alter: Dict[str, Any] = {}) -> int:
+        """Deletes the saved records of the episode that match `alter` and
+        returns how many were deleted from the search tier."""
+        search_filter = self.search_filter(alter)
+        deleted = 0
+        if self.__searchable__:
+            deleted = self.search.delete_many(self.module_name, search_filter)
         template = self.template('delete_many.sur.j2')
-        module_name = input_values.pop('module_type')
         query_str = strip_query(
-            template.render(module_name=module_name, timestep=3))
-        res = self.engine.execute(query_str)
-        return False
+            template.render(module_name=self.module_name,
+                            where_by=self.get_where_str(search_filter)))
+        self.engine.execute(query_str)
+        return deleted
 
     def refresh(self):
         raise NotImplementedError
@@ -1,20 +1,36 @@
 from typing import ClassVar, Optional
+
+from pydantic import PrivateAttr
+
 from ..module import Module
-from py_svm.utils import get_uuid
+from py_svm.typings import DictAny
+from py_svm.synk.ids import allocator
 
 
 class Entity(Module):
     module_type: str = "entity"
 
+    _entity_id: Optional[int] = PrivateAttr(None)
+
     @property
-    def entity_id(self):
-        """The foo property."""
-        return get_uuid()
+    def entity_id(self) -> int:
+        """The simulation wide integer id of the entity."""
+        if self._entity_id is None:
+            self._entity_id = allocator().allocate()
+        return self._entity_id
+
+    @property
+    def entity_uuid(self) -> str:
+        """The uuid of the entity, for use outside of the simulation."""
+        return allocator().uuid(self.entity_id)
+
+    def input_values(self, updates: DictAny = {}) -> DictAny:
+        return {'entity_id': self.entity_id, **super().input_values(updates)}
 
 
 class Agent(Entity):
     module_type: str = "agent"
 
     @property
-    def agent_id(self):
-        return super().entity_id
\ No newline at end of file
+    def agent_id(self) -> int:
+        return super().entity_id
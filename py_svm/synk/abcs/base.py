@@ -109,6 +109,17 @@ class InitContext(ModelMetaclass):
             key: pydantic_kwargs.pop(key)
             for key in pydantic_kwargs.keys() & allowed_config_kwargs
         }
+        # Every module class gets its own copy of the hook tables of its
+        # parent. Sharing the ones of `ModuleBase` would run the hooks of the
+        # environment on the step of every agent driven by a scheduler, while
+        # copying keeps the hooks a subclass inherits.
+        for hook_name in ('_step_hooks', '_step_pre_hooks', '_forward_hooks',
+                          '_forward_pre_hooks'):
+            if hook_name not in dict_used:
+                parent_hooks = next((getattr(base, hook_name)
+                                     for base in bases
+                                     if hasattr(base, hook_name)), {})
+                dict_used[hook_name] = collections.OrderedDict(parent_hooks)
         if 'step' in dict_used:
             if callable(dict_used['step']):
                 dict_used['step'] = step_wrapper(dict_used['step'])
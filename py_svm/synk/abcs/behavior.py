@@ -1,11 +1,48 @@
-from typing import ClassVar, Optional
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from pydantic import PrivateAttr
+
 from ..module import Module
-from py_svm.utils import get_uuid
+from py_svm.synk.ids import allocator
+
+if TYPE_CHECKING:
+    from .population import AgentPopulation, AgentRow
 
 
 class Behavior(Module):
     module_type: str = "behavior"
 
+    _behavior_id: Optional[int] = PrivateAttr(None)
+
     @property
-    def behavior_id(self):
-        return get_uuid()
+    def behavior_id(self) -> int:
+        if self._behavior_id is None:
+            self._behavior_id = allocator().allocate()
+        return self._behavior_id
+
+    def is_batched(self) -> bool:
+        """Whether the behavior declares its own batched `apply`."""
+        return type(self).apply is not Behavior.apply
+
+    def apply(self, population: "AgentPopulation", mask: np.ndarray) -> None:
+        """Runs the behavior once over every agent of `population` in `mask`.
+
+        Override this to read and write the population's columns with
+        vectorized code. The default falls back to calling `act` on every
+        selected agent.
+
+        Parameters
+        ----------
+        population : `AgentPopulation`
+            The population the agents belong to.
+        mask : `np.ndarray`
+            A boolean mask over the rows of the population.
+        """
+        for agent in population.rows(mask):
+            self.act(agent)
+
+    def act(self, agent: "AgentRow") -> None:
+        """Runs the behavior on a single agent."""
+        raise NotImplementedError(
+            f"{type(self).__name__} must implement either apply() or act()")
@@ -1,10 +1,7 @@
 from collections import UserDict
 # Standard Library
-from typing import (Any, Dict)
+from typing import (Any, Dict, Tuple, Optional)
 # from py_svm.synk.abc import DatabaseAPI
-from contextvars import Context
-from contextvars import ContextVar
-from contextvars import copy_context
 
 from eth_utils import ValidationError  # type: ignore
 from eth_utils.toolz import nth  # type: ignore
@@ -18,14 +15,80 @@ from py_svm.utils import dataclass_transform
 import pyrsistent
 
 
+_UNSET = object()
+
+# The context keys every module has. Anything else goes into the overflow map.
+CONTEXT_SLOTS: Tuple[str, ...] = ("episode", "timestep", "module_id",
+                                  "module_type", "is_entry", "is_episode")
+_SLOT_INDEX: Dict[str, int] = {key: i for i, key in enumerate(CONTEXT_SLOTS)}
+
+
+class ContextSnapshot:
+    """An immutable view of a `ContextControl` at one point in time.
+
+    Snapshots share the overflow map with the context (and with each other)
+    until one side writes to it, so taking one costs a tuple of the slots.
+    """
+
+    __slots__ = ("_values", "_extra", "_model")
+
+    def __init__(self, values: Tuple[Any, ...], extra: pyrsistent.PMap):
+        object.__setattr__(self, "_values", values)
+        object.__setattr__(self, "_extra", extra)
+        object.__setattr__(self, "_model", None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Context snapshots are immutable")
+
+    def get(self, key, default=None):
+        index = _SLOT_INDEX.get(key)
+        if index is None:
+            return self._extra.get(key, default)
+        value = self._values[index]
+        return default if value is _UNSET else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _UNSET) is not _UNSET
+
+    def flattened(self) -> Dict[str, Any]:
+        flat = {
+            key: value
+            for key, value in zip(CONTEXT_SLOTS, self._values)
+            if value is not _UNSET
+        }
+        flat.update(self._extra)
+        return flat
+
+    def as_model(self) -> Metadata:
+        if self._model is None:
+            object.__setattr__(self, "_model", Metadata(**self.flattened()))
+        return self._model
+
+
 class ContextControl:
+    """The context of a module instance (episode, timestep, module id...).
+
+    The well known keys of `CONTEXT_SLOTS` live in fixed slots and every
+    other key in an overflow map, so `get` and `set` are O(1) and only ever
+    see this object's values. `snapshot` hands out immutable copies that
+    share structure, and `as_model` is cached until the next write.
+    """
+
+    __slots__ = ("_values", "_extra", "_snapshot")
 
     def __init__(self):
         self.reset()
 
     def reset(self):
-        self._ctx_vars = {}
-        self.cxt = Context()
+        self._values = [_UNSET] * len(CONTEXT_SLOTS)
+        self._extra: pyrsistent.PMap = pyrsistent.pmap()
+        self._snapshot: Optional[ContextSnapshot] = None
 
     def __getstate__(self):
         return pyrsistent.freeze(self.flattened())
@@ -35,26 +98,50 @@ class ContextControl:
         for key, value in state.items():
             self.set(key, value)
 
-    def copy(self) -> Context:
-        return copy_context()
+    def snapshot(self) -> ContextSnapshot:
+        """Gets an immutable copy of the context."""
+        if self._snapshot is None:
+            self._snapshot = ContextSnapshot(tuple(self._values), self._extra)
+        return self._snapshot
+
+    def copy(self) -> ContextSnapshot:
+        return self.snapshot()
 
     def flattened(self):
-        #  if not isinstance(v, ContextVar)
-        return {k.name: v for k, v in self.copy().items()}
+        return self.snapshot().flattened()
 
     def set(self, key, value):
-        self._ctx_vars[key] = ContextVar(key).set(value)
+        index = _SLOT_INDEX.get(key)
+        if index is None:
+            self._extra = self._extra.set(key, value)
+        else:
+            self._values[index] = value
+        self._snapshot = None
+
+    def update(self, **values):
+        for key, value in values.items():
+            self.set(key, value)
+
+    def get(self, key, default=None):
+        index = _SLOT_INDEX.get(key)
+        if index is None:
+            return self._extra.get(key, default)
+        value = self._values[index]
+        return default if value is _UNSET else value
 
-    def get(self, key):
-        if key in self._ctx_vars:
-            return self._ctx_vars[key].get()
+    def __contains__(self, key) -> bool:
+        return self.get(key, _UNSET) is not _UNSET
 
     def delete(self, key):
-        if key in self._ctx_vars:
-            self._ctx_vars[key].reset()
+        index = _SLOT_INDEX.get(key)
+        if index is None:
+            self._extra = self._extra.discard(key)
+        else:
+            self._values[index] = _UNSET
+        self._snapshot = None
 
     def as_model(self) -> Metadata:
-        return Metadata(**self.flattened())
+        return self.snapshot().as_model()
 
     def log_context(self):
         meta = self.as_model()
@@ -1,9 +1,7 @@
 """This file contains the general abstract methods that will be used for all"""
 
 import abc
-import uuid
 from typing import Any, List, cast
-from py_svm.utils import get_uuid
 import pyarrow as pa
 from pydantic import BaseModel, Field, validator
 from py_svm.synk.abcs.base import ModuleBase
@@ -11,9 +9,11 @@ from py_svm.synk.abcs.base import ModuleBase
 
 class Equipment(BaseModel, abc.ABC):
     name: str | None = None
-    episode: uuid.UUID = Field(default_factory=get_uuid)
-    source: uuid.UUID | None = None
-    target: uuid.UUID | None = None
+    # Left unset, the episode of the environment is kept.
+    episode: str | None = None
+    # Entity ids handed out by `py_svm.synk.ids`.
+    source: int | None = None
+    target: int | None = None
     timestep: int | None = None
 
 
@@ -0,0 +1,269 @@
+"""Messages between agents, delivered once per step.
+
+Sends only append to columnar NumPy buffers of `(sender, recipient, type,
+payload, value)`; no message is ever a Python object. At the step barrier
+`deliver` sorts the buffered messages by recipient once, after which the
+inbox of an agent is a slice of the delivered columns. Message types are
+named, like signals, and stored as small integer codes.
+"""
+from typing import Any, Dict, List, Tuple, Union, Iterable, NamedTuple, Optional
+
+import numpy as np
+from pydantic import PrivateAttr
+
+from .resource import Resource
+
+NO_PAYLOAD = -1
+COLUMNS = {
+    "senders": np.int64,
+    "recipients": np.int64,
+    "types": np.int32,
+    "payloads": np.int64,
+    "values": np.float64,
+}
+
+
+class Messages(NamedTuple):
+    """Columns of messages, as views into the delivered buffers."""
+    senders: np.ndarray
+    types: np.ndarray
+    payloads: np.ndarray
+    values: np.ndarray
+
+    def __len__(self) -> int:  # type: ignore[override]
+        return len(self.senders)
+
+    def of_type(self, code: int) -> "Messages":
+        mask = self.types == code
+        return Messages(*(column[mask] for column in self))
+
+
+def _empty(capacity: int) -> Dict[str, np.ndarray]:
+    return {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+class Mailbox(Resource):
+    """Buffers the messages sent during a step and delivers them at its end.
+
+    Messages sent during a step are only readable after `deliver` (or
+    `step`), so every agent reads the same inboxes whatever the activation
+    order. A message carries an integer `payload` (an id, a row, or a ref
+    from `attach`) and a float `value`.
+
+    Attributes
+    ----------
+    steps : int
+        The number of deliveries so far.
+    capacity : int
+        The number of messages the send buffers start with; they double
+        when full.
+    """
+    steps: int = 0
+    capacity: int = 1024
+
+    _types: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _staged: Dict[str, np.ndarray] = PrivateAttr(None)
+    _size: int = PrivateAttr(0)
+    _attached: List[Any] = PrivateAttr(default_factory=list)
+    # What the last `deliver` delivered, sorted by recipient.
+    _delivered: Dict[str, np.ndarray] = PrivateAttr(None)
+    _inbox_ids: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(0, dtype=np.int64))
+    _inbox_starts: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(1, dtype=np.int64))
+    _objects: List[Any] = PrivateAttr(default_factory=list)
+
+    def __post_init__(self, *args, **kwargs) -> None:
+        self._staged = _empty(max(self.capacity, 1))
+        self._delivered = _empty(0)
+
+    def message_type(self, name: str) -> int:
+        """Gets the code of a named message type, registering it if new."""
+        return self._types.setdefault(name, len(self._types))
+
+    def type_name(self, code: int) -> str:
+        for name, value in self._types.items():
+            if value == code:
+                return name
+        raise KeyError(f"No message type has the code {code}")
+
+    def _code(self, kind: Union[str, int, Iterable]) -> Any:
+        if isinstance(kind, str):
+            return self.message_type(kind)
+        kinds = np.asarray(kind)
+        if kinds.dtype.kind in "USO":
+            # Named kinds, possibly mixed with codes, are mapped one by one.
+            return np.vectorize(self._code, otypes=[np.int32])(kinds)
+        return kind
+
+    # -- sending ----------------------------------------------------------
+
+    @property
+    def pending(self) -> int:
+        """The number of messages sent since the last delivery."""
+        return self._size
+
+    def _reserve(self, count: int) -> int:
+        start = self._size
+        needed = start + count
+        capacity = len(self._staged["senders"])
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            grown = _empty(capacity)
+            for name, column in self._staged.items():
+                grown[name][:start] = column[:start]
+            self._staged = grown
+        self._size = needed
+        return start
+
+    def send(self,
+             sender: int,
+             recipient: int,
+             kind: Union[str, int] = 0,
+             payload: int = NO_PAYLOAD,
+             value: float = np.nan) -> None:
+        """Sends one message; it's delivered at the next `deliver`."""
+        row = self._reserve(1)
+        staged = self._staged
+        staged["senders"][row] = sender
+        staged["recipients"][row] = recipient
+        staged["types"][row] = self._code(kind)
+        staged["payloads"][row] = payload
+        staged["values"][row] = value
+
+    def send_many(self,
+                  senders: Any,
+                  recipients: Any,
+                  kind: Any = 0,
+                  payloads: Any = NO_PAYLOAD,
+                  values: Any = np.nan) -> None:
+        """Sends a batch of messages. Every argument is an array, or a
+        scalar shared by the whole batch."""
+        columns = np.broadcast_arrays(np.asarray(senders),
+                                      np.asarray(recipients),
+                                      np.asarray(self._code(kind)),
+                                      np.asarray(payloads), np.asarray(values))
+        count = columns[0].size
+        if not count:
+            return
+        start = self._reserve(count)
+        for name, column in zip(COLUMNS, columns):
+            self._staged[name][start:start + count] = column.ravel()
+
+    def broadcast(self,
+                  sender: int,
+                  recipients: Any,
+                  kind: Union[str, int] = 0,
+                  payload: int = NO_PAYLOAD,
+                  value: float = np.nan) -> None:
+        """Sends the same message to many recipients."""
+        self.send_many(sender, recipients, kind, payload, value)
+
+    def attach(self, obj: Any) -> int:
+        """Keeps an object until the end of the next delivery's step and
+        returns the payload ref to send it with."""
+        self._attached.append(obj)
+        return len(self._attached) - 1
+
+    # -- delivery ---------------------------------------------------------
+
+    def deliver(self) -> int:
+        """Delivers the messages sent since the last delivery.
+
+        Messages are grouped by recipient with one stable sort, so each
+        inbox keeps the order its messages were sent in. The previous
+        deliveries are dropped.
+
+        Returns
+        -------
+        int
+            The number of messages delivered.
+        """
+        count = self._size
+        staged = {name: column[:count] for name, column in self._staged.items()}
+        order = np.argsort(staged["recipients"], kind="stable")
+        self._delivered = {name: column[order] for name, column in staged.items()}
+        recipients = self._delivered["recipients"]
+        # The recipients are sorted, so an inbox starts where they change.
+        starts = np.flatnonzero(np.diff(recipients)) + 1
+        starts = np.concatenate([[0] if count else [], starts,
+                                 [count]]).astype(np.int64)
+        self._inbox_ids = recipients[starts[:-1]]
+        self._inbox_starts = starts
+        self._objects, self._attached = self._attached, []
+        self._size = 0
+        self.steps += 1
+        return count
+
+    def step(self) -> None:
+        self.deliver()
+
+    def clear(self) -> None:
+        self._size = 0
+        self._attached = []
+        self._delivered = _empty(0)
+        self._inbox_ids = np.zeros(0, dtype=np.int64)
+        self._inbox_starts = np.zeros(1, dtype=np.int64)
+        self._objects = []
+
+    # -- receiving --------------------------------------------------------
+
+    @property
+    def delivered(self) -> Dict[str, np.ndarray]:
+        """Every delivered column, sorted by recipient."""
+        return self._delivered
+
+    def _bounds(self, recipients: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ids = self._inbox_ids
+        if not len(ids):
+            empty = np.zeros(len(recipients), dtype=np.int64)
+            return empty, empty
+        slots = np.minimum(np.searchsorted(ids, recipients), len(ids) - 1)
+        known = ids[slots] == recipients
+        starts = np.where(known, self._inbox_starts[slots], 0)
+        ends = np.where(known, self._inbox_starts[slots + 1], 0)
+        return starts, ends
+
+    def inbox(self, recipient: int) -> Messages:
+        """The messages delivered to an agent, as views of the columns."""
+        starts, ends = self._bounds(np.asarray([recipient], dtype=np.int64))
+        window = slice(int(starts[0]), int(ends[0]))
+        delivered = self._delivered
+        return Messages(delivered["senders"][window], delivered["types"][window],
+                        delivered["payloads"][window],
+                        delivered["values"][window])
+
+    def counts(self, recipients: Any) -> np.ndarray:
+        """The number of messages delivered to each recipient."""
+        starts, ends = self._bounds(np.atleast_1d(np.asarray(recipients,
+                                                             dtype=np.int64)))
+        return ends - starts
+
+    def inboxes(self, recipients: Any) -> Tuple[Messages, np.ndarray]:
+        """The messages of many recipients with one gather.
+
+        Returns
+        -------
+        messages : `Messages`
+            The messages of every recipient, one recipient after the other.
+        offsets : `np.ndarray`
+            The messages of `recipients[i]` are `[offsets[i]:offsets[i + 1]]`.
+        """
+        starts, ends = self._bounds(np.atleast_1d(np.asarray(recipients,
+                                                             dtype=np.int64)))
+        counts = ends - starts
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        rows = np.repeat(starts - offsets[:-1], counts) + np.arange(
+            offsets[-1], dtype=np.int64)
+        delivered = self._delivered
+        return Messages(delivered["senders"][rows], delivered["types"][rows],
+                        delivered["payloads"][rows],
+                        delivered["values"][rows]), offsets
+
+    def payload(self, ref: int) -> Optional[Any]:
+        """Gets an object attached to a delivered message."""
+        if ref == NO_PAYLOAD:
+            return None
+        return self._objects[ref]
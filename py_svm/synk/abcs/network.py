@@ -0,0 +1,287 @@
+"""The interaction graph of the agents, stored as compressed sparse rows.
+
+Nodes are the dense integer ids of the agents (see `py_svm.synk.ids`), so a
+node is its own row index. The out-edges of node `i` are
+`indices[indptr[i]:indptr[i + 1]]`, sorted, and every neighbour query is an
+array slice or a vectorized gather. Edge inserts and deletes are staged, in
+order, and merged into the arrays in bulk by `commit`, which reads do on
+demand.
+"""
+from typing import Any, List, Tuple, Iterable, Optional
+
+import networkx as nx
+import numpy as np
+from pydantic import PrivateAttr
+
+from .resource import Resource
+
+
+def _ids(values: Any) -> np.ndarray:
+    return np.atleast_1d(np.asarray(values, dtype=np.int64))
+
+
+class Network(Resource):
+    """A directed or undirected graph between agents in CSR arrays.
+
+    Attributes
+    ----------
+    directed : bool
+        If edges only go one way. Undirected edges are stored in both rows.
+    num_nodes : int
+        The number of rows, i.e. the highest node id plus one.
+    """
+    directed: bool = False
+    num_nodes: int = 0
+
+    _indptr: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(1, dtype=np.int64))
+    _indices: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(0, dtype=np.int64))
+    _weights: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(0, dtype=np.float64))
+    # Staged `(sources, targets, weights)` operations, in the order they were
+    # staged. Deletes have no weights.
+    _staged: List[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]] = \
+        PrivateAttr(default_factory=list)
+
+    # -- staging --------------------------------------------------------
+
+    def add_edge(self, source: int, target: int, weight: float = 1.0) -> None:
+        self.add_edges([source], [target], [weight])
+
+    def add_edges(self,
+                  sources: Iterable[int],
+                  targets: Iterable[int],
+                  weights: Optional[Iterable[float]] = None) -> None:
+        """Stages edges to insert. An edge that exists gets the new weight."""
+        sources, targets = _ids(sources), _ids(targets)
+        if sources.shape != targets.shape:
+            raise ValueError("Every edge needs a source and a target")
+        if weights is None:
+            weights = np.ones(len(sources), dtype=np.float64)
+        else:
+            weights = np.broadcast_to(
+                np.asarray(weights, dtype=np.float64), sources.shape)
+        self._staged.append((sources, targets, weights))
+
+    def remove_edge(self, source: int, target: int) -> None:
+        self.remove_edges([source], [target])
+
+    def remove_edges(self, sources: Iterable[int],
+                     targets: Iterable[int]) -> None:
+        """Stages edges to delete. A delete only undoes the inserts staged
+        before it; an edge inserted again afterwards is kept."""
+        sources, targets = _ids(sources), _ids(targets)
+        if sources.shape != targets.shape:
+            raise ValueError("Every edge needs a source and a target")
+        self._staged.append((sources, targets, None))
+
+    def add_nodes(self, count: int) -> None:
+        """Grows the graph to at least `count` nodes."""
+        if count > self.num_nodes:
+            self._indptr = np.concatenate([
+                self._indptr,
+                np.full(count - self.num_nodes, self._indptr[-1],
+                        dtype=np.int64)
+            ])
+            self.num_nodes = count
+
+    @property
+    def staged(self) -> int:
+        """The number of staged edge inserts and deletes."""
+        return sum(len(sources) for sources, *_ in self._staged)
+
+    def commit(self) -> None:
+        """Merges the staged inserts and deletes into the CSR arrays, as if
+        they were applied one after the other."""
+        if not self._staged:
+            return
+        sources, targets, weights = self.edges(commit=False)
+        parts = [(sources, targets, weights, True)]
+        for staged_sources, staged_targets, staged_weights in self._staged:
+            added = staged_weights is not None
+            if not added:
+                staged_weights = np.zeros(len(staged_sources))
+            if not self.directed:
+                # Each edge is followed by its mirror, so the last write to
+                # an edge is also the last write to its mirror.
+                staged_sources, staged_targets = (
+                    np.stack([staged_sources, staged_targets], 1).ravel(),
+                    np.stack([staged_targets, staged_sources], 1).ravel())
+                staged_weights = np.repeat(staged_weights, 2)
+            parts.append((staged_sources, staged_targets, staged_weights, added))
+        sources = np.concatenate([part[0] for part in parts])
+        targets = np.concatenate([part[1] for part in parts])
+        weights = np.concatenate([part[2] for part in parts])
+        added = np.concatenate(
+            [np.full(len(part[0]), part[3]) for part in parts])
+        if len(sources) and min(sources.min(), targets.min()) < 0:
+            raise ValueError("Node ids can't be negative")
+        size = max(self.num_nodes,
+                   int(max(sources[added].max(), targets[added].max())) + 1
+                   if added.any() else 0)
+        # Deleting an edge between nodes that don't exist is a no-op.
+        known = added | ((sources < size) & (targets < size))
+        sources, targets, weights, added = (sources[known], targets[known],
+                                            weights[known], added[known])
+
+        keys = sources * size + targets
+        # The last operation on an edge wins.
+        reversed_keys = keys[::-1]
+        _, first = np.unique(reversed_keys, return_index=True)
+        keep = len(reversed_keys) - 1 - first
+        keep = keep[added[keep]]
+        sources, targets, weights = sources[keep], targets[keep], weights[keep]
+        self._staged = []
+
+        # `np.unique` sorted the keys, so the edges are already in row order.
+        counts = np.bincount(sources, minlength=size)
+        self._indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._indptr[1:])
+        self._indices = targets
+        self._weights = weights
+        self.num_nodes = size
+
+    # -- queries --------------------------------------------------------
+
+    @property
+    def indptr(self) -> np.ndarray:
+        self.commit()
+        return self._indptr
+
+    @property
+    def indices(self) -> np.ndarray:
+        self.commit()
+        return self._indices
+
+    @property
+    def weights(self) -> np.ndarray:
+        self.commit()
+        return self._weights
+
+    @property
+    def num_edges(self) -> int:
+        """The number of stored edges; undirected edges count twice."""
+        return len(self.indices)
+
+    def _rows(self, nodes: Any) -> np.ndarray:
+        nodes = _ids(nodes)
+        if len(nodes) and (nodes.min() < 0 or nodes.max() >= self.num_nodes):
+            raise IndexError("Node id out of range of the network")
+        return nodes
+
+    def neighbors(self, node: int) -> np.ndarray:
+        """The out-neighbours of a node, as a view into the CSR arrays."""
+        indptr = self.indptr
+        if not 0 <= node < self.num_nodes:
+            return self._indices[:0]
+        return self._indices[indptr[node]:indptr[node + 1]]
+
+    def edge_weights(self, node: int) -> np.ndarray:
+        """The weights of the out-edges of a node, aligned with `neighbors`."""
+        indptr = self.indptr
+        if not 0 <= node < self.num_nodes:
+            return self._weights[:0]
+        return self._weights[indptr[node]:indptr[node + 1]]
+
+    def neighbors_many(self, nodes: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """The out-neighbours of many nodes with one gather.
+
+        Returns
+        -------
+        neighbors : `np.ndarray`
+            The neighbours of every node, one node after the other.
+        offsets : `np.ndarray`
+            `len(nodes) + 1` offsets; the neighbours of `nodes[i]` are
+            `neighbors[offsets[i]:offsets[i + 1]]`.
+        """
+        indptr = self.indptr
+        nodes = self._rows(nodes)
+        starts, ends = indptr[nodes], indptr[nodes + 1]
+        counts = ends - starts
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # The position of every gathered edge is its row start plus its rank.
+        positions = np.repeat(starts - offsets[:-1], counts) + np.arange(
+            offsets[-1], dtype=np.int64)
+        return self._indices[positions], offsets
+
+    def degree(self, nodes: Optional[Iterable[int]] = None) -> np.ndarray:
+        """The out-degrees of `nodes`, or of every node."""
+        degrees = np.diff(self.indptr)
+        return degrees if nodes is None else degrees[self._rows(nodes)]
+
+    def in_degree(self, nodes: Optional[Iterable[int]] = None) -> np.ndarray:
+        """The in-degrees of `nodes`, or of every node."""
+        degrees = np.bincount(self.indices, minlength=self.num_nodes)
+        return degrees if nodes is None else degrees[self._rows(nodes)]
+
+    def has_edges(self, sources: Iterable[int],
+                  targets: Iterable[int]) -> np.ndarray:
+        """If each `(source, target)` pair is an edge, as a bool array."""
+        indptr, indices = self.indptr, self._indices
+        sources, targets = _ids(sources), _ids(targets)
+        found = np.zeros(len(sources), dtype=bool)
+        valid = ((sources >= 0) & (sources < self.num_nodes) & (targets >= 0) &
+                 (targets < self.num_nodes))
+        if not valid.any() or not len(indices):
+            return found
+        sources, targets = sources[valid], targets[valid]
+        # Each row is sorted, so every pair is a binary search in its own
+        # row, run for all pairs at once: O(log(degree)) steps per lookup.
+        lower, upper = indptr[sources], indptr[sources + 1]
+        while True:
+            searching = lower < upper
+            if not searching.any():
+                break
+            middle = (lower + upper) // 2
+            below = indices[np.minimum(middle, len(indices) - 1)] < targets
+            lower = np.where(searching & below, middle + 1, lower)
+            upper = np.where(searching & ~below, middle, upper)
+        hit = lower < indptr[sources + 1]
+        hit[hit] = indices[lower[hit]] == targets[hit]
+        found[valid] = hit
+        return found
+
+    def has_edge(self, source: int, target: int) -> bool:
+        return bool(self.has_edges([source], [target])[0])
+
+    def edges(self, commit: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Every stored edge as `(sources, targets, weights)` arrays."""
+        if commit:
+            self.commit()
+        sources = np.repeat(np.arange(self.num_nodes, dtype=np.int64),
+                            np.diff(self._indptr))
+        return sources, self._indices, self._weights
+
+    def clear(self) -> None:
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._weights = np.zeros(0, dtype=np.float64)
+        self._staged = []
+        self.num_nodes = 0
+
+    # -- networkx ---------------------------------------------------------
+
+    def to_networkx(self) -> nx.Graph:
+        """Copies the graph into networkx, for analysis only."""
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        graph.add_nodes_from(range(self.num_nodes))
+        sources, targets, weights = self.edges()
+        graph.add_weighted_edges_from(
+            zip(sources.tolist(), targets.tolist(), weights.tolist()))
+        return graph
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph, weight: str = "weight",
+                      **kwargs) -> "Network":
+        """Builds a network from a networkx graph whose nodes are agent ids."""
+        network = cls(directed=graph.is_directed(), **kwargs)
+        if graph.number_of_nodes():
+            network.add_nodes(max(graph.nodes) + 1)
+        edges = list(graph.edges(data=weight, default=1.0))
+        if edges:
+            sources, targets, weights = zip(*edges)
+            network.add_edges(sources, targets, weights)
+        network.commit()
+        return network
@@ -0,0 +1,368 @@
+"""Struct-of-arrays storage for large sets of agents of the same class.
+
+An `AgentPopulation` keeps every pydantic field of an agent class as a NumPy
+column instead of building one pydantic model per agent. Vectorized code
+reads and writes the columns directly, while `AgentRow` views give per-agent
+code something that looks like the agent.
+"""
+import math
+from typing import Any, Dict, List, Type, Tuple, Iterator, Optional
+
+import inflection
+import numpy as np
+import pyarrow as pa
+from pydantic import PrivateAttr
+from pydantic.fields import ModelField, SHAPE_SINGLETON
+
+from py_svm.typings import DictAny
+from py_svm.synk.abcs.engine import BaseResponse
+from .agent import Agent
+from .behavior import Behavior
+from ..ids import allocator
+from ..module import Module
+
+
+def column_dtype(field: ModelField) -> np.dtype:
+    """Gets the NumPy dtype used to store a pydantic field as a column."""
+    if field.shape != SHAPE_SINGLETON:
+        return np.dtype(object)
+    if field.type_ is bool and not field.allow_none:
+        return np.dtype(np.bool_)
+    if field.type_ is int and not field.allow_none:
+        return np.dtype(np.int64)
+    if field.type_ is float:
+        # Missing floats are stored as NaN.
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+class AgentRow:
+    """A lightweight view over a single agent of an `AgentPopulation`.
+
+    Reading or writing a field goes straight to the population's columns.
+    Methods and properties of the agent class are bound to the view, so
+    per-agent code written against the agent class keeps working.
+    """
+
+    __slots__ = ("_population", "row")
+
+    def __init__(self, population: "AgentPopulation", row: int) -> None:
+        object.__setattr__(self, "_population", population)
+        object.__setattr__(self, "row", row)
+
+    @property
+    def agent_id(self) -> int:
+        return self.entity_id
+
+    @property
+    def entity_id(self) -> int:
+        return int(self._population._ids[self.row])
+
+    def __getattr__(self, name: str) -> Any:
+        population = object.__getattribute__(self, "_population")
+        columns = population._columns
+        if name in columns:
+            value = columns[name][self.row]
+            return value.item() if isinstance(value, np.generic) else value
+        agent_class = population.agent_class
+        for klass in agent_class.__mro__:
+            if name in klass.__dict__:
+                attr = klass.__dict__[name]
+                if hasattr(attr, "__get__"):
+                    return attr.__get__(self, agent_class)
+                return attr
+        raise AttributeError(
+            f"'{agent_class.__name__}' row has no attribute '{name}'")
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        columns = self._population._columns
+        if name not in columns:
+            raise AttributeError(
+                f"'{self._population.agent_class.__name__}' has no field '{name}'"
+            )
+        columns[name][self.row] = value
+
+    def dict(self) -> DictAny:
+        return {name: getattr(self, name) for name in self._population.fields}
+
+    def to_agent(self) -> Agent:
+        """Builds a full pydantic agent from the row."""
+        return self._population.agent_class(**self.dict())
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{k}={v!r}" for k, v in self.dict().items())
+        return f"{self._population.agent_class.__name__}[{self.row}]({values})"
+
+
+class AgentPopulation(Module):
+    """Stores the fields of many agents of one class as columns.
+
+    Only the fields declared on top of `Agent` become columns. Rows are
+    never reused: removing an agent clears its bit in `alive`, so row ids
+    stay valid for the whole run and can be used to index every column.
+    Every row also gets an entity id from the simulation's allocator. Ids
+    grow with the rows, so `rows_of` finds rows with a binary search.
+
+    Values written through the population aren't validated by pydantic.
+
+    Behaviors are attached to rows instead of agents. Every row keeps a
+    bitset of its behaviors, so a population supports up to 64 of them.
+    On `step`, rows are grouped by behavior set and each group is handed to
+    its behaviors once, which lets batched behaviors run as a handful of
+    NumPy kernels instead of one Python call per agent.
+
+    Attributes
+    ----------
+    agent_class : type of `Agent`
+        The agent class whose fields are stored.
+    capacity : int
+        The number of rows allocated up front. The columns double in size
+        when they run out of rows.
+    """
+    module_type: str = "population"
+    agent_class: Type[Agent]
+    capacity: int = 1024
+
+    _columns: Dict[str, np.ndarray] = PrivateAttr(default_factory=dict)
+    _alive: np.ndarray = PrivateAttr(None)
+    _ids: np.ndarray = PrivateAttr(None)
+    _size: int = PrivateAttr(0)
+    _behaviors: List[Behavior] = PrivateAttr(default_factory=list)
+    _behavior_bits: np.ndarray = PrivateAttr(None)
+    _groups: Optional[List[Tuple[Tuple[Behavior, ...], np.ndarray]]] = \
+        PrivateAttr(None)
+
+    def __post_init__(self, *args, **kwds) -> None:
+        capacity = max(self.capacity, 1)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._behavior_bits = np.zeros(capacity, dtype=np.uint64)
+        for name, field in self.agent_fields().items():
+            self._columns[name] = np.empty(capacity, dtype=column_dtype(field))
+
+    def agent_fields(self) -> Dict[str, ModelField]:
+        base_fields = Agent.__fields__
+        return {
+            name: field
+            for name, field in self.agent_class.__fields__.items()
+            if name not in base_fields
+        }
+
+    @property
+    def module_name(self) -> str:
+        return inflection.tableize(self.agent_class.__name__)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def size(self) -> int:
+        """The number of rows used so far, dead rows included."""
+        return self._size
+
+    @property
+    def alive(self) -> np.ndarray:
+        """A boolean mask of the rows that hold a living agent."""
+        return self._alive[:self._size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        """The entity id of every row."""
+        return self._ids[:self._size]
+
+    def rows_of(self, entity_ids: Any) -> np.ndarray:
+        """Gets the rows of `entity_ids`, raising a `KeyError` for unknown ids."""
+        entity_ids = np.atleast_1d(np.asarray(entity_ids, dtype=np.int64))
+        ids = self.ids
+        rows = np.searchsorted(ids, entity_ids)
+        found = rows < len(ids)
+        found[found] = ids[rows[found]] == entity_ids[found]
+        if not found.all():
+            raise KeyError(f"Unknown entity ids: {entity_ids[~found]}")
+        return rows
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.alive))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.column(name)
+
+    def column(self, name: str) -> np.ndarray:
+        """Gets a writable view of the column of a field, one value per row."""
+        return self._columns[name][:self._size]
+
+    def nbytes(self) -> int:
+        """The number of bytes held by the columns and the alive mask."""
+        return self._alive.nbytes + self._ids.nbytes + sum(
+            column.nbytes for column in self._columns.values())
+
+    def _reserve(self, rows: int) -> None:
+        capacity = len(self._alive)
+        if self._size + rows <= capacity:
+            return
+        while capacity < self._size + rows:
+            capacity *= 2
+        self._alive = np.resize(self._alive, capacity)
+        self._alive[self._size:] = False
+        self._ids = np.resize(self._ids, capacity)
+        self._behavior_bits = np.resize(self._behavior_bits, capacity)
+        self._behavior_bits[self._size:] = 0
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def add(self, count: int = 1, **values: Any) -> np.ndarray:
+        """Adds `count` agents and returns their rows.
+
+        Parameters
+        ----------
+        count : int, default 1
+            The number of agents to add.
+        values :
+            A scalar or an array of `count` values per field. Fields that
+            aren't given use the default of the agent class.
+
+        Returns
+        -------
+        `np.ndarray`
+            The rows of the new agents.
+        """
+        unknown = values.keys() - self._columns.keys()
+        if unknown:
+            raise KeyError(f"Unknown fields for {self.agent_class.__name__}: "
+                           f"{sorted(unknown)}")
+        fields = self.agent_fields()
+        self._reserve(count)
+        start, stop = self._size, self._size + count
+        for name, column in self._columns.items():
+            if name in values:
+                value = values[name]
+            else:
+                field = fields[name]
+                if field.required:
+                    raise ValueError(f"Field '{name}' is required")
+                if column.dtype == object:
+                    # A fresh default per row, so that rows never share a
+                    # list or a dict.
+                    for row in range(start, stop):
+                        column[row] = field.get_default()
+                    continue
+                value = field.get_default()
+            if value is None and column.dtype.kind == "f":
+                value = math.nan
+            column[start:stop] = value
+        self._alive[start:stop] = True
+        self._ids[start:stop] = allocator().allocate_many(count)
+        self._behavior_bits[start:stop] = 0
+        self._size = stop
+        self._groups = None
+        return np.arange(start, stop, dtype=np.int64)
+
+    def clear(self) -> None:
+        """Drops every row, e.g. when the episode of the agents ends. Ids
+        keep growing from the current allocator."""
+        self._alive[:self._size] = False
+        self._behavior_bits[:self._size] = 0
+        self._size = 0
+        self._groups = None
+
+    def remove(self, rows: Any) -> None:
+        """Marks the agents of `rows` (row ids or a boolean mask) as dead."""
+        self.alive[rows] = False
+        self._groups = None
+
+    @property
+    def behaviors(self) -> List[Behavior]:
+        return list(self._behaviors)
+
+    def _behavior_bit(self, behavior: Behavior) -> np.uint64:
+        for index, known in enumerate(self._behaviors):
+            if known is behavior:
+                return np.uint64(1 << index)
+        if len(self._behaviors) == 64:
+            raise ValueError("A population supports up to 64 behaviors")
+        self._behaviors.append(behavior)
+        return np.uint64(1 << (len(self._behaviors) - 1))
+
+    def attach(self, behavior: Behavior, rows: Any = None) -> None:
+        """Attaches a behavior to `rows` (ids or a mask), or to every living agent."""
+        bit = self._behavior_bit(behavior)
+        bits = self._behavior_bits[:self._size]
+        if rows is None:
+            rows = self.alive
+        bits[rows] |= bit
+        self._groups = None
+
+    def detach(self, behavior: Behavior, rows: Any = None) -> None:
+        """Detaches a behavior from `rows`, or from every agent."""
+        bit = self._behavior_bit(behavior)
+        bits = self._behavior_bits[:self._size]
+        if rows is None:
+            bits &= ~bit
+        else:
+            bits[rows] &= ~bit
+        self._groups = None
+
+    def behavior_groups(
+            self) -> List[Tuple[Tuple[Behavior, ...], np.ndarray]]:
+        """Groups the living agents by the set of behaviors attached to them.
+
+        Returns
+        -------
+        list of (tuple of `Behavior`, `np.ndarray`)
+            The behaviors of every group, in attach order, with the mask of
+            the rows in the group.
+        """
+        if self._groups is not None:
+            return self._groups
+        bits = np.where(self.alive, self._behavior_bits[:self._size], 0)
+        sets, inverse = np.unique(bits, return_inverse=True)
+        groups = []
+        for index, behavior_set in enumerate(sets.tolist()):
+            if not behavior_set:
+                continue
+            behaviors = tuple(
+                behavior for bit, behavior in enumerate(self._behaviors)
+                if behavior_set >> bit & 1)
+            groups.append((behaviors, inverse == index))
+        self._groups = groups
+        return groups
+
+    def step(self) -> None:
+        """Dispatches every group of agents to its behaviors once."""
+        for behaviors, mask in self.behavior_groups():
+            for behavior in behaviors:
+                behavior.apply(self, mask)
+
+    def row(self, row: int) -> AgentRow:
+        if not 0 <= row < self._size or not self._alive[row]:
+            raise IndexError(f"Row {row} doesn't hold a living agent")
+        return AgentRow(self, row)
+
+    def rows(self, mask: Optional[np.ndarray] = None) -> Iterator[AgentRow]:
+        """Yields a view for every living agent, optionally filtered by `mask`."""
+        selected = self.alive if mask is None else self.alive & mask
+        for row in np.flatnonzero(selected).tolist():
+            yield AgentRow(self, row)
+
+    def to_table(self, mask: Optional[np.ndarray] = None) -> pa.Table:
+        """Gets the living agents (optionally filtered by `mask`) as an Arrow table."""
+        selected = self.alive if mask is None else self.alive & mask
+        rows = np.flatnonzero(selected)
+        data = {"entity_id": pa.array(self._ids[rows]), "row": pa.array(rows)}
+        for name in self._columns:
+            values = self.column(name)[rows]
+            if values.dtype == object:
+                values = values.tolist()
+            data[name] = pa.array(values)
+        return pa.table(data)
+
+    def save(self, alter: DictAny = {}) -> BaseResponse:
+        """Writes every living agent with a single bulk insert."""
+        # `row` is where the agent sits in this process, not agent state.
+        records = self.to_table().drop(["row"]).to_pylist()
+        if alter:
+            records = [{**record, **alter} for record in records]
+        return self.save_many(records)
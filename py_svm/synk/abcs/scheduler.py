@@ -0,0 +1,352 @@
+"""Schedulers that activate agents and entities once per environment step.
+
+The activation styles follow the ones found in Mesa/MASON (sequential, random,
+staged and simultaneous). Agents are kept inside an `AgentBuffer`, a compact
+array-backed buffer, so adding and removing agents while a step is running
+costs O(1) and never invalidates the iteration order of the running step.
+"""
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Iterator, Optional, Sequence
+
+import numpy as np
+from pydantic import PrivateAttr
+
+from .resource import Resource
+
+
+def agent_key(agent: Any) -> int:
+    """The key an agent is stored under inside of an `AgentBuffer`.
+
+    Entities are keyed by their integer entity id, anything else by identity.
+    """
+    entity_id = getattr(agent, "entity_id", None)
+    if isinstance(entity_id, int):
+        return entity_id
+    return id(agent)
+
+
+class AgentBuffer:
+    """A dense buffer of agents with O(1) add and remove.
+
+    Agents are stored in a growable object array. Removing an agent only
+    clears its slot (a tombstone), so iteration orders computed at the start
+    of a step stay valid. The tombstones are compacted away once no step is
+    running and at least half of the buffer is dead.
+
+    Attributes
+    ----------
+    capacity : int
+        The number of slots allocated for the buffer.
+    """
+
+    __slots__ = ("_agents", "_keys", "_alive", "_index", "_size", "_dead",
+                 "_running")
+
+    def __init__(self, capacity: int = 64) -> None:
+        capacity = max(int(capacity), 1)
+        self._agents = np.empty(capacity, dtype=object)
+        self._keys = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._index: Dict[int, int] = {}
+        self._size = 0
+        self._dead = 0
+        self._running = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._agents)
+
+    def __len__(self) -> int:
+        return self._size - self._dead
+
+    def __contains__(self, agent: Any) -> bool:
+        return agent_key(agent) in self._index
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iterate(self.order())
+
+    def _grow(self) -> None:
+        capacity = self.capacity * 2
+        self._agents = np.resize(self._agents, capacity)
+        self._agents[self._size:] = None
+        self._keys = np.resize(self._keys, capacity)
+        self._alive = np.resize(self._alive, capacity)
+        self._alive[self._size:] = False
+
+    def add(self, agent: Any) -> int:
+        """Adds an agent to the end of the buffer and returns its slot."""
+        key = agent_key(agent)
+        if key in self._index:
+            raise KeyError(
+                f"Agent {agent!r} has already been added to the buffer")
+        if self._size == self.capacity:
+            self._grow()
+        slot = self._size
+        self._agents[slot] = agent
+        self._keys[slot] = key
+        self._alive[slot] = True
+        self._index[key] = slot
+        self._size += 1
+        return slot
+
+    def remove(self, agent: Any) -> None:
+        """Removes an agent from the buffer by leaving a tombstone in its slot."""
+        slot = self._index.pop(agent_key(agent))
+        self._agents[slot] = None
+        self._alive[slot] = False
+        self._dead += 1
+        self.maybe_compact()
+
+    def clear(self) -> None:
+        self._agents[:] = None
+        self._alive[:] = False
+        self._index.clear()
+        self._size = 0
+        self._dead = 0
+
+    def maybe_compact(self) -> None:
+        """Compacts the buffer when half of it is dead and no step is running."""
+        if not self._running and self._dead * 2 >= self._size > 0:
+            self.compact()
+
+    def compact(self) -> None:
+        """Moves every living agent to the front of the buffer, preserving order."""
+        if self._running:
+            raise RuntimeError("Can't compact the buffer while a step is running")
+        live = np.flatnonzero(self._alive[:self._size])
+        count = len(live)
+        self._agents[:count] = self._agents[live]
+        self._agents[count:self._size] = None
+        self._keys[:count] = self._keys[live]
+        self._alive[:count] = True
+        self._alive[count:self._size] = False
+        self._index = dict(zip(self._keys[:count].tolist(), range(count)))
+        self._size = count
+        self._dead = 0
+
+    @contextmanager
+    def running(self) -> Iterator["AgentBuffer"]:
+        """Holds off compaction until the block exits.
+
+        Slots captured with `order` stay valid for the whole block, so a
+        step can walk the same slots over several stages.
+        """
+        self._running += 1
+        try:
+            yield self
+        finally:
+            self._running -= 1
+            self.maybe_compact()
+
+    def order(self, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Gets the slots of the living agents.
+
+        Parameters
+        ----------
+        rng : `np.random.Generator`, optional
+            When given, the slots are returned in a random permutation.
+
+        Returns
+        -------
+        `np.ndarray`
+            The slots to activate, in activation order.
+        """
+        slots = np.flatnonzero(self._alive[:self._size])
+        if rng is not None:
+            slots = rng.permutation(slots)
+        return slots
+
+    def iterate(self, slots: np.ndarray) -> Iterator[Any]:
+        """Yields the agents of `slots` that are still alive when reached.
+
+        Agents added while iterating are placed after the slots captured in
+        `slots` and are therefore only activated on the next step.
+        """
+        with self.running():
+            for slot in slots.tolist():
+                # Adds can grow (and so replace) the arrays mid-iteration.
+                if self._alive[slot]:
+                    yield self._agents[slot]
+
+    def agents(self) -> List[Any]:
+        return self._agents[self.order()].tolist()
+
+
+class BaseScheduler(Resource):
+    """Activates agents one at a time, in the order they were added.
+
+    Assumes every added agent has a `step` method that takes no arguments.
+    When `max_workers` is set, the agents of a step (or a stage) are activated
+    on a thread pool instead and the scheduler waits for all of them before
+    moving on. That mode is meant for I/O-bound agents and gives up on the
+    activation order.
+
+    Attributes
+    ----------
+    steps : int
+        The number of steps the scheduler has run.
+    time : float
+        The simulated time of the scheduler.
+    seed : int, optional
+        The seed of the random generator used to shuffle agents.
+    max_workers : int
+        The number of threads agents are activated on. `0` activates agents
+        in the calling thread.
+    """
+    steps: int = 0
+    time: float = 0
+    seed: Optional[int] = None
+    max_workers: int = 0
+
+    _buffer: AgentBuffer = PrivateAttr(default_factory=AgentBuffer)
+    _rng: Optional[np.random.Generator] = PrivateAttr(None)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(None)
+
+    @property
+    def rng(self) -> np.random.Generator:
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.seed)
+        return self._rng
+
+    @property
+    def executor(self) -> Optional[ThreadPoolExecutor]:
+        if self.max_workers > 0 and self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=type(self).__name__)
+        return self._executor
+
+    @property
+    def agents(self) -> List[Any]:
+        return self._buffer.agents()
+
+    def add(self, agent: Any) -> None:
+        """Adds an agent to the schedule.
+
+        Parameters
+        ----------
+        agent : `Agent`
+            The agent to add. It must have a `step` method.
+        """
+        self._buffer.add(agent)
+
+    def remove(self, agent: Any) -> None:
+        """Removes an agent from the schedule. Safe to call during a step."""
+        self._buffer.remove(agent)
+
+    def get_agent_count(self) -> int:
+        """Returns the current number of agents in the queue."""
+        return len(self._buffer)
+
+    def agent_buffer(self, shuffled: bool = False) -> Iterator[Any]:
+        """Yields the agents while letting the user remove and/or add agents
+        during stepping."""
+        slots = self._buffer.order(self.rng if shuffled else None)
+        return self._buffer.iterate(slots)
+
+    def activate(self, method: str = "step", shuffled: bool = False) -> None:
+        """Calls `method` on every agent of the schedule.
+
+        Parameters
+        ----------
+        method : str, default "step"
+            The name of the agent method to call.
+        shuffled : bool, default False
+            If the agents should be activated in a random order.
+        """
+        self._run(self.agent_buffer(shuffled=shuffled), method)
+
+    def _run(self, agents: Iterator[Any], method: str) -> None:
+        executor = self.executor
+        if executor is None:
+            for agent in agents:
+                getattr(agent, method)()
+            return
+        # Consuming the results raises the first exception of the agents.
+        list(executor.map(lambda agent: getattr(agent, method)(),
+                          list(agents)))
+
+    def step(self) -> None:
+        """Executes the step of all the agents, one at a time."""
+        self.activate("step")
+        self.steps += 1
+        self.time += 1
+
+    def reset(self) -> None:
+        self.steps = 0
+        self.time = 0
+        self._rng = None
+
+    def close(self) -> None:
+        """Shuts down the thread pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class RandomActivation(BaseScheduler):
+    """Activates each agent once per step, in random order, with the order
+    reshuffled every step.
+
+    This is equivalent to the NetLogo 'ask agents...' and is generally the
+    default behavior for an ABM.
+    """
+
+    def step(self) -> None:
+        """Executes the step of all agents, one at a time, in random order."""
+        self.activate("step", shuffled=True)
+        self.steps += 1
+        self.time += 1
+
+
+class SimultaneousActivation(BaseScheduler):
+    """Activates all the agents at once.
+
+    Every agent first runs `step` to stage its changes and then runs
+    `advance` to apply them, so that the order of activation doesn't matter.
+    """
+
+    def step(self) -> None:
+        """Steps all agents, then advances them."""
+        with self._buffer.running():
+            self.activate("step")
+            self.activate("advance")
+        self.steps += 1
+        self.time += 1
+
+
+class StagedActivation(BaseScheduler):
+    """Activates the agents in multiple stages per step.
+
+    Every stage is the name of an agent method. All agents run the first
+    stage before any agent runs the second one, and so on.
+
+    Attributes
+    ----------
+    stage_list : list of str
+        The agent methods to run, in order.
+    shuffle : bool
+        If the agents should be shuffled at the start of each step.
+    shuffle_between_stages : bool
+        If the agents should be reshuffled between stages.
+    """
+    stage_list: Sequence[str] = ("step",)
+    shuffle: bool = False
+    shuffle_between_stages: bool = False
+
+    @property
+    def stage_time(self) -> float:
+        return 1 / len(self.stage_list)
+
+    def step(self) -> None:
+        """Executes all the stages for all agents."""
+        # Compacting between stages would move the slots of the step.
+        with self._buffer.running():
+            slots = self._buffer.order(self.rng if self.shuffle else None)
+            for stage in self.stage_list:
+                if self.shuffle_between_stages:
+                    slots = self._buffer.order(self.rng)
+                self._run(self._buffer.iterate(slots), stage)
+                self.time += self.stage_time
+        self.steps += 1
@@ -0,0 +1,430 @@
+"""Continuous spaces and grids that agents are placed in.
+
+Positions live in one `(agents, dims)` NumPy array, keyed by the dense agent
+ids of `py_svm.synk.ids`. A uniform grid hash buckets the agents into cells
+of `cell_size`: the agents are kept sorted by cell, so the agents of a cell
+are a slice, and a radius query only looks at the cells the radius touches.
+That makes a neighbour search cost the number of agents near each query
+instead of the number of agents in the space.
+"""
+import math
+from typing import Any, Tuple, Iterable, Optional
+
+import numpy as np
+from pydantic import PrivateAttr
+
+from .resource import Resource
+
+METRICS = ("euclidean", "chebyshev", "manhattan")
+
+
+def _ids(values: Any) -> np.ndarray:
+    return np.atleast_1d(np.asarray(values, dtype=np.int64))
+
+
+def _gather(starts: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenates the ranges `[start, start + count)` without a loop.
+
+    Returns the positions and, for each position, the range it came from.
+    """
+    total = int(counts.sum())
+    owners = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    positions = np.arange(total, dtype=np.int64) - offsets[owners] + starts[owners]
+    return positions, owners
+
+
+class Space(Resource):
+    """A continuous space with a uniform-grid hash over agent positions.
+
+    Attributes
+    ----------
+    shape : tuple of float
+        The extent of the space along each dimension, starting at 0.
+    cell_size : float
+        The largest side of the cells of the hash; cells shrink slightly so
+        that they tile the space. Queries are fastest when it's close to
+        the usual query radius.
+    chunk_size : int
+        The number of candidate agents a bulk query checks at once, which
+        bounds its memory.
+    torus : bool
+        If the space wraps around at its edges.
+    metric : str
+        How distances are measured: "euclidean", "chebyshev" or "manhattan".
+    """
+    shape: Tuple[float, ...] = (1.0, 1.0)
+    cell_size: float = 0.1
+    torus: bool = False
+    metric: str = "euclidean"
+    chunk_size: int = 1 << 22
+
+    _positions: np.ndarray = PrivateAttr(None)
+    _agent_ids: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(0, dtype=np.int64))
+    # The slot of every agent id, -1 when the agent isn't in the space.
+    _slots: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.full(0, -1, dtype=np.int64))
+    _cells: np.ndarray = PrivateAttr(
+        default_factory=lambda: np.zeros(0, dtype=np.int64))
+    # The hash: the slots sorted by cell, where each cell starts among them,
+    # and copies of the positions and ids in that order, so that a cell's
+    # agents are contiguous in memory.
+    _order: Optional[np.ndarray] = PrivateAttr(None)
+    _cell_starts: Optional[np.ndarray] = PrivateAttr(None)
+    _ranks: Optional[np.ndarray] = PrivateAttr(None)
+    _sorted_positions: Optional[np.ndarray] = PrivateAttr(None)
+    _sorted_ids: Optional[np.ndarray] = PrivateAttr(None)
+
+    def __post_init__(self, *args, **kwargs) -> None:
+        if self.metric not in METRICS:
+            raise ValueError(f"Unknown metric {self.metric}, use one of {METRICS}")
+        self._positions = np.zeros((0, self.dims), dtype=np.float64)
+
+    @property
+    def dims(self) -> int:
+        return len(self.shape)
+
+    @property
+    def grid_shape(self) -> Tuple[int, ...]:
+        """The number of hash cells along each dimension."""
+        return tuple(
+            max(int(math.ceil(extent / self.cell_size)), 1)
+            for extent in self.shape)
+
+    @property
+    def cell_widths(self) -> np.ndarray:
+        """The side of the cells along each dimension."""
+        return np.asarray(self.shape, dtype=np.float64) / self.grid_shape
+
+    def __len__(self) -> int:
+        return len(self._agent_ids)
+
+    @property
+    def agent_ids(self) -> np.ndarray:
+        return self._agent_ids
+
+    @property
+    def positions(self) -> np.ndarray:
+        """The positions of the agents, aligned with `agent_ids`."""
+        return self._positions
+
+    # -- placement --------------------------------------------------------
+
+    def _wrap(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, self.dims)
+        extent = np.asarray(self.shape, dtype=np.float64)
+        if self.torus:
+            return np.mod(positions, extent)
+        if ((positions < 0) | (positions > extent)).any():
+            raise ValueError("Position out of the bounds of the space")
+        return positions
+
+    def _cell_coords(self, positions: np.ndarray) -> np.ndarray:
+        coords = np.floor(positions / self.cell_widths).astype(np.int64)
+        return np.minimum(coords, np.asarray(self.grid_shape) - 1)
+
+    def _cell_keys(self, coords: np.ndarray) -> np.ndarray:
+        return np.ravel_multi_index(tuple(coords.T), self.grid_shape)
+
+    def _lookup(self, agent_ids: np.ndarray) -> np.ndarray:
+        slots = np.full(len(agent_ids), -1, dtype=np.int64)
+        known = (agent_ids >= 0) & (agent_ids < len(self._slots))
+        slots[known] = self._slots[agent_ids[known]]
+        if (slots < 0).any():
+            missing = agent_ids[slots < 0][:5].tolist()
+            raise KeyError(f"Agents {missing} aren't in the space")
+        return slots
+
+    def place(self, agent_ids: Iterable[int], positions: Any) -> None:
+        """Adds agents at positions, or moves them if they're already placed."""
+        agent_ids = _ids(agent_ids)
+        positions = self._wrap(positions)
+        if len(agent_ids) != len(positions):
+            raise ValueError("Every agent needs a position")
+        if len(agent_ids) and agent_ids.min() < 0:
+            raise ValueError("Agent ids can't be negative")
+        if len(agent_ids) and agent_ids.max() >= len(self._slots):
+            grown = np.full(int(agent_ids.max()) + 1, -1, dtype=np.int64)
+            grown[:len(self._slots)] = self._slots
+            self._slots = grown
+        placed = self._slots[agent_ids] >= 0
+        if placed.any():
+            self.move(agent_ids[placed], positions[placed])
+        new_ids = agent_ids[~placed]
+        if not len(new_ids):
+            return
+        if len(np.unique(new_ids)) != len(new_ids):
+            raise ValueError("An agent can only be placed once")
+        start = len(self._agent_ids)
+        self._agent_ids = np.concatenate([self._agent_ids, new_ids])
+        self._positions = np.concatenate([self._positions, positions[~placed]])
+        self._cells = np.concatenate(
+            [self._cells,
+             self._cell_keys(self._cell_coords(positions[~placed]))])
+        self._slots[new_ids] = np.arange(start, len(self._agent_ids))
+        self._order = None
+
+    def move(self, agent_ids: Iterable[int], positions: Any) -> None:
+        """Moves placed agents. Only moves that change cell touch the hash."""
+        slots = self._lookup(_ids(agent_ids))
+        positions = self._wrap(positions)
+        self._positions[slots] = positions
+        cells = self._cell_keys(self._cell_coords(positions))
+        if (self._cells[slots] != cells).any():
+            self._cells[slots] = cells
+            self._order = None
+        elif self._order is not None:
+            self._sorted_positions[:, self._ranks[slots]] = positions.T
+
+    def remove(self, agent_ids: Iterable[int]) -> None:
+        """Takes agents out of the space."""
+        slots = self._lookup(_ids(agent_ids))
+        keep = np.ones(len(self._agent_ids), dtype=bool)
+        keep[slots] = False
+        self._slots[self._agent_ids[slots]] = -1
+        self._agent_ids = self._agent_ids[keep]
+        self._positions = self._positions[keep]
+        self._cells = self._cells[keep]
+        self._slots[self._agent_ids] = np.arange(len(self._agent_ids))
+        self._order = None
+
+    def position(self, agent_ids: Iterable[int]) -> np.ndarray:
+        return self._positions[self._lookup(_ids(agent_ids))]
+
+    def clear(self) -> None:
+        self._positions = np.zeros((0, self.dims), dtype=np.float64)
+        self._agent_ids = np.zeros(0, dtype=np.int64)
+        self._slots = np.full(0, -1, dtype=np.int64)
+        self._cells = np.zeros(0, dtype=np.int64)
+        self._order = None
+
+    # -- the hash ---------------------------------------------------------
+
+    def _index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The slots sorted by cell and where each cell starts among them."""
+        if self._order is None:
+            order = np.argsort(self._cells, kind="stable")
+            cell_count = int(np.prod(self.grid_shape))
+            counts = np.bincount(self._cells, minlength=cell_count)
+            self._cell_starts = np.zeros(cell_count + 1, dtype=np.int64)
+            np.cumsum(counts, out=self._cell_starts[1:])
+            self._ranks = np.empty_like(order)
+            self._ranks[order] = np.arange(len(order))
+            # One contiguous column per dimension.
+            self._sorted_positions = np.ascontiguousarray(
+                self._positions[order].T)
+            self._sorted_ids = self._agent_ids[order]
+            self._order = order
+        return self._order, self._cell_starts
+
+    def _distances(self, origins: np.ndarray, queries: np.ndarray,
+                   ranks: np.ndarray) -> np.ndarray:
+        """The distances between `origins[queries]` and the agents at
+        `ranks` of the hash, a dimension at a time."""
+        total = None
+        for dim, extent in enumerate(self.shape):
+            delta = np.abs(self._sorted_positions[dim][ranks] -
+                           origins[:, dim][queries])
+            if self.torus:
+                np.minimum(delta, extent - delta, out=delta)
+            if self.metric == "euclidean":
+                np.multiply(delta, delta, out=delta)
+            if total is None:
+                total = delta
+            elif self.metric == "chebyshev":
+                np.maximum(total, delta, out=total)
+            else:
+                total += delta
+        if self.metric == "euclidean":
+            np.sqrt(total, out=total)
+        return total
+
+    def _candidate_cells(
+            self, points: np.ndarray, radius: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The cells each point's radius reaches, as `(queries, starts,
+        counts)` of the slices of `_index` they cover."""
+        _, cell_starts = self._index()
+        grid = np.asarray(self.grid_shape, dtype=np.int64)
+        largest = float(radius.max()) if len(radius) else 0.0
+        reach = np.ceil(largest / self.cell_widths).astype(np.int64)
+        # Past the whole grid every cell is a candidate exactly once.
+        if self.torus:
+            reach = np.minimum(reach, grid // 2)
+        else:
+            reach = np.minimum(reach, grid - 1)
+        spans = [np.arange(-r, r + 1, dtype=np.int64) for r in reach]
+        offsets = np.stack(np.meshgrid(*spans, indexing="ij"),
+                           axis=-1).reshape(-1, self.dims)
+        coords = (self._cell_coords(points)[:, None, :] +
+                  offsets[None, :, :]).reshape(-1, self.dims)
+        queries = np.repeat(np.arange(len(points), dtype=np.int64),
+                            len(offsets))
+        if self.torus:
+            coords = np.mod(coords, grid)
+            if (2 * reach + 1 > grid).any():
+                # Even grids wrap the farthest offsets onto the same cell.
+                pairs = np.unique(np.column_stack(
+                    [queries, self._cell_keys(coords)]), axis=0)
+                queries, keys = pairs[:, 0], pairs[:, 1]
+            else:
+                keys = self._cell_keys(coords)
+        else:
+            inside = ((coords >= 0) & (coords < grid)).all(axis=1)
+            queries, keys = queries[inside], self._cell_keys(coords[inside])
+        starts = cell_starts[keys]
+        counts = cell_starts[keys + 1] - starts
+        filled = counts > 0
+        return queries[filled], starts[filled], counts[filled]
+
+    def query_points(self,
+                     points: Any,
+                     radius: Any,
+                     exclude: Optional[Iterable[int]] = None
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Finds the agents within `radius` of many points at once.
+
+        Parameters
+        ----------
+        points : array-like of shape (queries, dims)
+            The centers of the queries.
+        radius : float or array-like of shape (queries,)
+            The radius of every query.
+        exclude : array-like of int, optional
+            An agent id per query to leave out of its result, e.g. itself.
+
+        Returns
+        -------
+        agent_ids : `np.ndarray`
+            The agents found, one query after the other, in no particular
+            order within a query.
+        distances : `np.ndarray`
+            Their distance to the center of their query.
+        offsets : `np.ndarray`
+            The results of query `i` are `[offsets[i]:offsets[i + 1]]`.
+        """
+        points = self._wrap(points)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64),
+                                 (len(points), ))
+        exclude = None if exclude is None else _ids(exclude)
+        self._index()
+        queries, starts, counts = self._candidate_cells(points, radius)
+        # Candidates are checked a chunk of cells at a time.
+        totals = np.cumsum(counts)
+        bounds = np.searchsorted(
+            totals, np.arange(self.chunk_size, int(totals[-1]) if len(totals)
+                              else 0, self.chunk_size), side="right")
+        found_queries, found_ranks, found_distances = [], [], []
+        for cells in np.split(np.arange(len(queries)), bounds):
+            ranks, owners = _gather(starts[cells], counts[cells])
+            chunk_queries = queries[cells][owners]
+            distances = self._distances(points, chunk_queries, ranks)
+            found = distances <= radius[chunk_queries]
+            if exclude is not None:
+                found &= self._sorted_ids[ranks] != exclude[chunk_queries]
+            found_queries.append(chunk_queries[found])
+            found_ranks.append(ranks[found])
+            found_distances.append(distances[found])
+        # The cells are in query order, so the results already are too.
+        queries = np.concatenate(found_queries)
+        offsets = np.zeros(len(points) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(queries, minlength=len(points)), out=offsets[1:])
+        return (self._sorted_ids[np.concatenate(found_ranks)],
+                np.concatenate(found_distances), offsets)
+
+    def neighbors(self,
+                  agent_ids: Iterable[int],
+                  radius: Any,
+                  include_self: bool = False
+                  ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """`query_points` around the positions of placed agents."""
+        agent_ids = _ids(agent_ids)
+        return self.query_points(self.position(agent_ids), radius,
+                                 None if include_self else agent_ids)
+
+    def knn(self,
+            points: Any,
+            k: int,
+            exclude: Optional[Iterable[int]] = None
+            ) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the `k` nearest agents of many points.
+
+        The search radius starts at one cell and doubles, only for the
+        queries that haven't found `k` agents yet.
+
+        Returns
+        -------
+        agent_ids : `np.ndarray` of shape (queries, k)
+            The nearest agents, nearest first, padded with -1.
+        distances : `np.ndarray` of shape (queries, k)
+            Their distances, padded with `inf`.
+        """
+        points = self._wrap(points)
+        count = len(points)
+        result_ids = np.full((count, k), -1, dtype=np.int64)
+        result_distances = np.full((count, k), np.inf)
+        if not count or not k or not len(self):
+            return result_ids, result_distances
+        exclude = None if exclude is None else _ids(exclude)
+        pending = np.arange(count)
+        radius = float(self.cell_widths.min())
+        diameter = float(np.sum(self.shape))
+        while len(pending):
+            found, distances, offsets = self.query_points(
+                points[pending], radius,
+                None if exclude is None else exclude[pending])
+            sizes = np.diff(offsets)
+            done = (sizes >= min(k, len(self) - (exclude is not None))) | (
+                radius >= diameter)
+            # Every result inside the radius is exact, so done queries can
+            # take their k nearest.
+            rows = np.repeat(np.arange(len(pending)), sizes)
+            kept = done[rows]
+            rows, found, distances = rows[kept], found[kept], distances[kept]
+            nearest = np.lexsort((distances, rows))
+            rows, found, distances = rows[nearest], found[nearest], distances[
+                nearest]
+            starts = np.zeros(len(pending) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=len(pending)), out=starts[1:])
+            ranks = np.arange(len(rows)) - starts[rows]
+            take = ranks < k
+            result_ids[pending[rows[take]], ranks[take]] = found[take]
+            result_distances[pending[rows[take]], ranks[take]] = distances[take]
+            pending = pending[~done]
+            radius *= 2
+        return result_ids, result_distances
+
+    def neighbor_count(self, agent_ids: Iterable[int], radius: Any) -> np.ndarray:
+        """The number of other agents within `radius` of each agent."""
+        return np.diff(self.neighbors(agent_ids, radius)[2])
+
+
+class Grid(Space):
+    """A discrete grid of unit cells, like the cellular models of `svm-rs`.
+
+    Agents sit on integer cells. With the default Chebyshev metric a radius
+    of 1 is the Moore neighbourhood; use "manhattan" for von Neumann.
+    """
+    shape: Tuple[float, ...] = (10, 10)
+    cell_size: float = 1.0
+    metric: str = "chebyshev"
+
+    def _wrap(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.floor(super()._wrap(positions))
+        if not self.torus:
+            # The far edge is outside a grid of cells.
+            extent = np.asarray(self.shape, dtype=np.float64)
+            if (positions >= extent).any():
+                raise ValueError("Position out of the bounds of the grid")
+        return positions
+
+    def cell_agents(self, cell: Iterable[int]) -> np.ndarray:
+        """The agents on a cell."""
+        return self.query_points([list(cell)], 0)[0]
+
+    def is_empty(self, cells: Any) -> np.ndarray:
+        """If each cell has no agent on it."""
+        cells = self._wrap(cells)
+        return np.diff(self.query_points(cells, 0)[2]) == 0
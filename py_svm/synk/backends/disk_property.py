@@ -13,9 +13,59 @@
 # limitations under the License.
 
 import sqlite3
-import contextlib
+import threading
 from abc import ABC
-from typing import Optional, List
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Dict, List, Tuple, Iterable, Optional
+
+NodeProperty = Tuple[int, str, str]
+# SQLite's default limit on the number of parameters of a statement.
+MAX_PARAMETERS = 999
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
+
+SAVE_NODE_PROPERTY = (
+    "INSERT INTO node_properties (node_id, property_name, property_value) "
+    "VALUES (?, ?, ?) "
+    "ON CONFLICT(node_id, property_name) "
+    "DO UPDATE SET property_value=excluded.property_value"
+)
+LOAD_NODE_PROPERTY = (
+    "SELECT property_value FROM node_properties "
+    "WHERE node_id = ? AND property_name = ?"
+)
+LOAD_NODE_PROPERTIES = (
+    "SELECT node_id, property_name, property_value FROM node_properties "
+    "WHERE node_id IN ({})"
+)
+DELETE_NODE_PROPERTY = (
+    "DELETE FROM node_properties WHERE node_id = ? AND property_name = ?"
+)
+SAVE_RELATIONSHIP_PROPERTY = (
+    "INSERT INTO relationship_properties "
+    "(relationship_id, property_name, property_value) "
+    "VALUES (?, ?, ?) "
+    "ON CONFLICT(relationship_id, property_name) "
+    "DO UPDATE SET property_value=excluded.property_value"
+)
+LOAD_RELATIONSHIP_PROPERTY = (
+    "SELECT property_value FROM relationship_properties "
+    "WHERE relationship_id = ? AND property_name = ?"
+)
+LOAD_RELATIONSHIP_PROPERTIES = (
+    "SELECT relationship_id, property_name, property_value "
+    "FROM relationship_properties WHERE relationship_id IN ({})"
+)
+DELETE_RELATIONSHIP_PROPERTY = (
+    "DELETE FROM relationship_properties "
+    "WHERE relationship_id = ? AND property_name = ?"
+)
 
 
 class OnDiskPropertyDatabase(ABC):
@@ -57,31 +107,104 @@ class OnDiskPropertyDatabase(ABC):
         """Deletes a node property from an on disk database."""
         pass
 
+    def save_node_properties_many(self, properties: Iterable[NodeProperty]) -> None:
+        """Saves `(node_id, property_name, property_value)` triples at once."""
+        for node_id, property_name, property_value in properties:
+            self.save_node_property(node_id, property_name, property_value)
+
+    def load_node_properties_many(
+        self, node_ids: Iterable[int]
+    ) -> Dict[int, Dict[str, str]]:
+        """Loads every property of the given nodes at once."""
+        pass
+
+    def delete_node_properties_many(self, properties: Iterable[Tuple[int, str]]) -> None:
+        """Deletes `(node_id, property_name)` pairs at once."""
+        for node_id, property_name in properties:
+            self.delete_node_property(node_id, property_name)
+
+    def save_relationship_properties_many(
+        self, properties: Iterable[NodeProperty]
+    ) -> None:
+        """Saves `(relationship_id, property_name, property_value)` triples at once."""
+        for relationship_id, property_name, property_value in properties:
+            self.save_relationship_property(
+                relationship_id, property_name, property_value
+            )
+
+    def delete_relationship_properties_many(
+        self, properties: Iterable[Tuple[int, str]]
+    ) -> None:
+        """Deletes `(relationship_id, property_name)` pairs at once."""
+        for relationship_id, property_name in properties:
+            self.delete_relationship_property(relationship_id, property_name)
+
     def drop_database(self) -> None:
         """Deletes all entries from the on disk database."""
         pass
 
 
 class SQLitePropertyDatabase(OnDiskPropertyDatabase):
+    """Stores properties in a SQLite file.
+
+    Every thread keeps one connection open for the lifetime of the
+    database, in WAL mode, so a property read or write is a single
+    prepared statement rather than a connect and a transaction.
+    """
+
     def __init__(self, database_path: str):  # noqa F821
         self.database_name = database_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
         self._create_node_property_table()
         self._create_relationship_property_table()
 
-    def execute_query(self, query: str) -> List[str]:
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database_name, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def execute_query(self, query: str, parameters: Iterable = ()) -> List[str]:
         """Executes an SQL query on the on disk property database.
 
         Args:
             query: A string representing an SQL query.
+            parameters: The values of the `?` placeholders of the query.
 
         Returns:
             A list of strings representing the results of the query.
         """
-        with contextlib.closing(sqlite3.connect(self.database_name)) as conn:
-            with conn:  # autocommit changes
-                with contextlib.closing(conn.cursor()) as cursor:
-                    cursor.execute(query)
-                    return cursor.fetchall()
+        conn = self.connection
+        with conn:  # autocommit changes
+            return conn.execute(query, tuple(parameters)).fetchall()
+
+    def execute_many(self, query: str, parameters: Iterable[Tuple]) -> None:
+        """Executes a query once per parameter tuple, in one transaction.
+
+        Args:
+            query: A string representing an SQL query.
+            parameters: The parameter tuples to execute the query with.
+        """
+        conn = self.connection
+        with conn:
+            conn.executemany(query, parameters)
+
+    def close(self) -> None:
+        """Closes the connections of every thread."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
 
     def _create_node_property_table(self) -> None:
         """Creates a node property SQL table."""
@@ -110,6 +233,17 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
         self.execute_query("DELETE FROM node_properties;")
         self.execute_query("DELETE FROM relationship_properties;")
 
+    def _load_many(self, query: str, ids: Iterable[int]) -> Dict[int, Dict[str, str]]:
+        ids = list(dict.fromkeys(ids))
+        properties: Dict[int, Dict[str, str]] = {id_: {} for id_ in ids}
+        conn = self.connection
+        for start in range(0, len(ids), MAX_PARAMETERS):
+            chunk = ids[start : start + MAX_PARAMETERS]
+            rows = conn.execute(query.format(", ".join("?" * len(chunk))), chunk)
+            for id_, property_name, property_value in rows:
+                properties[id_][property_name] = property_value
+        return properties
+
     def save_node_property(
         self, node_id: int, property_name: str, property_value: str
     ) -> None:
@@ -121,10 +255,7 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
             property_value: A string representing the value of the property.
         """
         self.execute_query(
-            "INSERT INTO node_properties (node_id, property_name, property_value) "
-            f"VALUES({node_id}, '{property_name}', '{property_value}') "
-            "ON CONFLICT(node_id, property_name) "
-            "DO UPDATE SET property_value=excluded.property_value;"
+            SAVE_NODE_PROPERTY, (node_id, property_name, property_value)
         )
 
     def load_node_property(self, node_id: int, property_name: str) -> Optional[str]:
@@ -137,12 +268,7 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
         Returns:
             An optional string representing the property value.
         """
-        result = self.execute_query(
-            "SELECT property_value "
-            "FROM node_properties AS db "
-            f"WHERE db.node_id = {node_id} "
-            f"AND db.property_name = '{property_name}'"
-        )
+        result = self.execute_query(LOAD_NODE_PROPERTY, (node_id, property_name))
 
         if len(result) == 0:
             return None
@@ -152,6 +278,27 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
 
         return result[0][0]
 
+    def save_node_properties_many(self, properties: Iterable[NodeProperty]) -> None:
+        """Saves many node properties with one statement and one transaction.
+
+        Args:
+            properties: `(node_id, property_name, property_value)` triples.
+        """
+        self.execute_many(SAVE_NODE_PROPERTY, properties)
+
+    def load_node_properties_many(
+        self, node_ids: Iterable[int]
+    ) -> Dict[int, Dict[str, str]]:
+        """Loads every property of many nodes.
+
+        Args:
+            node_ids: The internal ids of the nodes.
+
+        Returns:
+            The properties of each node by name; `{}` for nodes without any.
+        """
+        return self._load_many(LOAD_NODE_PROPERTIES, node_ids)
+
     def delete_node_property(self, node_id: int, property_name: str) -> None:
         """Deletes a node property from an on disk database.
 
@@ -159,12 +306,15 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
             node_id: An integer representing the internal id of the node.
             property_name: A string representing the name of the property.
         """
-        self.execute_query(
-            "DELETE "
-            "FROM node_properties AS db "
-            f"WHERE db.node_id = {node_id} "
-            f"AND db.property_name = '{property_name}'"
-        )
+        self.execute_query(DELETE_NODE_PROPERTY, (node_id, property_name))
+
+    def delete_node_properties_many(self, properties: Iterable[Tuple[int, str]]) -> None:
+        """Deletes many node properties with one statement and one transaction.
+
+        Args:
+            properties: `(node_id, property_name)` pairs.
+        """
+        self.execute_many(DELETE_NODE_PROPERTY, properties)
 
     def save_relationship_property(
         self, relationship_id: int, property_name: str, property_value: str
@@ -177,10 +327,8 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
             property_value: A string representing the value of the property.
         """
         self.execute_query(
-            "INSERT INTO relationship_properties (relationship_id, property_name, property_value) "
-            f"VALUES({relationship_id}, '{property_name}', '{property_value}') "
-            "ON CONFLICT(relationship_id, property_name) "
-            "DO UPDATE SET property_value=excluded.property_value;"
+            SAVE_RELATIONSHIP_PROPERTY,
+            (relationship_id, property_name, property_value),
         )
 
     def load_relationship_property(
@@ -196,10 +344,7 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
             An optional string representing the property value.
         """
         result = self.execute_query(
-            "SELECT property_value "
-            "FROM relationship_properties AS db "
-            f"WHERE db.relationship_id = {relationship_id} "
-            f"AND db.property_name = '{property_name}'"
+            LOAD_RELATIONSHIP_PROPERTY, (relationship_id, property_name)
         )
 
         if len(result) == 0:
@@ -210,6 +355,29 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
 
         return result[0][0]
 
+    def save_relationship_properties_many(
+        self, properties: Iterable[NodeProperty]
+    ) -> None:
+        """Saves many relationship properties in one transaction.
+
+        Args:
+            properties: `(relationship_id, property_name, property_value)` triples.
+        """
+        self.execute_many(SAVE_RELATIONSHIP_PROPERTY, properties)
+
+    def load_relationship_properties_many(
+        self, relationship_ids: Iterable[int]
+    ) -> Dict[int, Dict[str, str]]:
+        """Loads every property of many relationships.
+
+        Args:
+            relationship_ids: The internal ids of the relationships.
+
+        Returns:
+            The properties of each relationship by name.
+        """
+        return self._load_many(LOAD_RELATIONSHIP_PROPERTIES, relationship_ids)
+
     def delete_relationship_property(
         self, relationship_id: int, property_name: str
     ) -> None:
@@ -220,8 +388,245 @@ class SQLitePropertyDatabase(OnDiskPropertyDatabase):
             property_name: A string representing the name of the property.
         """
         self.execute_query(
-            "DELETE "
-            "FROM relationship_properties AS db "
-            f"WHERE db.relationship_id = {relationship_id} "
-            f"AND db.property_name = '{property_name}'"
+            DELETE_RELATIONSHIP_PROPERTY, (relationship_id, property_name)
         )
+
+    def delete_relationship_properties_many(
+        self, properties: Iterable[Tuple[int, str]]
+    ) -> None:
+        """Deletes many relationship properties in one transaction.
+
+        Args:
+            properties: `(relationship_id, property_name)` pairs.
+        """
+        self.execute_many(DELETE_RELATIONSHIP_PROPERTY, properties)
+
+
+NODE = "node"
+RELATIONSHIP = "relationship"
+# Marks a property deleted in the write-back buffer.
+_DELETED = object()
+
+
+class CachedPropertyDatabase(OnDiskPropertyDatabase):
+    """A read cache and write-back buffer over another property database.
+
+    Reads are served from a bounded LRU cache of the properties of each node
+    and relationship. Writes and deletes land in the cache and in a dirty
+    set, which is written to the database in bulk by `flush` — call it once
+    per step — or as soon as it holds `max_dirty` properties. Buffered
+    writes stay readable while a flush writes them, and are buffered again
+    if the flush fails.
+
+    Args:
+        database: The database to cache.
+        cache_size: The number of nodes and relationships to keep cached.
+        max_dirty: The number of buffered writes that forces a flush.
+    """
+
+    def __init__(
+        self,
+        database: OnDiskPropertyDatabase,
+        cache_size: int = 100_000,
+        max_dirty: int = 10_000,
+    ):
+        self.database = database
+        self.cache_size = cache_size
+        self.max_dirty = max_dirty
+        self._lock = threading.RLock()
+        # (kind, id) -> (properties, whether they're all of them)
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[Dict[str, Any], bool]]" = (
+            OrderedDict()
+        )
+        self._dirty: Dict[Tuple[str, int, str], Any] = {}
+        # The writes of the flush in progress, until they are committed.
+        self._flushing: Dict[Tuple[str, int, str], Any] = {}
+        self._flush_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, kind: str, id_: int) -> Optional[Tuple[Dict[str, Any], bool]]:
+        entry = self._cache.get((kind, id_))
+        if entry is not None:
+            self._cache.move_to_end((kind, id_))
+        return entry
+
+    def _store(
+        self, kind: str, id_: int, properties: Dict[str, Any], complete: bool
+    ) -> Tuple[Dict[str, Any], bool]:
+        self._cache[(kind, id_)] = entry = (properties, complete)
+        self._cache.move_to_end((kind, id_))
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    def _load(self, kind: str, id_: int, property_name: str) -> Optional[str]:
+        with self._lock:
+            key = (kind, id_, property_name)
+            dirty = self._dirty.get(key, self._flushing.get(key))
+            if dirty is not None:
+                self.hits += 1
+                return None if dirty is _DELETED else dirty
+            entry = self._entry(kind, id_)
+            if entry is not None:
+                properties, complete = entry
+                if property_name in properties or complete:
+                    self.hits += 1
+                    return properties.get(property_name)
+            self.misses += 1
+            if kind == NODE:
+                value = self.database.load_node_property(id_, property_name)
+            else:
+                value = self.database.load_relationship_property(id_, property_name)
+            if entry is None:
+                entry = self._store(kind, id_, {}, False)
+            entry[0][property_name] = value
+            return value
+
+    def _save(self, kind: str, id_: int, property_name: str, value: Any) -> None:
+        with self._lock:
+            self._dirty[(kind, id_, property_name)] = value
+            entry = self._entry(kind, id_) or self._store(kind, id_, {}, False)
+            entry[0][property_name] = None if value is _DELETED else value
+            full = len(self._dirty) >= self.max_dirty
+        # Outside of the lock, which a flush in progress needs to finish.
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered writes and deletes to the database."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+                self._flushing = batch
+            try:
+                self._write(batch)
+            except BaseException:
+                with self._lock:
+                    # Writes made since the flush started are newer.
+                    self._dirty = {**batch, **self._dirty}
+                    self._flushing = {}
+                raise
+            with self._lock:
+                self._flushing = {}
+
+    def _write(self, batch: Dict[Tuple[str, int, str], Any]) -> None:
+        saves: Dict[str, List[NodeProperty]] = {NODE: [], RELATIONSHIP: []}
+        deletes: Dict[str, List[Tuple[int, str]]] = {NODE: [], RELATIONSHIP: []}
+        for (kind, id_, property_name), value in batch.items():
+            if value is _DELETED:
+                deletes[kind].append((id_, property_name))
+            else:
+                saves[kind].append((id_, property_name, value))
+        database = self.database
+        if deletes[NODE]:
+            database.delete_node_properties_many(deletes[NODE])
+        if deletes[RELATIONSHIP]:
+            database.delete_relationship_properties_many(deletes[RELATIONSHIP])
+        if saves[NODE]:
+            database.save_node_properties_many(saves[NODE])
+        if saves[RELATIONSHIP]:
+            database.save_relationship_properties_many(saves[RELATIONSHIP])
+
+    @property
+    def dirty(self) -> int:
+        """The number of buffered writes."""
+        return len(self._dirty)
+
+    def _fetch_nodes(self, node_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Gets every property of the given nodes, deleted ones as `None`.
+
+        Nodes that aren't fully cached are loaded with one bulk query, get
+        the buffered writes merged in and are cached. The result is built
+        from what was loaded, so it holds every node even when the cache is
+        too small to keep all of them.
+        """
+        with self._lock:
+            found: Dict[int, Dict[str, Any]] = {}
+            missing = []
+            for node_id in dict.fromkeys(node_ids):
+                entry = self._entry(NODE, node_id)
+                if entry is not None and entry[1]:
+                    found[node_id] = entry[0]
+                else:
+                    missing.append(node_id)
+            if not missing:
+                return found
+            loaded = self.database.load_node_properties_many(missing) or {}
+            wanted = set(missing)
+            dirty: Dict[int, Dict[str, Any]] = {}
+            buffered = chain(self._flushing.items(), self._dirty.items())
+            for (kind, id_, property_name), value in buffered:
+                if kind == NODE and id_ in wanted:
+                    dirty.setdefault(id_, {})[property_name] = (
+                        None if value is _DELETED else value
+                    )
+            for node_id in missing:
+                properties = dict(loaded.get(node_id, {}))
+                properties.update(dirty.get(node_id, {}))
+                self._store(NODE, node_id, properties, True)
+                found[node_id] = properties
+            return found
+
+    def prefetch_nodes(self, node_ids: Iterable[int]) -> None:
+        """Caches every property of the given nodes with one bulk load.
+
+        Args:
+            node_ids: The internal ids of the nodes.
+        """
+        self._fetch_nodes(node_ids)
+
+    def load_node_properties_many(
+        self, node_ids: Iterable[int]
+    ) -> Dict[int, Dict[str, str]]:
+        with self._lock:
+            found = self._fetch_nodes(node_ids)
+            return {
+                node_id: {
+                    name: value
+                    for name, value in properties.items()
+                    if value is not None
+                }
+                for node_id, properties in found.items()
+            }
+
+    def save_node_properties_many(self, properties: Iterable[NodeProperty]) -> None:
+        for node_id, property_name, property_value in properties:
+            self._save(NODE, node_id, property_name, property_value)
+
+    def save_node_property(
+        self, node_id: int, property_name: str, property_value: str
+    ) -> None:
+        self._save(NODE, node_id, property_name, property_value)
+
+    def load_node_property(self, node_id: int, property_name: str) -> Optional[str]:
+        return self._load(NODE, node_id, property_name)
+
+    def delete_node_property(self, node_id: int, property_name: str) -> None:
+        self._save(NODE, node_id, property_name, _DELETED)
+
+    def save_relationship_property(
+        self, relationship_id: int, property_name: str, property_value: str
+    ) -> None:
+        self._save(RELATIONSHIP, relationship_id, property_name, property_value)
+
+    def load_relationship_property(
+        self, relationship_id: int, property_name: str
+    ) -> Optional[str]:
+        return self._load(RELATIONSHIP, relationship_id, property_name)
+
+    def delete_relationship_property(
+        self, relationship_id: int, property_name: str
+    ) -> None:
+        self._save(RELATIONSHIP, relationship_id, property_name, _DELETED)
+
+    def invalidate(self) -> None:
+        """Drops the read cache, keeping the buffered writes."""
+        with self._lock:
+            self._cache.clear()
+
+    def drop_database(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._dirty.clear()
+        self.database.drop_database()
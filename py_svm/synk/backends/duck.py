@@ -0,0 +1,600 @@
+"""The accounts and storage tables of a simulation, stored in DuckDB.
+
+Single writes run the parameterised statements of `sql.py`. A `StepBatch`
+collects the writes of a whole step in columns instead, and appends them
+as one Arrow table with a single `INSERT ... SELECT`.
+
+`TypedTable` is the typed alternative to the `storage` table: one wide
+table per module class, with a native column per pydantic field.
+"""
+import datetime
+from decimal import Decimal
+from typing import (Any, Dict, List, Type, Tuple, Mapping, Callable, Iterable,
+                    Iterator, Optional, Sequence)
+
+import duckdb
+import inflection
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+from loguru import logger as log
+from pydantic import BaseModel
+from pydantic.fields import (ModelField, SHAPE_LIST, SHAPE_SET,
+                             SHAPE_MAPPING, SHAPE_DICT, SHAPE_SINGLETON,
+                             SHAPE_SEQUENCE, SHAPE_TUPLE_ELLIPSIS)
+
+from py_svm.synk.backends import sql as sqlq
+
+ACCOUNT_SCHEMA = pa.schema([
+    ("episode", pa.string()),
+    ("address", pa.string()),
+    ("balance", pa.float64()),
+    ("timestamp", pa.int32()),
+])
+STORAGE_SCHEMA = pa.schema([
+    ("episode", pa.string()),
+    ("address", pa.string()),
+    ("slot", pa.string()),
+    ("value", pa.string()),
+    ("vtype", pa.string()),
+    ("timestamp", pa.int32()),
+])
+
+
+def value_type(value: Any) -> str:
+    """Gets the `vtype` a value is stored with in the `storage` table."""
+    match value:
+        case bool():
+            return "BOOLEAN"
+        case str() | bytes():
+            return "String"
+        case int() | float() | Decimal():
+            return "Numeric"
+        case dict():
+            return "STRUCT"
+        case None:
+            return "NULL"
+    return "String"
+
+
+def value_str(value: Any) -> Optional[str]:
+    """Gets the text a value is stored as in the `storage` table."""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, dict):
+        # JSON, so that `value::JSON` reads it back in DuckDB.
+        return orjson.dumps(value, default=str).decode()
+    return str(value)
+
+
+# The Arrow type each `vtype` decodes to, and the column it decodes into.
+VTYPE_TYPES: Dict[str, pa.DataType] = {
+    "Numeric": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+    "String": pa.string(),
+    "STRUCT": pa.string(),
+}
+VTYPE_COLUMNS: Dict[str, str] = {
+    "Numeric": "numeric",
+    "BOOLEAN": "boolean",
+    "String": "string",
+    "STRUCT": "struct",
+}
+
+
+def decode_values(table: pa.Table) -> pa.Table:
+    """Casts the `value` column of a `storage` read by its `vtype`.
+
+    Every distinct `vtype` is cast once, with Arrow compute, into its own
+    typed column (`numeric`, `boolean`, `string`, `struct` as JSON text),
+    which is null on the rows of the other types. `value` and `vtype` are
+    replaced by those columns; no value goes through Python.
+    """
+    values, vtypes = table.column("value"), table.column("vtype")
+    decoded = table.drop(["value", "vtype"])
+    present = set(pc.unique(vtypes).to_pylist())
+    for vtype, column in VTYPE_COLUMNS.items():
+        target = VTYPE_TYPES[vtype]
+        if vtype not in present:
+            decoded = decoded.append_column(
+                column, pa.nulls(table.num_rows, target))
+            continue
+        mask = pc.fill_null(pc.equal(vtypes, vtype), False)
+        only = pc.if_else(mask, values, pa.scalar(None, values.type))
+        decoded = decoded.append_column(column, pc.cast(only, target))
+    return decoded
+
+
+def typed_values(table: pa.Table) -> List[Any]:
+    """The values of a `storage` read as Python objects, by `vtype`.
+
+    Meant for small results (one row per slot), not for histories.
+    """
+    decoded = decode_values(table)
+    columns = {
+        vtype: decoded.column(column).to_pylist()
+        for vtype, column in VTYPE_COLUMNS.items()
+    }
+    values = []
+    for row, vtype in enumerate(table.column("vtype").to_pylist()):
+        value = columns[vtype][row] if vtype in columns else None
+        if vtype == "STRUCT" and value is not None:
+            value = orjson.loads(value)
+        values.append(value)
+    return values
+
+
+def pivot_values(table: pa.Table, index: str = "timestamp") -> pa.Table:
+    """Pivots a `storage` read into one typed column per slot.
+
+    Rows are the distinct values of `index`, sorted. Each slot's column
+    takes the type of its `vtype`, or stays text when the slot was written
+    with several types. The loop runs once per slot, not per value.
+    """
+    decoded = decode_values(table)
+    keys = pc.unique(decoded.column(index))
+    pivoted = pa.table({index: keys.take(pc.sort_indices(keys))})
+    slots, vtypes = table.column("slot"), table.column("vtype")
+    for slot in pc.unique(slots).to_pylist():
+        mask = pc.fill_null(pc.equal(slots, slot), False)
+        kinds = pc.unique(vtypes.filter(mask)).drop_null().to_pylist()
+        if len(kinds) == 1 and kinds[0] in VTYPE_COLUMNS:
+            values = decoded.column(VTYPE_COLUMNS[kinds[0]])
+        else:
+            values = table.column("value")
+        rows = pa.table({
+            index: decoded.column(index).filter(mask),
+            "value": values.filter(mask)
+        })
+        # Several writes at the same index keep the last one.
+        last = rows.group_by(index, use_threads=False).aggregate([("value",
+                                                                   "last")])
+        column = pivoted.select([index]).join(
+            last, index, join_type="left outer").sort_by(index)
+        pivoted = pivoted.append_column(str(slot), column.column("value_last"))
+    return pivoted
+
+
+def fetch_table(result: duckdb.DuckDBPyConnection) -> pa.Table:
+    """Reads the whole result of a query as an Arrow table.
+
+    `arrow()` returns a table in older DuckDB releases and a record batch
+    reader in newer ones, which replaced the deprecated
+    `fetch_arrow_table`.
+    """
+    table = result.arrow()
+    if isinstance(table, pa.RecordBatchReader):
+        return table.read_all()
+    return table
+
+
+def keyset_pages(execute: Callable[[str, list], pa.Table],
+                 first: str,
+                 after: str,
+                 parameters: list,
+                 keys: Sequence[str],
+                 page_size: int = 4096) -> Iterator[pa.Table]:
+    """Yields the pages of a keyset-paginated query.
+
+    `first` and `after` take `parameters`, then (for `after`) the `keys` of
+    the last row of the previous page, then the page size as their last
+    parameter. `execute` runs a query and returns its Arrow result.
+    """
+    page = execute(first, [*parameters, page_size])
+    while page.num_rows:
+        yield page
+        if page.num_rows < page_size:
+            return
+        last = [page.column(key)[-1].as_py() for key in keys]
+        page = execute(after, [*parameters, *last, page_size])
+
+
+class StepBatch:
+    """Collects the account and storage writes of a step as columns.
+
+    Call `flush` (or leave the `with` block) to append them all at once.
+    """
+
+    def __init__(self, db: "DuckStorage") -> None:
+        self.db = db
+        self.clear()
+
+    def clear(self) -> None:
+        self._accounts: List[List[Any]] = [[] for _ in ACCOUNT_SCHEMA]
+        self._storage: List[List[Any]] = [[] for _ in STORAGE_SCHEMA]
+
+    def __len__(self) -> int:
+        return len(self._accounts[0]) + len(self._storage[0])
+
+    def set_balance(self, episode: str, address: str, balance: float,
+                    timestamp: int) -> None:
+        for column, value in zip(self._accounts,
+                                 (episode, address, balance, timestamp)):
+            column.append(value)
+
+    def set_value(self, episode: str, address: str, slot: str, value: Any,
+                  timestamp: int) -> None:
+        row = (episode, address, slot, value_str(value), value_type(value),
+               timestamp)
+        for column, item in zip(self._storage, row):
+            column.append(item)
+
+    def tables(self) -> Tuple[pa.Table, pa.Table]:
+        """The buffered writes as `(accounts, storage)` Arrow tables."""
+        return (pa.Table.from_arrays(
+            [pa.array(c, f.type) for c, f in zip(self._accounts, ACCOUNT_SCHEMA)],
+            schema=ACCOUNT_SCHEMA),
+                pa.Table.from_arrays([
+                    pa.array(c, f.type)
+                    for c, f in zip(self._storage, STORAGE_SCHEMA)
+                ],
+                                     schema=STORAGE_SCHEMA))
+
+    def flush(self) -> None:
+        accounts, storage = self.tables()
+        self.clear()
+        self.db.append_accounts(accounts)
+        self.db.append_storage(storage)
+
+    def __enter__(self) -> "StepBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace) -> None:
+        if exc_type is None:
+            self.flush()
+
+
+class DuckStorage:
+    """Reads and writes the `accounts` and `storage` tables.
+
+    Parameters
+    ----------
+    conn : `duckdb.DuckDBPyConnection`, optional
+        The connection to use. Defaults to a new connection to `path`.
+    path : str, default ":memory:"
+        The database file to connect to when no connection is given.
+    """
+
+    def __init__(self,
+                 conn: Optional[duckdb.DuckDBPyConnection] = None,
+                 path: str = ":memory:") -> None:
+        self.conn = conn if conn is not None else duckdb.connect(path)
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        for query in (sqlq.CREATE_ACCOUNT, sqlq.CREATE_STORAGE):
+            self.conn.execute(query)
+
+    def _fetch(self, query: str, parameters: list) -> pa.Table:
+        return fetch_table(self.conn.execute(query, parameters))
+
+    def batch(self) -> StepBatch:
+        return StepBatch(self)
+
+    def typed_table(self, model: Type[BaseModel], **kwargs) -> "TypedTable":
+        """Gets the typed table of a module class, creating or migrating it."""
+        return TypedTable(model, self.conn, **kwargs)
+
+    # -- writes ---------------------------------------------------------
+
+    def set_balance(self, episode: str, address: str, balance: float,
+                    timestamp: int) -> None:
+        self.conn.execute(sqlq.INSERT_ACCOUNT_STATE,
+                          [episode, address, balance, timestamp])
+
+    def set_value(self, episode: str, address: str, slot: str, value: Any,
+                  timestamp: int) -> None:
+        self.conn.execute(sqlq.INSERT_STORAGE, [
+            episode, address, slot,
+            value_str(value),
+            value_type(value), timestamp
+        ])
+
+    def set_values(self, rows: Iterable[Tuple[str, str, str, Any, int]]) -> None:
+        """Writes `(episode, address, slot, value, timestamp)` rows with one
+        prepared statement."""
+        self.conn.executemany(sqlq.INSERT_STORAGE, [[
+            episode, address, slot,
+            value_str(value),
+            value_type(value), timestamp
+        ] for episode, address, slot, value, timestamp in rows])
+
+    def _append(self, name: str, query: str, table: pa.Table) -> None:
+        if not table.num_rows:
+            return
+        self.conn.register(name, table)
+        try:
+            self.conn.execute(query)
+        finally:
+            self.conn.unregister(name)
+
+    def append_accounts(self, table: pa.Table) -> None:
+        """Appends an Arrow table of account states in one statement."""
+        self._append(sqlq.ACCOUNT_BATCH, sqlq.APPEND_ACCOUNT_STATES, table)
+
+    def append_storage(self, table: pa.Table) -> None:
+        """Appends an Arrow table of storage writes in one statement."""
+        self._append(sqlq.STORAGE_BATCH, sqlq.APPEND_STORAGE, table)
+
+    # -- reads ----------------------------------------------------------
+
+    def get_balance(self, episode: str, address: str,
+                    timestamp: int) -> Optional[float]:
+        row = self.conn.execute(sqlq.SELECT_ACCOUNT_ONE,
+                                [episode, address, timestamp]).fetchone()
+        return None if row is None else float(row[3])
+
+    def balance_pages(self,
+                      episode: str,
+                      address: str,
+                      page_size: int = 4096) -> Iterator[pa.Table]:
+        """Yields the balances of an address, newest first, page by page."""
+        return keyset_pages(self._fetch, sqlq.SELECT_ACCOUNT_HIST_PAGE,
+                            sqlq.SELECT_ACCOUNT_HIST_AFTER, [episode, address],
+                            sqlq.ACCOUNT_HISTORY_KEYS, page_size)
+
+    def balance_history(self, episode: str, address: str) -> pa.Table:
+        pages = list(self.balance_pages(episode, address))
+        if not pages:
+            return self._fetch(sqlq.SELECT_ACCOUNT_HIST_PAGE,
+                               [episode, address, 0])
+        return pa.concat_tables(pages)
+
+    def get_value(self, episode: str, address: str, slot: str,
+                  timestamp: int) -> Any:
+        """Gets the value of a slot as of `timestamp`, or `None`."""
+        table = self._fetch(sqlq.GET_STORAGE_ONE,
+                            [episode, address, slot, timestamp])
+        return typed_values(table)[0] if table.num_rows else None
+
+    def state_at(self, episode: str, address: str,
+                 timestamp: int) -> Dict[str, Any]:
+        """Gets every slot of an address as of `timestamp` with one query."""
+        table = self._fetch(sqlq.GET_STORAGE_AS_OF,
+                            [episode, address, timestamp])
+        return dict(zip(table.column("slot").to_pylist(), typed_values(table)))
+
+    def state_at_many(self, episode: str, addresses: Iterable[str],
+                      timestamp: int) -> Dict[str, Dict[str, Any]]:
+        """`state_at` for many addresses, still with one query.
+
+        Addresses without any write before `timestamp` map to `{}`.
+        """
+        addresses = list(addresses)
+        table = self._fetch(sqlq.GET_STORAGE_AS_OF_MANY,
+                            [episode, addresses, timestamp])
+        states: Dict[str, Dict[str, Any]] = {address: {} for address in addresses}
+        for address, slot, value in zip(table.column("address").to_pylist(),
+                                        table.column("slot").to_pylist(),
+                                        typed_values(table)):
+            states[address][slot] = value
+        return states
+
+    def history_pages(self,
+                      episode: str,
+                      address: str,
+                      page_size: int = 4096) -> Iterator[pa.Table]:
+        """Yields the storage writes of an address, newest first, page by
+        page."""
+        for page in keyset_pages(self._fetch, sqlq.GET_STORAGE_HISTORY,
+                                 sqlq.GET_STORAGE_HISTORY_AFTER,
+                                 [episode, address], sqlq.STORAGE_HISTORY_KEYS,
+                                 page_size):
+            yield page.drop(["id"])
+
+    def get_history(self,
+                    episode: str,
+                    address: str,
+                    page_size: int = 4096) -> pa.Table:
+        pages = list(self.history_pages(episode, address, page_size))
+        if not pages:
+            return self._fetch(sqlq.GET_STORAGE_HISTORY,
+                               [episode, address, 0]).drop(["id"])
+        return pa.concat_tables(pages)
+
+    def typed_history(self,
+                      episode: str,
+                      address: str,
+                      pivot: bool = False) -> pa.Table:
+        """The history of an address with its values cast by `vtype`, either
+        as typed columns or pivoted to one column per slot."""
+        table = self.get_history(episode, address)
+        return pivot_values(table) if pivot else decode_values(table)
+
+
+SCALAR_TYPES: Dict[type, str] = {
+    bool: "BOOLEAN",
+    int: "BIGINT",
+    float: "DOUBLE",
+    Decimal: "DOUBLE",
+    str: "VARCHAR",
+    bytes: "BLOB",
+    datetime.datetime: "TIMESTAMP",
+    datetime.date: "DATE",
+}
+LIST_SHAPES = (SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_TUPLE_ELLIPSIS)
+# The columns every typed table starts with.
+KEY_COLUMNS = {
+    "episode": "VARCHAR",
+    "module_id": "VARCHAR",
+    "timestep": "BIGINT",
+}
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _type_sql(type_: Any) -> str:
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        members = ", ".join(f"{quote(name)} {field_type(field)}"
+                            for name, field in type_.__fields__.items())
+        return f"STRUCT({members})"
+    if isinstance(type_, type):
+        for python_type, sql_type in SCALAR_TYPES.items():
+            if issubclass(type_, python_type):
+                return sql_type
+    # Anything else is stored as its text.
+    return "VARCHAR"
+
+
+def field_type(field: ModelField) -> str:
+    """Gets the DuckDB column type of a pydantic field."""
+    if field.shape == SHAPE_SINGLETON:
+        return _type_sql(field.type_)
+    if field.shape in LIST_SHAPES:
+        return f"{_type_sql(field.type_)}[]"
+    if field.shape in (SHAPE_MAPPING, SHAPE_DICT) and field.key_field:
+        return (f"MAP({field_type(field.key_field)}, "
+                f"{_type_sql(field.type_)})")
+    return "VARCHAR"
+
+
+class TypedTable:
+    """A wide, typed table that stores the fields of one module class.
+
+    Every pydantic field of the class becomes a native column (`DOUBLE`,
+    `BIGINT`, `BOOLEAN`, `STRUCT` for nested models, lists and maps), next
+    to the `episode`, `module_id` and `timestep` key columns. `migrate`
+    adds the columns of fields that were added to the class since the table
+    was created.
+
+    Parameters
+    ----------
+    model : type of `BaseModel`
+        The module (or any pydantic) class.
+    conn : `duckdb.DuckDBPyConnection`
+        The connection the table lives in.
+    exclude : iterable of str, optional
+        Fields that shouldn't be stored. Defaults to the key columns and the
+        context fields of `DBActions`.
+    """
+
+    def __init__(self,
+                 model: Type[BaseModel],
+                 conn: duckdb.DuckDBPyConnection,
+                 exclude: Optional[Iterable[str]] = None) -> None:
+        self.model = model
+        self.conn = conn
+        if exclude is None:
+            exclude = set(getattr(model, "__filterable_fields__", ())) | {
+                "module_type", "context"
+            }
+        self.exclude = set(exclude) | set(KEY_COLUMNS)
+        self.name = inflection.tableize(model.__name__)
+        self.migrate()
+
+    @property
+    def columns(self) -> Dict[str, str]:
+        """The columns the class needs, in order, with their types."""
+        columns = dict(KEY_COLUMNS)
+        for name, field in self.model.__fields__.items():
+            if name not in self.exclude:
+                columns[name] = field_type(field)
+        return columns
+
+    def ddl(self) -> str:
+        members = ",\n        ".join(f"{quote(name)} {sql_type}"
+                                     for name, sql_type in self.columns.items())
+        return (f"CREATE TABLE IF NOT EXISTS {quote(self.name)} (\n"
+                f"        {members}\n)")
+
+    def existing_columns(self) -> Dict[str, str]:
+        rows = self.conn.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_name = ? ORDER BY ordinal_position",
+            [self.name]).fetchall()
+        return dict(rows)
+
+    def migrate(self) -> List[str]:
+        """Creates the table, or adds the columns it's missing.
+
+        Returns
+        -------
+        list of str
+            The columns that were added.
+        """
+        existing = self.existing_columns()
+        if not existing:
+            self.conn.execute(self.ddl())
+            return list(self.columns)
+        added = []
+        for name, sql_type in self.columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {quote(self.name)} "
+                                  f"ADD COLUMN {quote(name)} {sql_type}")
+                added.append(name)
+            elif existing[name].split("(")[0] != sql_type.split("(")[0]:
+                log.warning(f"Column {self.name}.{name} is {existing[name]}, "
+                            f"but the field is now {sql_type}")
+        return added
+
+    def _row(self, values: Mapping[str, Any]) -> Dict[str, Any]:
+        columns = self.columns
+        row = {}
+        for name in columns:
+            value = values.get(name)
+            if columns[name] == "VARCHAR" and value is not None and not \
+                    isinstance(value, str):
+                value = str(value)
+            row[name] = value
+        return row
+
+    def insert(self, module: BaseModel, module_id: Any, episode: str,
+               timestep: int) -> None:
+        """Writes the fields of a module at a timestep."""
+        self.insert_many([module.dict()], [module_id], episode, timestep)
+
+    def insert_many(self, records: List[Mapping[str, Any]],
+                    module_ids: List[Any], episode: str, timestep: int) -> None:
+        """Writes the field values of many modules of the class at once."""
+        rows = [
+            self._row({
+                **record, "episode": episode,
+                "module_id": str(module_id),
+                "timestep": timestep
+            }) for record, module_id in zip(records, module_ids)
+        ]
+        if not rows:
+            return
+        names = ", ".join(quote(name) for name in self.columns)
+        marks = ", ".join("?" for _ in self.columns)
+        self.conn.executemany(
+            f"INSERT INTO {quote(self.name)} ({names}) VALUES ({marks})",
+            [list(row.values()) for row in rows])
+
+    def append(self, table: pa.Table) -> None:
+        """Appends an Arrow table whose columns are named like the table's."""
+        batch = f"{self.name}_batch"
+        self.conn.register(batch, table)
+        try:
+            self.conn.execute(
+                f"INSERT INTO {quote(self.name)} BY NAME SELECT * FROM {batch}")
+        finally:
+            self.conn.unregister(batch)
+
+    def latest(self,
+               module_id: Any,
+               episode: str,
+               timestep: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Gets the latest row of a module, at or before `timestep`."""
+        query = (f"SELECT * FROM {quote(self.name)} "
+                 "WHERE episode = ? AND module_id = ?")
+        parameters = [episode, str(module_id)]
+        if timestep is not None:
+            query += " AND timestep <= ?"
+            parameters.append(timestep)
+        table = fetch_table(
+            self.conn.execute(query + " ORDER BY timestep DESC LIMIT 1",
+                              parameters))
+        rows = table.to_pylist()
+        return rows[0] if rows else None
+
+    def history(self, module_id: Any, episode: str) -> pa.Table:
+        return fetch_table(
+            self.conn.execute(
+                f"SELECT * FROM {quote(self.name)} "
+                "WHERE episode = ? AND module_id = ? ORDER BY timestep",
+                [episode, str(module_id)]))
@@ -9,7 +9,7 @@ SQL commands can be transferred quickly.
 
 CREATE_ACCOUNT = """
 CREATE TABLE IF NOT EXISTS accounts(
-        id TEXT NOT NULL,
+        id TEXT NOT NULL DEFAULT gen_random_uuid(),
         episode VARCHAR, 
         address VARCHAR, 
         balance Numeric, 
@@ -28,22 +28,18 @@ CREATE TABLE IF NOT EXISTS storage (
         PRIMARY KEY (id)
 )
 """
-# INSERT INTO accounts (episode, address, balance, timestamp)
-# VALUES ({episode}, {address},{balance},{timestamp})
+# Every statement below takes its values as `?` parameters, so values are
+# never formatted (or quoted) into SQL. DuckDB's Python API has no statement
+# cache: `execute` still parses and plans a statement on every call, while
+# `executemany` does it once for a whole batch.
 
-
-# two_x FLOAT GENERATED ALWAYS AS (2 * x) VIRTUAL
 INSERT_ACCOUNT_STATE = """
-INSERT INTO accounts (episode, address, balance, timestamp) VALUES ('{episode}', '{address}', {balance}, {timestamp}) 
+INSERT INTO accounts (episode, address, balance, timestamp) VALUES (?, ?, ?, ?)
 """
-SELECT_ACCOUNT_ONE = "SELECT * FROM accounts  WHERE  episode = '{episode}' and address = '{address}' and timestamp = {timestamp} LIMIT 1"
-SELECT_ACCOUNT_HIST = "SELECT * FROM accounts  WHERE  episode = '{episode}' and address = '{address}' order by timestamp desc"
-
-# INSERT_ACCOUNT_STATE = """
-# INSERT INTO accounts (episode, address, balance, timestamp) VALUES (?, ?, ?, ?) ON CONFLICT (episode, address, timestamp) DO UPDATE SET balance = accounts.balance
-# """
+SELECT_ACCOUNT_ONE = "SELECT * FROM accounts WHERE episode = ? AND address = ? AND timestamp = ? LIMIT 1"
+SELECT_ACCOUNT_HIST = "SELECT * FROM accounts WHERE episode = ? AND address = ? ORDER BY timestamp DESC"
 
-INSERT_STORAGE = "INSERT INTO storage (episode, address, slot, value, vtype, timestamp) VALUES ('{episode}','{address}','{slot}','{value}','{vtype}',{timestamp})"
+INSERT_STORAGE = "INSERT INTO storage (episode, address, slot, value, vtype, timestamp) VALUES (?, ?, ?, ?, ?, ?)"
 
 
 UPDATE_VALUE = """
@@ -53,11 +49,65 @@ INSERT INTO storage (episode, address, slot, value, timestamp) VALUES (%s, %s, %
 
 GET_STORAGE_ONE = """SELECT storage.slot, storage.value, storage.vtype, storage.timestamp 
 FROM storage 
-WHERE storage.episode = '{episode}' AND storage.address = '{address}'  ORDER BY storage.timestamp DESC LIMIT 1
+WHERE storage.episode = ? AND storage.address = ? AND storage.slot = ? AND storage.timestamp <= ?
+ORDER BY storage.timestamp DESC LIMIT 1
+"""
+# The latest write of every slot as of a timestamp, in one pass.
+GET_STORAGE_AS_OF = """
+SELECT storage.slot, storage.value, storage.vtype, storage.timestamp
+FROM storage
+WHERE storage.episode = ? AND storage.address = ? AND storage.timestamp <= ?
+QUALIFY row_number() OVER (PARTITION BY storage.slot ORDER BY storage.timestamp DESC) = 1
 """
+# The same for a list of addresses.
+GET_STORAGE_AS_OF_MANY = """
+SELECT storage.address, storage.slot, storage.value, storage.vtype, storage.timestamp
+FROM storage
+WHERE storage.episode = ? AND list_contains(?, storage.address) AND storage.timestamp <= ?
+QUALIFY row_number() OVER (PARTITION BY storage.address, storage.slot ORDER BY storage.timestamp DESC) = 1
+"""
+# Histories are read newest first, a page at a time. The next page starts
+# strictly after the sort key of the last row (keyset pagination) instead of
+# skipping an OFFSET. The tables have no index: DuckDB's ART indexes don't
+# serve ordered or range scans, and slow down every append. Paging is not
+# index-backed: each page is a filtered scan of the table plus a top-N
+# sort, so it costs the same at any depth but grows with the table.
 GET_STORAGE_HISTORY = """
-SELECT storage.slot, storage.value, storage.vtype, storage.timestamp 
-FROM storage 
-WHERE storage.episode = '{episode}' AND storage.address = '{address}' ORDER BY storage.timestamp DESC
-LIMIT 100 OFFSET 0
+SELECT storage.slot, storage.value, storage.vtype, storage.timestamp, storage.id
+FROM storage
+WHERE storage.episode = ? AND storage.address = ?
+ORDER BY storage.timestamp DESC, storage.slot DESC, storage.id DESC
+LIMIT ?
+"""
+GET_STORAGE_HISTORY_AFTER = """
+SELECT storage.slot, storage.value, storage.vtype, storage.timestamp, storage.id
+FROM storage
+WHERE storage.episode = ? AND storage.address = ?
+AND (storage.timestamp, storage.slot, storage.id) < (?, ?, ?)
+ORDER BY storage.timestamp DESC, storage.slot DESC, storage.id DESC
+LIMIT ?
+"""
+SELECT_ACCOUNT_HIST_PAGE = """
+SELECT * FROM accounts WHERE episode = ? AND address = ?
+ORDER BY timestamp DESC, id DESC LIMIT ?
+"""
+SELECT_ACCOUNT_HIST_AFTER = """
+SELECT * FROM accounts WHERE episode = ? AND address = ?
+AND (timestamp, id) < (?, ?)
+ORDER BY timestamp DESC, id DESC LIMIT ?
+"""
+STORAGE_HISTORY_KEYS = ("timestamp", "slot", "id")
+ACCOUNT_HISTORY_KEYS = ("timestamp", "id")
+
+# Bulk appends read a whole step of writes from an Arrow table registered
+# under the name of the batch.
+ACCOUNT_BATCH = "account_batch"
+STORAGE_BATCH = "storage_batch"
+APPEND_ACCOUNT_STATES = f"""
+INSERT INTO accounts (episode, address, balance, timestamp)
+SELECT episode, address, balance, timestamp FROM {ACCOUNT_BATCH}
+"""
+APPEND_STORAGE = f"""
+INSERT INTO storage (episode, address, slot, value, vtype, timestamp)
+SELECT episode, address, slot, value, vtype, timestamp FROM {STORAGE_BATCH}
 """
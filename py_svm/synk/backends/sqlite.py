@@ -0,0 +1,107 @@
+"""A SQLite backend for the key/value storage tiers.
+
+Keys are stored as encoded BLOBs in a `WITHOUT ROWID` table, so the primary
+key is the clustered, memcmp-ordered index that `scan` and `reverse_scan`
+seek into. Values are pickled.
+"""
+import pickle
+import sqlite3
+import threading
+from typing import Any, Tuple, Iterator, Optional
+
+from py_svm.synk.lsm import encode_key
+from py_svm.synk.storage import MISSING, DatabaseAPI
+
+CREATE_KV = """
+CREATE TABLE IF NOT EXISTS kv (
+        key BLOB NOT NULL PRIMARY KEY,
+        value BLOB NOT NULL
+) WITHOUT ROWID
+"""
+UPSERT_KV = "INSERT INTO kv (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+SELECT_KV = "SELECT value FROM kv WHERE key = ?"
+DELETE_KV = "DELETE FROM kv WHERE key = ?"
+COUNT_KV = "SELECT count(*) FROM kv"
+
+
+class SQLiteDB(DatabaseAPI):
+    """Stores a storage tier in a SQLite file.
+
+    Parameters
+    ----------
+    path : str, default ":memory:"
+        The database file.
+    fetch_size : int, default 256
+        The number of rows a scan fetches at once.
+    """
+
+    def __init__(self, path: str = ":memory:", fetch_size: int = 256):
+        self.path = path
+        self.fetch_size = fetch_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(CREATE_KV)
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                UPSERT_KV, (encode_key(key), pickle.dumps(value, protocol=4)))
+
+    def probe(self, key) -> Any:
+        with self._lock:
+            row = self._conn.execute(SELECT_KV, (encode_key(key), )).fetchone()
+        return MISSING if row is None else pickle.loads(row[0])
+
+    def get(self, key):
+        value = self.probe(key)
+        return None if value is MISSING else value
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(DELETE_KV, (encode_key(key), ))
+
+    def exists(self, key) -> bool:
+        return self.probe(key) is not MISSING
+
+    def remove(self, key):
+        self.delete(key)
+
+    def _scan(self, start: Optional[bytes], end: Optional[bytes],
+              reverse: bool) -> Iterator[Tuple[bytes, Any]]:
+        where, parameters = [], []
+        if start is not None:
+            where.append("key >= ?")
+            parameters.append(start)
+        if end is not None:
+            where.append("key < ?")
+            parameters.append(end)
+        query = "SELECT key, value FROM kv"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY key DESC" if reverse else " ORDER BY key"
+        return self._rows(query, parameters)
+
+    def _rows(self, query: str, parameters: list) -> Iterator[Tuple[bytes, Any]]:
+        # Rows are fetched lazily, so reading the first key of a scan is
+        # a single index seek.
+        with self._lock:
+            cursor = self._conn.execute(query, parameters)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self.fetch_size)
+            if not rows:
+                return
+            for key, value in rows:
+                yield bytes(key), pickle.loads(value)
+
+    def __iter__(self) -> Iterator[Any]:
+        return (key for key, _ in self.scan())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(COUNT_KV).fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,111 @@
+"""Bloom filters that answer definite misses of a storage tier in memory."""
+import math
+from typing import Any, Dict, Iterable
+
+import numpy as np
+import xxhash
+
+from py_svm.synk.lsm import encode_key
+
+_MASK = (1 << 64) - 1
+
+
+class BloomFilter:
+    """A Bloom filter sized for `capacity` keys at a false-positive rate.
+
+    Keys are hashed once with xxh3-128 and the two halves of the digest
+    derive the `hashes` bit positions (double hashing). A filter can't
+    forget keys, so deleted keys keep answering "maybe" until the filter
+    is rebuilt.
+
+    Attributes
+    ----------
+    capacity : int
+        The number of keys the filter is sized for.
+    fp_rate : float
+        The false-positive rate the filter is sized for.
+    bits : int
+        The number of bits of the filter.
+    hashes : int
+        The number of bits set per key.
+    """
+
+    def __init__(self, capacity: int = 100_000, fp_rate: float = 0.01) -> None:
+        if not 0 < fp_rate < 1:
+            raise ValueError("The false-positive rate must be between 0 and 1")
+        self.capacity = max(int(capacity), 1)
+        self.fp_rate = fp_rate
+        self.bits = max(
+            int(math.ceil(-self.capacity * math.log(fp_rate) /
+                          math.log(2)**2)), 8)
+        self.hashes = max(int(round(self.bits / self.capacity * math.log(2))),
+                          1)
+        self._array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    @classmethod
+    def from_memory(cls, nbytes: int, capacity: int) -> "BloomFilter":
+        """Sizes a filter by memory instead of by false-positive rate."""
+        bits = max(nbytes * 8, 8)
+        fp_rate = math.exp(-bits / max(capacity, 1) * math.log(2)**2)
+        return cls(capacity, min(max(fp_rate, 1e-12), 0.5))
+
+    def _positions(self, key: Any) -> Iterable[int]:
+        digest = xxhash.xxh3_128_intdigest(encode_key(key))
+        first, second = digest & _MASK, digest >> 64 | 1
+        bits = self.bits
+        return ((first + index * second) % bits for index in range(self.hashes))
+
+    def add(self, key: Any) -> bool:
+        """Adds a key, returning `True` if it set a new bit. A key that sets
+        none was (or collides with) a key added before, so it isn't counted
+        again and rewriting a key never fills the filter up."""
+        array = self._array
+        added = False
+        for position in self._positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not array[byte] & bit:
+                array[byte] |= bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def update(self, keys: Iterable[Any]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: Any) -> bool:
+        """`False` means the key was never added, `True` only that it may have been."""
+        array = self._array
+        return all(array[position >> 3] >> (position & 7) & 1
+                   for position in self._positions(key))
+
+    def clear(self) -> None:
+        self._array[:] = 0
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._array.nbytes
+
+    @property
+    def is_saturated(self) -> bool:
+        """`True` once more distinct keys were added than the filter is sized
+        for."""
+        return self.count > self.capacity
+
+    def estimated_fp_rate(self) -> float:
+        """The false-positive rate expected for the keys added so far."""
+        return (1 - math.exp(-self.hashes * self.count / self.bits))**self.hashes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "count": self.count,
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "nbytes": self.nbytes,
+            "fp_rate": self.fp_rate,
+            "estimated_fp_rate": self.estimated_fp_rate(),
+        }
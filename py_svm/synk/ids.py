@@ -0,0 +1,153 @@
+"""Dense integer ids for the entities of a simulation.
+
+Entities, agents and behaviors get an `int64` id from the simulation's
+`IdAllocator` instead of a fresh 36 character uuid. Ids are what indexes,
+buffers and database rows store. The uuid of an id is only derived (and
+remembered) when it is exported outside of the simulation.
+
+Every environment owns its allocator and makes it the current one when it
+is built, so two simulations in one process never share id ranges. An
+allocator that handed out ids is never rewound: a reset starts a
+`successor` that continues after the ids that may still be alive. Code
+that isn't handed an allocator reads the current one with `allocator()`.
+"""
+import uuid
+import threading
+import contextlib
+import contextvars
+from typing import Dict, Iterator, Iterable, Optional
+
+import numpy as np
+import pyarrow as pa
+
+
+class IdAllocator:
+    """Hands out dense `int64` ids and maps them to uuids on demand.
+
+    The uuid of an id is the uuid5 of the id under the allocator's
+    `namespace`, so it is stable for a simulation and never has to be
+    stored until someone asks for it.
+
+    Attributes
+    ----------
+    namespace : `uuid.UUID`
+        The namespace the uuids of the simulation are derived from.
+    """
+
+    def __init__(self,
+                 namespace: Optional[uuid.UUID] = None,
+                 start: int = 0) -> None:
+        self.namespace = namespace or uuid.uuid4()
+        self._lock = threading.Lock()
+        self.reset(start)
+
+    def reset(self, start: int = 0) -> None:
+        """Forgets every id handed out. Only safe once none of them is
+        alive, use `successor` otherwise."""
+        with self._lock:
+            self._start = start
+            self._high = start
+            self._uuids: Dict[int, str] = {}
+            self._ids: Dict[str, int] = {}
+
+    def successor(self) -> "IdAllocator":
+        """Gets a fresh allocator, under the same namespace, that starts
+        after every id handed out by this one."""
+        with self._lock:
+            return IdAllocator(self.namespace, self._high)
+
+    def allocate(self) -> int:
+        """Gets the next free id."""
+        with self._lock:
+            entity_id = self._high
+            self._high += 1
+        return entity_id
+
+    def allocate_many(self, size: int) -> np.ndarray:
+        """Gets `size` consecutive ids as an `int64` array."""
+        with self._lock:
+            first = self._high
+            self._high += max(size, 0)
+        return np.arange(first, first + max(size, 0), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._high - self._start
+
+    def uuid(self, entity_id: int) -> str:
+        """Gets the uuid used to export `entity_id`."""
+        entity_id = int(entity_id)
+        if entity_id not in self._uuids:
+            value = str(uuid.uuid5(self.namespace, str(entity_id)))
+            self._uuids[entity_id] = value
+            self._ids[value] = entity_id
+        return self._uuids[entity_id]
+
+    def from_uuid(self, value: str) -> int:
+        """Gets the id of an exported uuid."""
+        value = str(value)
+        if value not in self._ids:
+            raise KeyError(f"Unknown uuid {value}")
+        return self._ids[value]
+
+    def uuid_table(self, ids: Optional[Iterable[int]] = None) -> pa.Table:
+        """Gets the side table of `(id, uuid)` pairs of `ids`, defaulting to every id."""
+        if ids is None:
+            ids = range(self._start, self._high)
+        ids = [int(entity_id) for entity_id in ids]
+        return pa.table({
+            "id": pa.array(ids, type=pa.int64()),
+            "uuid": pa.array([self.uuid(entity_id) for entity_id in ids],
+                             type=pa.string()),
+        })
+
+
+_CURRENT: contextvars.ContextVar[IdAllocator] = contextvars.ContextVar(
+    "id_allocator", default=IdAllocator())
+
+
+def allocator() -> IdAllocator:
+    """Gets the id allocator of the current simulation.
+
+    Returns
+    -------
+    `IdAllocator`
+        The allocator last made current with `use_allocator`, or the one
+        shared by code that runs outside of an environment.
+    """
+    return _CURRENT.get()
+
+
+def use_allocator(ids: IdAllocator) -> contextvars.Token:
+    """Makes `ids` the allocator of the current simulation.
+
+    Returns
+    -------
+    `contextvars.Token`
+        The token to restore the previous allocator with.
+    """
+    return _CURRENT.set(ids)
+
+
+@contextlib.contextmanager
+def allocating(ids: IdAllocator) -> Iterator[IdAllocator]:
+    """Makes `ids` the current allocator for the duration of the block."""
+    token = use_allocator(ids)
+    try:
+        yield ids
+    finally:
+        _CURRENT.reset(token)
+
+
+def reset(start: int = 0) -> None:
+    """Resets the current allocator, forgetting every id it handed out.
+
+    Entities that were given an id before the reset keep it, so every one
+    of them has to be dropped first. Environments use
+    `IdAllocator.successor` instead.
+    """
+    allocator().reset(start)
+
+
+def next_id() -> int:
+    """Gets the next free entity id of the current simulation."""
+    return allocator().allocate()
@@ -0,0 +1,266 @@
+"""Secondary indexes over the records of module tables.
+
+A table keeps its records by key and maintains the indexes declared on it:
+`HashIndex` answers equality lookups and `SortedIndex` answers ranges as
+well. Filters use the same shape as `dataset` queries: `{field: value}`
+matches a value and `{field: {">=": start, "<": end}}` matches a range.
+"""
+import operator
+from bisect import bisect_left, bisect_right, insort
+from typing import (Any, Set, Dict, List, Tuple, Callable, Hashable, Iterable,
+                    Iterator, Optional, Mapping)
+
+from py_svm.typings import DictAny
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda value, options: value in options,
+}
+
+
+def conditions(filter: Mapping[str, Any]) -> Iterator[Tuple[str, str, Any]]:
+    """Yields the `(field, operator, operand)` conditions of a filter."""
+    for field, condition in filter.items():
+        if isinstance(condition, Mapping):
+            for op, operand in condition.items():
+                if op not in OPERATORS:
+                    raise ValueError(f"Unknown operator '{op}' for '{field}'")
+                yield field, op, operand
+        else:
+            yield field, "==", condition
+
+
+def matches(record: Mapping[str, Any], filter: Mapping[str, Any]) -> bool:
+    """Checks a record against every condition of a filter."""
+    for field, op, operand in conditions(filter):
+        if field not in record:
+            return False
+        try:
+            if not OPERATORS[op](record[field], operand):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+class HashIndex:
+    """Maps the values of a field to the keys of the records holding them."""
+
+    kind = "hash"
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._keys: Dict[Hashable, Set[Hashable]] = {}
+
+    def add(self, key: Hashable, value: Any) -> None:
+        try:
+            self._keys.setdefault(value, set()).add(key)
+        except TypeError:
+            pass
+
+    def discard(self, key: Hashable, value: Any) -> None:
+        try:
+            keys = self._keys.get(value)
+        except TypeError:
+            return
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[value]
+
+    def supports(self, op: str) -> bool:
+        return op in ("==", "in")
+
+    def lookup(self, op: str, operand: Any) -> Set[Hashable]:
+        if op == "in":
+            found: Set[Hashable] = set()
+            for value in operand:
+                found |= self._keys.get(value, set())
+            return found
+        return set(self._keys.get(operand, ()))
+
+
+# The rank of each kind of value inside of a `SortedIndex`. Numbers (bools
+# included) share a rank so that they compare with each other like they do in
+# Python, and every other type gets a rank of its own.
+_RANKS: Dict[type, int] = {type(None): 0, bool: 1, int: 1, float: 1, str: 2,
+                           bytes: 3}
+_OTHER = 4
+
+
+def sort_key(value: Any) -> Tuple[int, str, Any]:
+    """Tags a value with its type so that values of any type can be sorted
+    together. Values of different kinds never compare with each other."""
+    rank = _RANKS.get(type(value), _OTHER)
+    if rank == 0:
+        return 0, "", 0
+    return rank, type(value).__qualname__ if rank == _OTHER else "", value
+
+
+class SortedIndex:
+    """Keeps `(sort_key(value), key)` pairs of a field sorted for equality
+    and ranges.
+
+    Ranges only span the values of the operand's kind, just like `matches`
+    doesn't match values that can't be compared with the operand. Values
+    that can't be ordered at all (dicts, mixed tuples...) are kept aside and
+    returned by every lookup, for `matches` to check.
+    """
+
+    kind = "sorted"
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._entries: List[Tuple[Tuple[int, str, Any], Any]] = []
+        self._unordered: Set[Hashable] = set()
+
+    def add(self, key: Hashable, value: Any) -> None:
+        try:
+            insort(self._entries, (sort_key(value), key))
+        except TypeError:
+            self._unordered.add(key)
+
+    def discard(self, key: Hashable, value: Any) -> None:
+        if key in self._unordered:
+            self._unordered.discard(key)
+            return
+        entry = (sort_key(value), key)
+        position = bisect_left(self._entries, entry)
+        if (position < len(self._entries) and
+                self._entries[position] == entry):
+            del self._entries[position]
+
+    def supports(self, op: str) -> bool:
+        return op in ("==", ">", ">=", "<", "<=")
+
+    def lookup(self, op: str, operand: Any) -> Set[Hashable]:
+        values = _Values(self._entries)
+        rank, name, value = sort_key(operand)
+        # "\x00" sorts after the name, so this is where the next kind starts.
+        lower = bisect_left(values, (rank, name))
+        upper = bisect_left(values, (rank, name + "\x00"))
+        try:
+            if op in ("==", ">=", ">"):
+                find = bisect_left if op != ">" else bisect_right
+                lower = find(values, (rank, name, value), lower, upper)
+            if op in ("==", "<=", "<"):
+                find = bisect_right if op != "<" else bisect_left
+                upper = find(values, (rank, name, value), lower, upper)
+        except TypeError:
+            lower = upper
+        found = {key for _, key in self._entries[lower:upper]}
+        return found | self._unordered
+
+
+class _Values:
+    """A read-only sequence of the values of sorted `(value, key)` pairs,
+    so that `bisect` compares values only."""
+
+    __slots__ = ("_entries", )
+
+    def __init__(self, entries: List[Tuple[Any, Any]]) -> None:
+        self._entries = entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, position: int) -> Any:
+        return self._entries[position][0]
+
+
+INDEX_KINDS = {"hash": HashIndex, "sorted": SortedIndex}
+
+
+class IndexedTable:
+    """The records of one table together with their secondary indexes.
+
+    `find` picks the conditions that an index can serve, starts from the
+    smallest set of rows they return and checks the remaining conditions
+    on those records only. Without a usable index it scans the table.
+    Indexes hold integer row ids, so record keys of any type can share a
+    sorted index.
+    """
+
+    def __init__(self, indexes: Mapping[str, str] = {}) -> None:
+        self.records: Dict[Hashable, DictAny] = {}
+        self.indexes: Dict[str, Any] = {}
+        self._rows: Dict[Hashable, int] = {}
+        self._keys: Dict[int, Hashable] = {}
+        self._next_row = 0
+        for field, kind in indexes.items():
+            self.create_index(field, kind)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def create_index(self, field: str, kind: str = "hash") -> None:
+        """Declares an index on `field`, building it over the current records."""
+        if kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind '{kind}'")
+        current = self.indexes.get(field)
+        if current is not None and current.kind == kind:
+            return
+        index = INDEX_KINDS[kind](field)
+        for key, record in self.records.items():
+            if field in record:
+                index.add(self._rows[key], record[field])
+        self.indexes[field] = index
+
+    def insert(self, key: Hashable, record: Mapping[str, Any]) -> DictAny:
+        """Adds (or replaces) the record of `key` and returns the stored copy."""
+        if key in self.records:
+            self.remove(key)
+        record = dict(record)
+        row = self._next_row
+        self._next_row += 1
+        self.records[key] = record
+        self._rows[key] = row
+        self._keys[row] = key
+        for field, index in self.indexes.items():
+            if field in record:
+                index.add(row, record[field])
+        return record
+
+    def remove(self, key: Hashable) -> Optional[DictAny]:
+        record = self.records.pop(key, None)
+        if record is not None:
+            row = self._rows.pop(key)
+            del self._keys[row]
+            for field, index in self.indexes.items():
+                if field in record:
+                    index.discard(row, record[field])
+        return record
+
+    def keys_of(self, filter: Mapping[str, Any]) -> List[Hashable]:
+        """Gets the keys of the records that match `filter`, oldest first."""
+        rows: Optional[Set[int]] = None
+        for field, op, operand in conditions(filter):
+            index = self.indexes.get(field)
+            if index is None or not index.supports(op):
+                continue
+            found = index.lookup(op, operand)
+            rows = found if rows is None else rows & found
+            if not rows:
+                return []
+        if rows is None:
+            keys: Iterable[Hashable] = self.records
+        else:
+            keys = [self._keys[row] for row in sorted(rows)]
+        return [key for key in keys if matches(self.records[key], filter)]
+
+    def find(self, filter: Mapping[str, Any] = {}) -> List[DictAny]:
+        """Gets copies of the records that match `filter`, so that changing
+        them can't desync the indexes."""
+        return [dict(self.records[key]) for key in self.keys_of(filter)]
+
+    def delete(self, filter: Mapping[str, Any] = {}) -> int:
+        """Removes the records that match `filter` and returns how many."""
+        keys = self.keys_of(filter)
+        for key in keys:
+            self.remove(key)
+        return len(keys)
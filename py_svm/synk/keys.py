@@ -0,0 +1,254 @@
+"""An order-preserving codec for the composite keys of the storage tiers.
+
+Every value is written as a type tag followed by a big-endian encoding
+whose bytes compare like the value does, so comparing packed keys with
+`memcmp` (bytes comparison, SQLite BLOB ordering, the LSM segments) sorts
+them like the tuples they came from. Strings and bytes end with a `0x00`
+and escape their own zeros as `0x00 0xff`, so a packed tuple is also a
+prefix of every longer tuple that starts with it.
+
+Storage keys are `(episode, module_type, module_id, slot, timestep)`. With
+the timestep last, "the latest value of a slot as of timestep t" is the
+first key of a reverse scan ending right after `t`.
+"""
+import struct
+from bisect import bisect_left
+from typing import Any, Set, List, Tuple, Iterable, Iterator, Optional
+
+from py_svm.synk.lsm import encode_key, prefix_end
+
+KEY_FIELDS = ("episode", "module_type", "module_id", "slot", "timestep")
+
+NONE_TAG = 0x00
+BYTES_TAG = 0x01
+STR_TAG = 0x02
+INT_TAG = 0x15
+FLOAT_TAG = 0x21
+
+_INT = struct.Struct(">Q")
+_FLOAT = struct.Struct(">d")
+_SIGN = 1 << 63
+
+
+def _escape(value: bytes) -> bytes:
+    return value.replace(b"\x00", b"\x00\xff") + b"\x00"
+
+
+def _pack_value(value: Any) -> bytes:
+    if value is None:
+        return bytes([NONE_TAG])
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        if not -_SIGN <= value < _SIGN:
+            raise OverflowError(f"{value} doesn't fit in a 64 bit key part")
+        return bytes([INT_TAG]) + _INT.pack(value + _SIGN)
+    if isinstance(value, float):
+        bits = _INT.unpack(_FLOAT.pack(value))[0]
+        # Negative floats flip every bit, positive ones only the sign.
+        bits = bits ^ 0xFFFFFFFFFFFFFFFF if bits & _SIGN else bits | _SIGN
+        return bytes([FLOAT_TAG]) + _INT.pack(bits)
+    if isinstance(value, str):
+        return bytes([STR_TAG]) + _escape(value.encode())
+    if isinstance(value, bytes):
+        return bytes([BYTES_TAG]) + _escape(value)
+    raise TypeError(f"Can't pack a key part of type {type(value).__name__}")
+
+
+def pack_key(*parts: Any) -> bytes:
+    """Packs a tuple of `None`, ints, floats, strings or bytes into a key."""
+    return b"".join(_pack_value(part) for part in parts)
+
+
+def _unpack_escaped(data: bytes, offset: int) -> Tuple[bytes, int]:
+    chunks = []
+    while True:
+        end = data.index(b"\x00", offset)
+        chunks.append(data[offset:end])
+        if end + 1 < len(data) and data[end + 1] == 0xFF:
+            chunks.append(b"\x00")
+            offset = end + 2
+        else:
+            return b"".join(chunks), end + 1
+
+
+def unpack_key(data: bytes) -> Tuple[Any, ...]:
+    """Unpacks a key packed by `pack_key`."""
+    parts: List[Any] = []
+    offset = 0
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        if tag == NONE_TAG:
+            parts.append(None)
+        elif tag == INT_TAG:
+            parts.append(_INT.unpack_from(data, offset)[0] - _SIGN)
+            offset += _INT.size
+        elif tag == FLOAT_TAG:
+            bits = _INT.unpack_from(data, offset)[0]
+            bits = bits ^ _SIGN if bits & _SIGN else bits ^ 0xFFFFFFFFFFFFFFFF
+            parts.append(_FLOAT.unpack(_INT.pack(bits))[0])
+            offset += _INT.size
+        elif tag in (STR_TAG, BYTES_TAG):
+            value, offset = _unpack_escaped(data, offset)
+            parts.append(value.decode() if tag == STR_TAG else value)
+        else:
+            raise ValueError(f"Unknown key tag {tag:#x} at {offset - 1}")
+    return tuple(parts)
+
+
+def storage_key(episode: Any, module_type: Any, module_id: Any, slot: Any,
+                timestep: int) -> bytes:
+    """Packs the key of the value of a slot at a timestep."""
+    return pack_key(episode, module_type, module_id, slot, timestep)
+
+
+def storage_prefix(*parts: Any) -> bytes:
+    """Packs the first parts of a storage key, e.g. `(episode, module_type)`,
+    as the prefix of every key under them."""
+    if len(parts) > len(KEY_FIELDS):
+        raise ValueError(f"A storage key only has {len(KEY_FIELDS)} parts")
+    return pack_key(*parts)
+
+
+def latest_as_of(db: Any, episode: Any, module_type: Any, module_id: Any,
+                 slot: Any, timestep: int) -> Tuple[Optional[int], Any]:
+    """Gets the latest `(timestep, value)` of a slot at or before `timestep`
+    with a single reverse seek, or `(None, None)` when there isn't one.
+
+    `db` is any database with a `reverse_scan`.
+    """
+    prefix = storage_prefix(episode, module_type, module_id, slot)
+    for key, value in db.reverse_scan(start=prefix,
+                                      end=storage_key(episode, module_type,
+                                                      module_id, slot,
+                                                      timestep + 1)):
+        return unpack_key(key)[-1], value
+    return None, None
+
+
+def key_range(prefix: Optional[Any] = None,
+              start: Optional[Any] = None,
+              end: Optional[Any] = None) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """Turns the arguments of a scan into encoded `[start, end)` bounds.
+
+    Tuples are packed with `pack_key`, so `("e", "agent")` scans the keys
+    packed from tuples that start with those parts.
+    """
+    if prefix is not None:
+        if start is not None or end is not None:
+            raise ValueError("Scan either a prefix or a range, not both")
+        prefix = scan_bound(prefix)
+        return prefix, prefix_end(prefix)
+    return (None if start is None else scan_bound(start),
+            None if end is None else scan_bound(end))
+
+
+def scan_bound(key: Any) -> bytes:
+    """Encodes a bound of a scan, packing tuples like `pack_key`."""
+    if isinstance(key, tuple):
+        return pack_key(*key)
+    return encode_key(key)
+
+
+class SortedDict(dict):
+    """A dict that can also scan its keys in encoded order.
+
+    Inserts stay O(1): new keys are only queued, and the first scan after
+    them encodes and sorts the queue and merges it into the sorted keys (a
+    sort of two sorted runs, which is linear). Deleted keys are skipped by scans and
+    dropped from the sorted keys once they're half of them.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__()
+        self._sorted: List[Tuple[bytes, Any]] = []
+        self._queued: List[Any] = []
+        # The keys present in `_sorted` or `_queued`, deleted or not.
+        self._indexed: Set[Any] = set()
+        self._stale = 0
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if key not in self._indexed:
+            self._indexed.add(key)
+            self._queued.append(key)
+        elif not dict.__contains__(self, key):
+            self._stale -= 1
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._stale += 1
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self) -> Tuple[Any, Any]:
+        key, value = super().popitem()
+        self._stale += 1
+        return key, value
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def clear(self) -> None:
+        super().clear()
+        self._sorted.clear()
+        self._queued.clear()
+        self._indexed.clear()
+        self._stale = 0
+
+    def _index(self) -> List[Tuple[bytes, Any]]:
+        if self._stale * 2 > len(self._indexed):
+            live = [item for item in self._sorted
+                    if dict.__contains__(self, item[1])]
+            live.extend((encode_key(key), key) for key in self._queued
+                        if dict.__contains__(self, key))
+            live.sort()
+            self._indexed = {key for _, key in live}
+            self._sorted, self._queued, self._stale = live, [], 0
+        elif self._queued:
+            queued = sorted((encode_key(key), key) for key in self._queued)
+            self._sorted.extend(queued)
+            self._sorted.sort()
+            self._queued = []
+        return self._sorted
+
+    def _bounds(self, start: Optional[bytes],
+                end: Optional[bytes]) -> Tuple[int, int]:
+        keys = self._index()
+        lower = 0 if start is None else bisect_left(keys, (start, ))
+        upper = len(keys) if end is None else bisect_left(keys, (end, ))
+        return lower, upper
+
+    def _items(self, items: Iterable[Tuple[bytes, Any]]
+               ) -> Iterator[Tuple[bytes, Any]]:
+        for encoded, key in items:
+            if dict.__contains__(self, key):
+                yield encoded, dict.__getitem__(self, key)
+
+    def scan(self,
+             start: Optional[bytes] = None,
+             end: Optional[bytes] = None) -> Iterator[Tuple[bytes, Any]]:
+        lower, upper = self._bounds(start, end)
+        return self._items(self._sorted[lower:upper])
+
+    def reverse_scan(
+            self,
+            start: Optional[bytes] = None,
+            end: Optional[bytes] = None) -> Iterator[Tuple[bytes, Any]]:
+        lower, upper = self._bounds(start, end)
+        return self._items(reversed(self._sorted[lower:upper]))
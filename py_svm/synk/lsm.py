@@ -0,0 +1,610 @@
+"""A small log-structured merge store for the local storage tier.
+
+Writes are appended to a write-ahead log and kept in a sorted memtable.
+Once the memtable grows past `memtable_size` bytes it's frozen and a
+background thread writes it out as an immutable, sorted segment file with a
+sparse index, then drops its log. Segments are memory-mapped for reads.
+When `compact_threshold` segments pile up they are merged into one, keeping
+only the newest version of every key.
+
+Reads look at the memtable, then the frozen memtables and then the segments,
+newest first. The live segments are listed in a `MANIFEST` file that is
+replaced atomically, so a crash never leaves half of a compaction visible.
+"""
+import os
+import mmap
+import heapq
+import pickle
+import struct
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, List, Tuple, Union, Iterator, Optional
+from pathlib import Path
+
+import orjson
+from loguru import logger as log
+
+# op, key length, value length
+RECORD = struct.Struct(">BII")
+# index offset, index entries, magic
+FOOTER = struct.Struct(">QI4s")
+MAGIC = b"LSM1"
+
+PUT = 0
+TOMBSTONE = 1
+
+Entry = Tuple[int, bytes]
+
+
+def encode_key(key: Any) -> bytes:
+    """Gets the bytes a key is stored under.
+
+    Bytes are kept as they are and strings are utf-8 encoded, which keeps
+    their order. Any other key is pickled.
+    """
+    if isinstance(key, bytes):
+        return key
+    if isinstance(key, str):
+        return key.encode()
+    return pickle.dumps(key, protocol=4)
+
+
+def prefix_end(prefix: bytes) -> Optional[bytes]:
+    """Gets the smallest key greater than every key starting with `prefix`."""
+    stripped = prefix.rstrip(b"\xff")
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
+
+
+def _ranked(scan: Iterator[Tuple[bytes, int, bytes]],
+            rank: int) -> Iterator[Tuple[bytes, int, int, bytes]]:
+    for key, op, value in scan:
+        yield key, rank, op, value
+
+
+class Memtable:
+    """The sorted in-memory table of the latest writes."""
+
+    __slots__ = ("entries", "keys", "nbytes")
+
+    def __init__(self) -> None:
+        self.entries: Dict[bytes, Entry] = {}
+        self.keys: List[bytes] = []
+        self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def put(self, key: bytes, op: int, value: bytes) -> None:
+        previous = self.entries.get(key)
+        if previous is None:
+            insort(self.keys, key)
+            self.nbytes += len(key) + RECORD.size
+        else:
+            self.nbytes -= len(previous[1])
+        self.entries[key] = (op, value)
+        self.nbytes += len(value)
+
+    def lookup(self, key: bytes) -> Optional[Entry]:
+        return self.entries.get(key)
+
+    def scan(self,
+             start: Optional[bytes] = None,
+             end: Optional[bytes] = None) -> Iterator[Tuple[bytes, int, bytes]]:
+        keys = self.keys
+        lower = 0 if start is None else bisect_left(keys, start)
+        upper = len(keys) if end is None else bisect_left(keys, end)
+        for key in keys[lower:upper]:
+            op, value = self.entries[key]
+            yield key, op, value
+
+    def reverse_scan(
+            self,
+            start: Optional[bytes] = None,
+            end: Optional[bytes] = None) -> Iterator[Tuple[bytes, int, bytes]]:
+        keys = self.keys
+        lower = 0 if start is None else bisect_left(keys, start)
+        upper = len(keys) if end is None else bisect_left(keys, end)
+        for key in reversed(keys[lower:upper]):
+            op, value = self.entries[key]
+            yield key, op, value
+
+
+class Segment:
+    """An immutable, sorted and memory-mapped file of records.
+
+    Every `index_interval`-th key is kept in memory with its offset, so a
+    lookup bisects the sparse index and reads at most one run of records.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, entries, magic = FOOTER.unpack_from(
+            self._map, len(self._map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a segment file")
+        self._end = index_offset
+        self.index_keys: List[bytes] = []
+        self.index_offsets: List[int] = []
+        position = index_offset
+        for _ in range(entries):
+            key_size, offset = struct.unpack_from(">IQ", self._map, position)
+            position += 12
+            self.index_keys.append(bytes(self._map[position:position +
+                                                   key_size]))
+            self.index_offsets.append(offset)
+            position += key_size
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._map)
+
+    @staticmethod
+    def write(path: Path,
+              records: Iterator[Tuple[bytes, int, bytes]],
+              index_interval: int = 32) -> None:
+        """Writes sorted `(key, op, value)` records as a segment file."""
+        temporary = path.with_suffix(".tmp")
+        index: List[Tuple[bytes, int]] = []
+        with open(temporary, "wb") as handle:
+            offset = 0
+            for count, (key, op, value) in enumerate(records):
+                if count % index_interval == 0:
+                    index.append((key, offset))
+                header = RECORD.pack(op, len(key), len(value))
+                handle.write(header)
+                handle.write(key)
+                handle.write(value)
+                offset += len(header) + len(key) + len(value)
+            for key, key_offset in index:
+                handle.write(struct.pack(">IQ", len(key), key_offset))
+                handle.write(key)
+            handle.write(FOOTER.pack(offset, len(index), MAGIC))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+
+    def _records(self,
+                 offset: int,
+                 end: Optional[int] = None) -> Iterator[Tuple[bytes, int, bytes]]:
+        data = self._map
+        end = self._end if end is None else end
+        while offset < end:
+            op, key_size, value_size = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            key = bytes(data[offset:offset + key_size])
+            offset += key_size
+            value = bytes(data[offset:offset + value_size])
+            offset += value_size
+            yield key, op, value
+
+    def _seek(self, key: bytes) -> int:
+        position = bisect_right(self.index_keys, key) - 1
+        return self.index_offsets[position] if position >= 0 else 0
+
+    def lookup(self, key: bytes) -> Optional[Entry]:
+        if not self.index_keys or key < self.index_keys[0]:
+            return None
+        for found, op, value in self._records(self._seek(key)):
+            if found == key:
+                return op, value
+            if found > key:
+                break
+        return None
+
+    def scan(self,
+             start: Optional[bytes] = None,
+             end: Optional[bytes] = None) -> Iterator[Tuple[bytes, int, bytes]]:
+        offset = 0 if start is None else self._seek(start)
+        for key, op, value in self._records(offset):
+            if start is not None and key < start:
+                continue
+            if end is not None and key >= end:
+                break
+            yield key, op, value
+
+    def reverse_scan(
+            self,
+            start: Optional[bytes] = None,
+            end: Optional[bytes] = None) -> Iterator[Tuple[bytes, int, bytes]]:
+        """Scans backwards one sparse index block at a time."""
+        if not self.index_keys:
+            return
+        block = (len(self.index_keys) - 1 if end is None else
+                 max(bisect_left(self.index_keys, end) - 1, 0))
+        while block >= 0:
+            stop = (self.index_offsets[block + 1]
+                    if block + 1 < len(self.index_offsets) else self._end)
+            records = list(self._records(self.index_offsets[block], stop))
+            for key, op, value in reversed(records):
+                if end is not None and key >= end:
+                    continue
+                if start is not None and key < start:
+                    return
+                yield key, op, value
+            block -= 1
+
+
+class LogStructuredStore:
+    """A persistent, sorted key/value store made of a memtable and segments.
+
+    Keys are stored as bytes (see `encode_key`) and values are pickled. The
+    store can be used like a dict.
+
+    Attributes
+    ----------
+    path : `Path`
+        The directory holding the logs, the segments and the manifest.
+    memtable_size : int
+        The number of bytes after which the memtable is frozen and flushed.
+    index_interval : int
+        The number of records between two entries of a segment's sparse index.
+    compact_threshold : int
+        The number of segments that triggers a compaction.
+    background : bool
+        If flushes and compactions run on a background thread. When off they
+        run in the thread that froze the memtable.
+    fsync : bool
+        If every write to the log is synced to disk. Writes are always
+        handed to the OS, so they survive the process crashing.
+    """
+
+    def __init__(self,
+                 path: Union[str, Path],
+                 memtable_size: int = 4 * 1024 * 1024,
+                 index_interval: int = 32,
+                 compact_threshold: int = 4,
+                 background: bool = True,
+                 fsync: bool = False) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.memtable_size = memtable_size
+        self.index_interval = max(index_interval, 1)
+        self.compact_threshold = max(compact_threshold, 2)
+        self.background = background
+        self.fsync = fsync
+
+        self._lock = threading.RLock()
+        self._work = threading.Condition(self._lock)
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        # Frozen memtables waiting for a flush, oldest first, with their log.
+        self._frozen: List[Tuple[Memtable, Path]] = []
+        # Live segments, newest first.
+        self._segments: List[Segment] = []
+        self._sequence = 0
+        self._compacting = False
+        self._open()
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._thread = threading.Thread(target=self._run,
+                                            name=f"lsm-{self.path.name}",
+                                            daemon=True)
+            self._thread.start()
+
+    # -- files ----------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.path / "MANIFEST"
+
+    def _next_sequence(self) -> int:
+        self._sequence += 1
+        return self._sequence
+
+    def _write_manifest(self) -> None:
+        temporary = self.manifest_path.with_suffix(".tmp")
+        temporary.write_bytes(
+            orjson.dumps([segment.path.name for segment in self._segments]))
+        os.replace(temporary, self.manifest_path)
+
+    def _open(self) -> None:
+        names: List[str] = []
+        if self.manifest_path.exists():
+            names = orjson.loads(self.manifest_path.read_bytes())
+        self._segments = [Segment(self.path / name) for name in names]
+        numbers = [int(name.split("-")[1].split(".")[0]) for name in names]
+        logs = sorted(self.path.glob("log-*.wal"))
+        numbers += [int(log_path.stem.split("-")[1]) for log_path in logs]
+        self._sequence = max(numbers, default=0)
+        # Segments that aren't in the manifest are leftovers of a crash.
+        for stray in self.path.glob("seg-*"):
+            if stray.name not in names:
+                stray.unlink()
+        self._memtable = Memtable()
+        for log_path in logs:
+            self._replay(log_path)
+        self._log_path = self.path / f"log-{self._next_sequence():012d}.wal"
+        self._log = open(self._log_path, "ab")
+        # Rewrite the recovered writes into the new log, so the old logs can
+        # go away.
+        for key, op, value in self._memtable.scan():
+            self._append(key, op, value)
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        for log_path in logs:
+            log_path.unlink()
+
+    def _replay(self, log_path: Path) -> None:
+        data = log_path.read_bytes()
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            op, key_size, value_size = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size
+            stop = start + key_size + value_size
+            if stop > len(data):
+                log.warning(f"Dropping a torn record at the end of {log_path}")
+                break
+            key = data[start:start + key_size]
+            self._memtable.put(key, op, data[start + key_size:stop])
+            offset = stop
+
+    def _append(self, key: bytes, op: int, value: bytes) -> None:
+        self._log.write(RECORD.pack(op, len(key), len(value)))
+        self._log.write(key)
+        self._log.write(value)
+
+    # -- writes ---------------------------------------------------------
+
+    def _write(self, key: bytes, op: int, value: bytes) -> None:
+        with self._lock:
+            if self._error is not None:
+                raise RuntimeError("The store's background thread failed"
+                                   ) from self._error
+            self._append(key, op, value)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._memtable.put(key, op, value)
+            if self._memtable.nbytes >= self.memtable_size:
+                self._freeze()
+
+    def set(self, key: Any, value: Any) -> None:
+        self._write(encode_key(key), PUT, pickle.dumps(value, protocol=4))
+
+    def delete(self, key: Any) -> None:
+        self._write(encode_key(key), TOMBSTONE, b"")
+
+    def _freeze(self) -> None:
+        if not len(self._memtable):
+            return
+        self._log.close()
+        self._frozen.append((self._memtable, self._log_path))
+        self._memtable = Memtable()
+        self._log_path = self.path / f"log-{self._next_sequence():012d}.wal"
+        self._log = open(self._log_path, "ab")
+        if self.background:
+            self._work.notify()
+        else:
+            self._flush_frozen()
+            self._maybe_compact()
+
+    # -- background work ------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._frozen and not self._needs_compaction(
+                ) and not self._closed:
+                    self._work.wait()
+                if self._closed and not self._frozen:
+                    return
+            try:
+                self._flush_frozen()
+                self._maybe_compact()
+            except BaseException as error:
+                log.exception(error)
+                with self._lock:
+                    self._error = error
+                    self._work.notify_all()
+                return
+
+    def _flush_frozen(self) -> None:
+        while True:
+            with self._lock:
+                if not self._frozen:
+                    self._work.notify_all()
+                    return
+                memtable, log_path = self._frozen[0]
+                path = self.path / f"seg-{self._next_sequence():012d}.sst"
+            Segment.write(path, memtable.scan(), self.index_interval)
+            segment = Segment(path)
+            with self._lock:
+                self._segments.insert(0, segment)
+                self._write_manifest()
+                self._frozen.pop(0)
+            log_path.unlink()
+
+    def _needs_compaction(self) -> bool:
+        return not self._compacting and len(
+            self._segments) >= self.compact_threshold
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            if not self._needs_compaction():
+                return
+            self._compacting = True
+            merged = list(self._segments)
+            path = self.path / f"seg-{self._next_sequence():012d}.sst"
+        try:
+            # The oldest segment is part of the merge, so tombstones have
+            # nothing left to hide and are dropped.
+            records = (record
+                       for record in self._merge([s.scan() for s in merged])
+                       if record[1] != TOMBSTONE)
+            Segment.write(path, records, self.index_interval)
+            segment = Segment(path)
+            with self._lock:
+                newer = self._segments[:len(self._segments) - len(merged)]
+                self._segments = newer + [segment]
+                self._write_manifest()
+        finally:
+            with self._lock:
+                self._compacting = False
+                self._work.notify_all()
+        for old in merged:
+            old.path.unlink()
+
+    def compact(self) -> None:
+        """Flushes the memtable and merges every segment into one."""
+        with self._lock:
+            self._freeze()
+        self.wait()
+        with self._lock:
+            while self._compacting:
+                self._work.wait()
+            if len(self._segments) < 2:
+                return
+            threshold, self.compact_threshold = self.compact_threshold, 2
+        try:
+            self._maybe_compact()
+        finally:
+            self.compact_threshold = threshold
+
+    def wait(self) -> None:
+        """Waits until every frozen memtable has been flushed."""
+        with self._lock:
+            while self._frozen and self._error is None:
+                if not self.background:
+                    self._flush_frozen()
+                    break
+                self._work.wait()
+            if self._error is not None:
+                raise RuntimeError("The store's background thread failed"
+                                   ) from self._error
+
+    # -- reads ----------------------------------------------------------
+
+    def _sources(self) -> List[Any]:
+        """Everything that holds records, newest first."""
+        with self._lock:
+            return ([self._memtable] +
+                    [memtable for memtable, _ in reversed(self._frozen)] +
+                    list(self._segments))
+
+    def probe(self, key: Any, default: Any = None) -> Any:
+        encoded = encode_key(key)
+        for source in self._sources():
+            entry = source.lookup(encoded)
+            if entry is not None:
+                op, value = entry
+                return default if op == TOMBSTONE else pickle.loads(value)
+        return default
+
+    get = probe
+
+    @staticmethod
+    def _merge(
+        scans: List[Iterator[Tuple[bytes, int, bytes]]]
+    ) -> Iterator[Tuple[bytes, int, bytes]]:
+        """Merges sorted scans ordered newest first, keeping the newest
+        record of every key."""
+        ranked = [_ranked(scan, rank) for rank, scan in enumerate(scans)]
+        previous = None
+        for key, _, op, value in heapq.merge(*ranked):
+            if key == previous:
+                continue
+            previous = key
+            yield key, op, value
+
+    def scan(self,
+             start: Optional[Any] = None,
+             end: Optional[Any] = None) -> Iterator[Tuple[bytes, Any]]:
+        """Yields the `(key, value)` pairs with `start <= key < end` in key order."""
+        start = None if start is None else encode_key(start)
+        end = None if end is None else encode_key(end)
+        scans = [source.scan(start, end) for source in self._sources()]
+        for key, op, value in self._merge(scans):
+            if op != TOMBSTONE:
+                yield key, pickle.loads(value)
+
+    def reverse_scan(
+            self,
+            start: Optional[Any] = None,
+            end: Optional[Any] = None) -> Iterator[Tuple[bytes, Any]]:
+        """Yields the `(key, value)` pairs with `start <= key < end` in
+        descending key order."""
+        start = None if start is None else encode_key(start)
+        end = None if end is None else encode_key(end)
+        scans = [source.reverse_scan(start, end) for source in self._sources()]
+        ranked = [_ranked(scan, rank) for rank, scan in enumerate(scans)]
+        previous = None
+        # Keys descend, and the newest source wins among equal keys.
+        for key, _, op, value in heapq.merge(
+                *ranked, key=lambda record: (record[0], -record[1]),
+                reverse=True):
+            if key == previous:
+                continue
+            previous = key
+            if op != TOMBSTONE:
+                yield key, pickle.loads(value)
+
+    def scan_prefix(self, prefix: Any) -> Iterator[Tuple[bytes, Any]]:
+        """Yields the `(key, value)` pairs whose key starts with `prefix`."""
+        prefix = encode_key(prefix)
+        return self.scan(prefix, prefix_end(prefix))
+
+    # -- dict interface ---------------------------------------------------
+
+    def __contains__(self, key: Any) -> bool:
+        encoded = encode_key(key)
+        for source in self._sources():
+            entry = source.lookup(encoded)
+            if entry is not None:
+                return entry[0] != TOMBSTONE
+        return False
+
+    def __getitem__(self, key: Any) -> Any:
+        encoded = encode_key(key)
+        for source in self._sources():
+            entry = source.lookup(encoded)
+            if entry is not None:
+                if entry[0] == TOMBSTONE:
+                    break
+                return pickle.loads(entry[1])
+        raise KeyError(key)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.delete(key)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return (key for key, _ in self.scan())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.scan())
+
+    # -- lifecycle --------------------------------------------------------
+
+    @property
+    def segments(self) -> int:
+        return len(self._segments)
+
+    def close(self) -> None:
+        """Flushes the memtable into a segment and stops the background thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._freeze()
+        self.wait()
+        with self._lock:
+            self._closed = True
+            self._work.notify_all()
+            self._log.close()
+        if self._thread is not None:
+            self._thread.join()
+        if self._log_path.exists() and not self._log_path.stat().st_size:
+            self._log_path.unlink()
+
+    def __enter__(self) -> "LogStructuredStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, trace) -> None:
+        self.close()
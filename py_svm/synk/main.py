@@ -4,15 +4,19 @@ import random
 import random as rand
 import time
 import numpy as np
-from typing import Any, Tuple
+from typing import Any, List, Tuple
 import warnings
 import gym
 from loguru import logger as log
+from pydantic import PrivateAttr
 from py_svm.core import registry
 from py_svm.synk.abcs.resource import Clock
 
 from py_svm.utils import get_uuid
+from py_svm.synk.ids import IdAllocator
+from py_svm.synk.ids import use_allocator
 from py_svm.synk.module import Module
+from py_svm.synk.abcs.population import AgentPopulation
 from py_svm.synk.abcs.equipment import Action
 from py_svm.synk.abcs.equipment import Metrics
 from py_svm.synk.abcs.equipment import Decision
@@ -63,7 +67,8 @@ class Instrument(DataModule):
 
 def add_episode(instance: Module, action: Action, *args, **kwds) -> Any:
     """Add an episode to all modules and resources."""
-    action_episode = str(action.episode)
+    action_episode = instance.episode if action.episode is None else str(
+        action.episode)
     instance.episode = action_episode
     for module in instance.modules():
         module.episode = action_episode
@@ -81,18 +86,46 @@ def add_episode(instance: Module, action: Action, *args, **kwds) -> Any:
 class AgentEnvAbstract(gym.Env, Module, abc.ABC):
     module_type: str = "env"
 
+    _ids: IdAllocator = PrivateAttr(default_factory=IdAllocator)
+
     def __pre_init__(self, *args, **kwds):
         # log.info("Initializing environment")
         self.register_init_hooks()
 
+    def __init__(self, **data) -> None:
+        super().__init__(**data)
+        # Entities built by subclasses after this already get their ids
+        # from the environment.
+        use_allocator(self._ids)
+
     def register_init_hooks(self) -> None:
         """Initialize hooks that you'd want registered for everything."""
         self.register_step_prehook(add_episode)
 
+    @property
+    def ids(self) -> IdAllocator:
+        """The id allocator of the entities of this environment."""
+        return self._ids
+
+    @property
+    def populations(self) -> List[AgentPopulation]:
+        """Every agent population of the environment."""
+        return [
+            module for module in self.modules()
+            if isinstance(module, AgentPopulation)
+        ]
+
     def reset(self):
         super().reset()
         if not self.episode:
             self.episode = get_uuid()
+        # Live entities keep their ids, so the episode gets a fresh
+        # allocator that continues after them, and the agents of the last
+        # episode are dropped.
+        self._ids = self._ids.successor()
+        use_allocator(self._ids)
+        for population in self.populations:
+            population.clear()
 
 
 class AgentEnv(AgentEnvAbstract):
@@ -117,7 +150,7 @@ class AgentEnv(AgentEnvAbstract):
         """ Get the current state of the environment and spawn an agent with the specifications. """
         # There should be an accessible state from an environment variable.
         states = self.get_state()
-        states["agents"].append({"name": "agent", "agent_id:": get_uuid()})
+        states["agents"].append({"name": "agent", "agent_id": self.ids.allocate()})
         return states
 
     def reset(self):
@@ -135,6 +168,13 @@ class AgentEnv(AgentEnvAbstract):
 
         log.opt(depth=2).debug(self.clock.step)
 
+        for population in self.populations:
+            population.step()
+        for scheduler in self.schedulers:
+            scheduler.step()
+        # The step barrier: what was sent during the step becomes readable.
+        for mailbox in self.mailboxes:
+            mailbox.deliver()
         self.clock.walk()
 
         return Metrics(name="metrics",
@@ -1,7 +1,7 @@
 # from posixpath import split
 # Standard Library
-from typing import (Any, Iterable, Set, Dict, Tuple, Callable, ClassVar,
-                    Iterator, Optional, cast)
+from typing import (Any, Iterable, List, Set, Dict, Tuple, Callable,
+                    ClassVar, Iterator, Optional, cast)
 
 from loguru import logger as log
 import pyrsistent
@@ -14,6 +14,8 @@ from py_svm.synk.abcs.base import ModuleBase
 from py_svm.synk.abcs.base import ResourceBase
 from py_svm.synk.abcs.actions import DBActions
 from py_svm.synk.abcs.resource import Clock
+from py_svm.synk.abcs.mailbox import Mailbox
+from py_svm.synk.abcs.scheduler import BaseScheduler
 
 
 class Module(ModuleBase, DBActions):
@@ -32,6 +34,22 @@ class Module(ModuleBase, DBActions):
     def clock(self) -> Clock:
         return cast(Clock, self.resource("clock"))
 
+    @property
+    def schedulers(self) -> List[BaseScheduler]:
+        """Every scheduler resource registered in the simulation."""
+        return [
+            resource for resource in self.resources
+            if isinstance(resource, BaseScheduler)
+        ]
+
+    @property
+    def mailboxes(self) -> List[Mailbox]:
+        """Every mailbox resource registered in the simulation."""
+        return [
+            resource for resource in self.resources
+            if isinstance(resource, Mailbox)
+        ]
+
     def resource(self, name) -> Optional['ResourceBase']:
         """Get a single resource from the simulation."""
         return registry.get_module("resource", name)  # type: ignore
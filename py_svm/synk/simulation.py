@@ -0,0 +1,154 @@
+"""Copy-on-write simulations that can be forked for Monte-Carlo branching."""
+from typing import Any, List, Tuple, Optional
+
+import pyrsistent
+from eth_utils import ValidationError  # type: ignore
+
+from py_svm.synk.storage import MISSING, DELETE_WRAPPED, StorageModel
+from py_svm.synk.abcs.base import ModuleBase
+
+
+class Simulation:
+    """A copy-on-write view of the state of a simulation.
+
+    Every write goes into a persistent map (`pyrsistent.PMap`) layered over
+    a `StorageModel` that all the branches share. `fork` hands the current
+    map to the new branch, so forking costs O(1) and the branches share
+    every entry none of them has written since. Only writes allocate.
+
+    Module state can live in the same map through `save_module` and
+    `load_module`, which store the fields of a module as a frozen map.
+
+    A simulation tracks its forks until they are adopted or discarded, and
+    adopting one fork discards its siblings, so that the parent can commit
+    again.
+
+    Attributes
+    ----------
+    storage : `StorageModel`
+        The storage shared by the simulation and its forks.
+    timestep : int
+        The timestep the simulation is at.
+    parent : `Simulation`, optional
+        The simulation this one was forked from.
+    """
+
+    def __init__(self,
+                 storage: Optional[StorageModel] = None,
+                 timestep: int = 0) -> None:
+        self.storage = storage if storage is not None else StorageModel()
+        self.timestep = timestep
+        self.parent: Optional["Simulation"] = None
+        self._changes: pyrsistent.PMap = pyrsistent.pmap()
+        self._forks: List["Simulation"] = []
+
+    @property
+    def changes(self) -> pyrsistent.PMap:
+        """The writes made on top of the shared storage."""
+        return self._changes
+
+    @property
+    def forks(self) -> List["Simulation"]:
+        """The forks of the simulation that were neither adopted nor
+        discarded."""
+        return list(self._forks)
+
+    def set(self, key, value) -> None:
+        self._changes = self._changes.set(key, value)
+
+    def delete(self, key) -> None:
+        self._changes = self._changes.set(key, DELETE_WRAPPED)
+
+    def probe(self, key) -> Any:
+        value = self._changes.get(key, MISSING)
+        if value is DELETE_WRAPPED:
+            return MISSING
+        if value is not MISSING:
+            return value
+        if not self.storage.exists(key):
+            return MISSING
+        return self.storage.get(key)
+
+    def get(self, key) -> Any:
+        value = self.probe(key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def exists(self, key) -> bool:
+        return self.probe(key) is not MISSING
+
+    def fork(self) -> "Simulation":
+        """Creates a branch that starts from the current state."""
+        branch = Simulation.__new__(Simulation)
+        branch.storage = self.storage
+        branch.timestep = self.timestep
+        branch.parent = self
+        branch._changes = self._changes
+        branch._forks = []
+        self._forks.append(branch)
+        return branch
+
+    def fork_many(self, count: int) -> List["Simulation"]:
+        """Creates `count` branches that start from the current state."""
+        return [self.fork() for _ in range(count)]
+
+    def discard(self, branch: "Simulation") -> None:
+        """Stops tracking a fork, which shouldn't be used afterwards."""
+        self._forks = [fork for fork in self._forks if fork is not branch]
+
+    def adopt(self, branch: "Simulation") -> None:
+        """Continues the simulation from the state of one of its forks.
+
+        The other forks branched off a state the simulation moved past, so
+        they are discarded.
+        """
+        if not any(fork is branch for fork in self._forks):
+            raise ValidationError("Can only adopt a fork of this simulation")
+        self._changes = branch._changes
+        self.timestep = branch.timestep
+        self._forks = []
+
+    def commit(self) -> None:
+        """Writes the changes into the shared storage.
+
+        Only a root simulation without tracked forks can commit, since the
+        forks read the shared storage for every key they haven't written.
+        """
+        if self.parent is not None:
+            raise ValidationError(
+                "Forks can't commit, adopt them into their parent instead")
+        if len(self._forks):
+            raise ValidationError(
+                "Can't commit before the forks are adopted or discarded")
+        for key, value in self._changes.items():
+            if value is DELETE_WRAPPED:
+                if self.storage.exists(key):
+                    self.storage.delete(key)
+            else:
+                self.storage.set(key, value)
+        self.storage.commit()
+        self._changes = pyrsistent.pmap()
+
+    @staticmethod
+    def module_key(module: ModuleBase) -> Tuple[str, str, str, Optional[int]]:
+        """Keys the state of a module by its entity (or behavior) id. Modules
+        without one are unique per class, like in the registry."""
+        module_id = getattr(module, "entity_id", None)
+        if module_id is None:
+            module_id = getattr(module, "behavior_id", None)
+        return ("module", str(module.module_type), type(module).__name__,
+                module_id)
+
+    def save_module(self, module: ModuleBase) -> None:
+        """Stores the fields of `module`, unless they didn't change."""
+        key = self.module_key(module)
+        state = pyrsistent.freeze(module.dict())
+        if self._changes.get(key, MISSING) != state:
+            self.set(key, state)
+
+    def load_module(self, module: ModuleBase) -> None:
+        """Sets the fields of `module` to the ones stored in the simulation."""
+        state = self.get(self.module_key(module))
+        for name, value in pyrsistent.thaw(state).items():
+            setattr(module, name, value)
@@ -1,16 +1,23 @@
 # from py_svm.synk.abc import DatabaseAPI
 # Standard Library
 import abc
+import sys
+import math
+import time
 import uuid
-from typing import (Any, cast, Dict, List, Union, Callable, Iterator, Optional,
-                    MutableMapping)
+import queue
+import threading
+from operator import itemgetter
+from collections import OrderedDict
+from typing import (Any, cast, Dict, List, Tuple, Union, Mapping, Callable,
+                    Iterator, Optional, MutableMapping)
 from pathlib import Path
-from itertools import count
-from contextvars import Context
-from contextvars import ContextVar
+from itertools import count, islice
 from contextvars import copy_context
 
 import anyio
+import pyarrow as pa
+import pyarrow.dataset as ds
 from loguru import logger as log
 from devtools import debug
 from diskcache import Cache
@@ -19,7 +26,12 @@ from eth_utils.toolz import nth  # type: ignore
 from eth_utils.toolz import first  # type: ignore
 
 from py_svm.typings import JournalDBCheckpoint
+from py_svm.synk.lsm import encode_key, LogStructuredStore
+from py_svm.synk.bloom import BloomFilter
+from py_svm.synk.keys import SortedDict, key_range
+from py_svm.synk.indexes import IndexedTable
 from py_svm.synk.models import Metadata
+from py_svm.synk.abcs.context import ContextControl
 
 
 class DeletedEntry:
@@ -43,6 +55,14 @@ ChangesetValue = Union[bytes, DeletedEntry]
 ChangesetDict = Dict[bytes, ChangesetValue]
 
 
+class MissingEntry:
+    pass
+
+
+# Returned by `probe` when a key isn't stored in a database.
+MISSING = MissingEntry()
+
+
 class DatabaseAPI(MutableMapping, abc.ABC):
 
     def __init__(self):
@@ -60,6 +80,13 @@ class DatabaseAPI(MutableMapping, abc.ABC):
     def exists(self, key, **kwargs) -> bool:
         raise NotImplementedError("'Exist' function not implemented")
 
+    def probe(self, key) -> Any:
+        """Gets the value of `key`, or `MISSING`, in a single lookup when the
+        database supports it."""
+        if not self.exists(key):
+            return MISSING
+        return self.get(key)
+
     def __contains__(self, key):
         if hasattr(self, "exists"):
             return self.exists(key)
@@ -80,11 +107,61 @@ class DatabaseAPI(MutableMapping, abc.ABC):
             return self.delete(key)
         return super().__delitem__(key)
 
+    def scan(self,
+             prefix: Optional[Any] = None,
+             *,
+             start: Optional[Any] = None,
+             end: Optional[Any] = None) -> Iterator[Tuple[bytes, Any]]:
+        """Yields `(key, value)` pairs in key order.
+
+        Scans the keys that start with `prefix`, or the keys in
+        `[start, end)`. Keys are compared and yielded in their encoded form
+        (see `py_svm.synk.keys`), so keys packed with `pack_key` come back
+        in tuple order. Tuple bounds are packed the same way.
+        """
+        lower, upper = key_range(prefix, start, end)
+        return self._scan(lower, upper, reverse=False)
+
+    def reverse_scan(self,
+                     prefix: Optional[Any] = None,
+                     *,
+                     start: Optional[Any] = None,
+                     end: Optional[Any] = None) -> Iterator[Tuple[bytes, Any]]:
+        """Like `scan`, in descending key order."""
+        lower, upper = key_range(prefix, start, end)
+        return self._scan(lower, upper, reverse=True)
+
+    def _scan(self, start: Optional[bytes], end: Optional[bytes],
+              reverse: bool) -> Iterator[Tuple[bytes, Any]]:
+        # Ordered caches (`SortedDict`, `LogStructuredStore`) seek; plain
+        # dicts are sorted on every scan.
+        cache = getattr(self, "cache", None)
+        if cache is None:
+            raise NotImplementedError(
+                f"{type(self).__name__} doesn't support scans")
+        method = "reverse_scan" if reverse else "scan"
+        if hasattr(cache, method):
+            return getattr(cache, method)(start, end)
+        items = sorted(((encode_key(key), value)
+                        for key, value in list(cache.items())),
+                       key=itemgetter(0),
+                       reverse=reverse)
+        return ((key, value)
+                for key, value in items
+                if (start is None or key >= start) and (
+                    end is None or key < end))
+
     def __iter__(self) -> Iterator[Any]:
-        return super().__iter__()
+        cache = getattr(self, "cache", None)
+        if cache is not None:
+            return iter(cache)
+        return (key for key, _ in self.scan())
 
     def __len__(self) -> int:
-        return super().__len__()
+        cache = getattr(self, "cache", None)
+        if cache is not None:
+            return len(cache)
+        return sum(1 for _ in self.scan())
 
     def use_if_exists(self, name: str, *args, **kwargs):
         if hasattr(self, name):
@@ -95,31 +172,214 @@ class DatabaseAPI(MutableMapping, abc.ABC):
 # class BaseDB(DatabaseAPI):
 
 
+def approximate_size(key, value) -> int:
+    """A cheap estimate of the bytes held by a cache entry."""
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
 class CacheDB(DatabaseAPI):
+    """The hot tier of the storage layer.
+
+    Without limits the cache is a plain dict. With `max_entries` and/or
+    `max_bytes` set, entries are evicted to stay within the limits:
+
+    * ``lru`` evicts the least recently used entry.
+    * ``lfu`` samples the `sample_size` least recently used entries and
+      evicts the least frequently used of them, like Redis' approximated LFU.
+    * ``fifo`` evicts the oldest written entry.
+
+    With `ttl` set, entries also expire `ttl` seconds after they were
+    written, whatever the policy. Expired entries are swept on writes, so
+    they don't pile up in an unbounded cache that never reads them again.
+    `on_evict` is called with the key and value of every evicted or expired
+    entry, which is where they can be demoted to a lower tier (see
+    `demote_to`).
+
+    Attributes
+    ----------
+    hits, misses, evictions, expirations : int
+        Counters of the lookups and removals the cache has done.
+    resident_bytes : int
+        The approximate number of bytes held by the entries.
+    """
+
+    POLICIES = ("lru", "lfu", "fifo")
+
+    def __init__(self,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 policy: str = "lru",
+                 ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Any, Any], None]] = None,
+                 sample_size: int = 5,
+                 sizeof: Callable[[Any, Any], int] = approximate_size):
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"Unknown policy {policy}, expected one of {self.POLICIES}")
+        self.cache: "OrderedDict[Any, Any]" = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.sample_size = sample_size
+        self.sizeof = sizeof
+        self._sizes: Dict[Any, int] = {}
+        self._frequency: Dict[Any, int] = {}
+        self._expires: Dict[Any, float] = {}
+        self.reset_stats()
+        self.resident_bytes = 0
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "resident_bytes": self.resident_bytes,
+        }
 
-    def __init__(self):
-        self.cache = {}
+    @property
+    def is_bounded(self) -> bool:
+        return self.max_entries is not None or self.max_bytes is not None
+
+    def _pop(self, key) -> Any:
+        value = self.cache.pop(key)
+        self.resident_bytes -= self._sizes.pop(key, 0)
+        self._frequency.pop(key, None)
+        self._expires.pop(key, None)
+        return value
+
+    def _expire(self, key) -> None:
+        value = self._pop(key)
+        self.expirations += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def _expired(self, key) -> bool:
+        if self.ttl is None or self._expires.get(key, math.inf) > time.monotonic():
+            return False
+        self._expire(key)
+        return True
+
+    def _sweep(self, now: float) -> None:
+        # `_expires` is kept in write order and the ttl is the same for every
+        # entry, so the expired entries are the ones at its front.
+        while self._expires:
+            key, deadline = next(iter(self._expires.items()))
+            if deadline > now:
+                break
+            self._expire(key)
+
+    def _touch(self, key) -> None:
+        if self.policy != "fifo":
+            self.cache.move_to_end(key)
+        if self.policy == "lfu":
+            self._frequency[key] = self._frequency.get(key, 0) + 1
+
+    def _victim(self) -> Any:
+        if self.policy != "lfu":
+            return next(iter(self.cache))
+        sample = islice(self.cache, self.sample_size)
+        return min(sample, key=lambda key: self._frequency.get(key, 0))
+
+    def _evict(self) -> None:
+        while self.cache and (
+            (self.max_entries is not None and len(self.cache) > self.max_entries) or
+            (self.max_bytes is not None and self.resident_bytes > self.max_bytes)):
+            key = self._victim()
+            value = self._pop(key)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(key, value)
 
     def set(self, key, value):
+        if key in self.cache:
+            self.resident_bytes -= self._sizes[key]
         self.cache[key] = value
+        size = self.sizeof(key, value)
+        self._sizes[key] = size
+        self.resident_bytes += size
+        if self.ttl is not None:
+            now = time.monotonic()
+            self._expires.pop(key, None)
+            self._expires[key] = now + self.ttl
+            self._sweep(now)
+        self._touch(key)
+        if self.is_bounded:
+            self._evict()
+
+    def probe(self, key) -> Any:
+        value = self.cache.get(key, MISSING)
+        if value is MISSING or self._expired(key):
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        self._touch(key)
+        return value
 
     def get(self, key):
-        return self.cache.get(key)
+        value = self.probe(key)
+        return None if value is MISSING else value
 
     def delete(self, key):
-        del self.cache[key]
+        self._pop(key)
 
     def exists(self, key) -> bool:
-        return key in self.cache
+        return key in self.cache and not self._expired(key)
 
     def remove(self, key):
         self.delete(key)
 
 
+def demote_to(db: DatabaseAPI) -> Callable[[Any, Any], None]:
+    """Gets an `on_evict` callback that writes evicted entries into `db`."""
+
+    def demote(key, value) -> None:
+        db.set(key, value)
+
+    return demote
+
+
 class LocalDB(DatabaseAPI):
+    """The local storage tier.
+
+    Without a `path` the tier is a `SortedDict` that only lives as long as
+    the process. With one, it is a `LogStructuredStore` in that directory,
+    so the local state survives restarts without a database server. Both
+    keep their keys sorted, so scans seek instead of sorting.
+
+    Parameters
+    ----------
+    path : str or `Path`, optional
+        The directory of the persistent store.
+    options :
+        Passed on to `LogStructuredStore`.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, **options):
+        self.path = path
+        self.cache = (SortedDict()
+                      if path is None else LogStructuredStore(path, **options))
 
-    def __init__(self):
-        self.cache = {}
+    @property
+    def is_persistent(self) -> bool:
+        return self.path is not None
+
+    def scan_prefix(self, prefix) -> Iterator[Any]:
+        """Yields the `(key, value)` pairs whose key starts with `prefix`."""
+        return self.scan(prefix)
+
+    def close(self) -> None:
+        if self.is_persistent:
+            self.cache.close()
 
     def set(self, key, value):
         self.cache[key] = value
@@ -133,147 +393,771 @@ class LocalDB(DatabaseAPI):
     def exists(self, key) -> bool:
         return key in self.cache
 
+    def probe(self, key) -> Any:
+        return self.cache.get(key, MISSING)
+
     def remove(self, key):
         self.delete(key)
 
 
+# What `AnalysisDB.dataset` returns for a table that was never rolled.
+EMPTY_TABLE = pa.table({
+    "episode": pa.array([], pa.string()),
+    "timestep": pa.array([], pa.int64()),
+})
+
+
+def _unify_tables(tables: List[pa.Table]) -> pa.Table:
+    """Concatenates tables whose columns differ, filling the gaps with nulls."""
+    schema = pa.unify_schemas([table.schema for table in tables])
+    unified = []
+    for table in tables:
+        columns = [
+            table.column(field.name).cast(field.type)
+            if field.name in table.column_names else pa.nulls(
+                table.num_rows, field.type) for field in schema
+        ]
+        unified.append(pa.Table.from_arrays(columns, schema=schema))
+    return pa.concat_tables(unified)
+
+
 class AnalysisDB(DatabaseAPI):
+    """The analytics tier, which stores rows as Arrow and Parquet.
+
+    Values written to the tier are kept by key like in the other tiers.
+    Values that are mappings with a `module_type` and a `module_name` are
+    also rows of the `(module_type, module_name)` table. Rows are turned
+    into Arrow record batches every `batch_size` rows, and once a table
+    holds `row_group_size` rows the batches are rolled into Parquet files
+    under `path/<module_type>/<module_name>/episode=<episode>/`.
+
+    Without a `path` rolled tables stay in memory. Either way `dataset`
+    and `query` expose them as a `pyarrow.dataset`, so filters on the
+    episode and the timestep prune partitions and row groups.
+
+    Keyed values are written through to a `LocalDB` under `path/_values`
+    and only the `cache_size` most recently used ones stay in memory, in
+    front of it. Without a `path` that `LocalDB` is in memory too, so the
+    tier is only bounded when it has a directory.
+
+    Parameters
+    ----------
+    path : str or `Path`, optional
+        The root directory of the Parquet datasets.
+    batch_size : int, default 1024
+        The number of rows of a record batch.
+    row_group_size : int, default 65536
+        The number of rows of a Parquet row group, and the number of rows
+        that triggers a roll.
+    cache_size : int, default 100000
+        The number of keyed values kept in memory.
+    """
+
+    VALUES_DIR = "_values"
+
+    def __init__(self,
+                 path: Optional[Union[str, Path]] = None,
+                 batch_size: int = 1024,
+                 row_group_size: int = 65_536,
+                 cache_size: int = 100_000):
+        self.path = None if path is None else Path(path)
+        self.values = LocalDB(
+            None if self.path is None else self.path / self.VALUES_DIR)
+        self.hot = CacheDB(max_entries=max(cache_size, 1))
+        self.batch_size = max(batch_size, 1)
+        self.row_group_size = max(row_group_size, 1)
+        self._lock = threading.RLock()
+        self._rows: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._batches: Dict[Tuple[str, str], List[pa.RecordBatch]] = {}
+        self._tables: Dict[Tuple[str, str], List[pa.Table]] = {}
+        self._rolls = count()
 
-    def __init__(self):
-        self.cache = {}
+    @property
+    def cache(self) -> MutableMapping:
+        """Every keyed value of the tier; what scans and iteration read."""
+        return self.values.cache
 
     def set(self, key, value):
-        self.cache[key] = value
+        self.values.set(key, value)
+        self.hot.set(key, value)
+        if (isinstance(value, Mapping) and "module_type" in value and
+                "module_name" in value):
+            self.append(value)
 
     def get(self, key):
-        return self.cache.get(key)
+        value = self.probe(key)
+        return None if value is MISSING else value
 
     def delete(self, key):
-        del self.cache[key]
+        self.values.delete(key)
+        if self.hot.exists(key):
+            self.hot.delete(key)
 
     def exists(self, key) -> bool:
-        return key in self.cache
+        return self.hot.exists(key) or self.values.exists(key)
+
+    def probe(self, key) -> Any:
+        value = self.hot.probe(key)
+        if value is MISSING:
+            value = self.values.probe(key)
+            if value is not MISSING:
+                self.hot.set(key, value)
+        return value
 
     def remove(self, key):
         self.delete(key)
 
+    def close(self) -> None:
+        self.values.close()
+
+    def append(self, row: Mapping[str, Any]) -> None:
+        """Adds a row to the table of its `module_type` and `module_name`."""
+        self.append_many(str(row["module_type"]), str(row["module_name"]),
+                         [row])
+
+    def append_many(self, module_type: str, module_name: str,
+                    rows: List[Mapping[str, Any]]) -> None:
+        """Adds rows to the `(module_type, module_name)` table."""
+        table = (module_type, module_name)
+        with self._lock:
+            pending = self._rows.setdefault(table, [])
+            pending.extend(rows)
+            if len(pending) >= self.batch_size:
+                self._seal(table)
+            batched = sum(b.num_rows for b in self._batches.get(table, ()))
+            if batched >= self.row_group_size:
+                self._roll(table)
+
+    def _seal(self, table: Tuple[str, str]) -> None:
+        rows = self._rows.pop(table, None)
+        if rows:
+            names = dict.fromkeys(name for row in rows for name in row)
+            self._batches.setdefault(table, []).append(
+                pa.RecordBatch.from_pydict(
+                    {name: [row.get(name) for row in rows] for name in names}))
+
+    def _roll(self, table: Tuple[str, str]) -> None:
+        batches = self._batches.pop(table, None)
+        if not batches:
+            return
+        rolled = _unify_tables(
+            [pa.Table.from_batches([batch]) for batch in batches])
+        if self.path is None:
+            self._tables.setdefault(table, []).append(rolled)
+            return
+        if "episode" not in rolled.column_names:
+            rolled = rolled.append_column(
+                "episode", pa.nulls(rolled.num_rows, pa.string()))
+        rolled = rolled.set_column(
+            rolled.column_names.index("episode"), "episode",
+            rolled.column("episode").cast(pa.string()))
+        ds.write_dataset(
+            rolled,
+            self.table_path(*table),
+            format="parquet",
+            partitioning=self._partitioning(),
+            basename_template=f"part-{time.time_ns()}-{next(self._rolls)}"
+            "-{i}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=self.row_group_size,
+        )
+
+    @staticmethod
+    def _partitioning() -> ds.Partitioning:
+        return ds.partitioning(pa.schema([("episode", pa.string())]),
+                               flavor="hive")
+
+    def table_path(self, module_type: str, module_name: str) -> Path:
+        if self.path is None:
+            raise ValueError("The analysis tier doesn't have a path")
+        return self.path / module_type / module_name
+
+    def flush(self) -> None:
+        """Rolls every buffered row, so that queries see all of them."""
+        with self._lock:
+            for table in list(self._rows):
+                self._seal(table)
+            for table in list(self._batches):
+                self._roll(table)
+
+    def dataset(self, module_type: str, module_name: str) -> ds.Dataset:
+        """Gets the rolled rows of a table as a `pyarrow.dataset.Dataset`.
+
+        A table that hasn't been rolled yet gives an empty dataset.
+        """
+        table = (module_type, module_name)
+        if self.path is None:
+            with self._lock:
+                tables = self._tables.get(table, [])
+                if not tables:
+                    return ds.dataset(EMPTY_TABLE)
+                return ds.dataset(_unify_tables(tables))
+        path = self.table_path(*table)
+        if not path.exists():
+            return ds.dataset(EMPTY_TABLE)
+        dataset = ds.dataset(path,
+                             format="parquet",
+                             partitioning=self._partitioning())
+        # Columns can be added between rolls, so the files are read with
+        # the union of their schemas.
+        schema = pa.unify_schemas(
+            [fragment.physical_schema for fragment in dataset.get_fragments()] +
+            [self._partitioning().schema])
+        return ds.dataset(path,
+                          schema=schema,
+                          format="parquet",
+                          partitioning=self._partitioning())
+
+    def query(self,
+              module_type: str,
+              module_name: str,
+              columns: Optional[List[str]] = None,
+              episode: Optional[str] = None,
+              start: Optional[int] = None,
+              end: Optional[int] = None,
+              filter: Optional[ds.Expression] = None) -> pa.Table:
+        """Reads the columns and rows of a table that match the filters.
+
+        Parameters
+        ----------
+        module_type : str
+            The module type of the table.
+        module_name : str
+            The module name of the table.
+        columns : list of str, optional
+            The columns to read, defaulting to all of them.
+        episode : str, optional
+            Only reads the partition of this episode.
+        start : int, optional
+            Only reads rows with a timestep at or after `start`.
+        end : int, optional
+            Only reads rows with a timestep before `end`.
+        filter : `pyarrow.dataset.Expression`, optional
+            Any other filter to push down to the scan.
+
+        Returns
+        -------
+        `pa.Table`
+            The matching rows.
+        """
+        self.flush()
+        expression = filter
+        conditions = []
+        if episode is not None:
+            conditions.append(ds.field("episode") == episode)
+        if start is not None:
+            conditions.append(ds.field("timestep") >= start)
+        if end is not None:
+            conditions.append(ds.field("timestep") < end)
+        for condition in conditions:
+            expression = (condition if expression is None else expression &
+                          condition)
+        return self.dataset(module_type, module_name).to_table(
+            columns=columns, filter=expression)
+
+
+class _Flush:
+    """Queued by `TierWriter.flush` to mark a barrier."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class TierWriter:
+    """Feeds writes to a lower storage tier from a background thread.
+
+    Writes are put on a bounded queue. When the queue is full, writers block
+    until the flusher catches up, which is the backpressure on the layers
+    above. Writes that haven't been applied yet are kept in `pending` so
+    that reads stay consistent with the writes before them.
+    """
+
+    def __init__(self,
+                 db: DatabaseAPI,
+                 max_pending: int = 10_000,
+                 batch_size: int = 512):
+        self.db = db
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+        self._pending: Dict[Any, Any] = {}
+        self._sequence = count()
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run,
+                                            name=f"{type(self.db).__name__}Writer",
+                                            daemon=True)
+            self._thread.start()
+
+    def put(self, key, value) -> None:
+        """Queues `value` (or `DELETE_WRAPPED`) to be written under `key`."""
+        self.put_many({key: value})
+
+    def put_many(self, changes: ChangesetDict) -> None:
+        """Queues a whole changeset as a single item of the queue."""
+        if not changes:
+            return
+        self.raise_error()
+        with self._lock:
+            sequence = next(self._sequence)
+            for key, value in changes.items():
+                self._pending[key] = (sequence, value)
+        self._start()
+        self._queue.put((sequence, changes))
+
+    def set(self, key, value) -> None:
+        self.put(key, value)
+
+    def delete(self, key) -> None:
+        self.put(key, DELETE_WRAPPED)
+
+    def probe(self, key) -> Any:
+        """Looks `key` up in the pending writes, then in the tier."""
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is None:
+            return self.db.probe(key)
+        value = pending[1]
+        return MISSING if value is DELETE_WRAPPED else value
+
+    def pending_keys(self) -> List[Any]:
+        """The keys of the writes that haven't been applied yet."""
+        with self._lock:
+            return list(self._pending)
+
+    def _apply(self, sequence: int, changes: ChangesetDict) -> None:
+        for key, value in changes.items():
+            if value is DELETE_WRAPPED:
+                if self.db.exists(key):
+                    self.db.delete(key)
+            else:
+                self.db.set(key, value)
+        self._forget(sequence, changes)
+
+    def _forget(self, sequence: int, changes: ChangesetDict) -> None:
+        with self._lock:
+            for key in changes:
+                # A newer write of the key may have been queued in the meantime.
+                if self._pending.get(key, (None, ))[0] == sequence:
+                    del self._pending[key]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                try:
+                    if isinstance(item, _Flush):
+                        item.done.set()
+                    elif self._error is None:
+                        self._apply(*item)
+                    else:
+                        # Writes after a failure are dropped until the error
+                        # is raised, so reads go back to the tier.
+                        self._forget(*item)
+                except BaseException as error:  # noqa: B902
+                    log.exception(error)
+                    self._error = error
+                    self._forget(*item)
+                finally:
+                    self._queue.task_done()
+
+    def raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(
+                f"Writing to {type(self.db).__name__} failed") from error
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Blocks until every write queued before the call is applied."""
+        if self._thread is not None:
+            barrier = _Flush()
+            self._queue.put(barrier)
+            if not barrier.done.wait(timeout):
+                raise TimeoutError(
+                    f"Flushing {type(self.db).__name__} timed out")
+        self.raise_error()
+
+    @property
+    def backlog(self) -> int:
+        """The number of writes waiting to be applied."""
+        return self._queue.qsize()
+
 
 class StorageLayer(DatabaseAPI):
+    """Stores values in a cache tier, a local tier and an analytics tier.
+
+    The cache is written through. The local and analytics tiers are written
+    behind by a `TierWriter` each, unless `write_behind` is off. Reads probe
+    every tier once, top down, and copy a hit into the tiers above it. Call
+    `flush` at episode boundaries to wait for the lower tiers.
+
+    Each lower tier also gets a `BloomFilter` of the keys written to it, so
+    a key the filter has never seen is skipped without probing the tier.
+    Filters count distinct keys only, are rebuilt from the keys of their
+    tier with twice as much room once they fill up, and can be rebuilt by
+    hand with `rebuild_filters`, e.g. after many deletes.
+
+    Parameters
+    ----------
+    bloom_capacity : int, default 100000
+        The number of keys each filter is initially sized for.
+    bloom_fp_rate : float, default 0.01
+        The false-positive rate of the filters.
+    bloom_bytes : int, optional
+        Sizes the filters by memory instead, overriding `bloom_fp_rate`.
+    use_bloom : bool, default True
+        If the lower tiers get a filter at all.
+    """
 
     def __init__(
-            self,
-            cache: CacheDB = CacheDB(),
-            local: LocalDB = LocalDB(),
-            analyze: AnalysisDB = AnalysisDB(),
+        self,
+        cache: Optional[CacheDB] = None,
+        local: Optional[LocalDB] = None,
+        analyze: Optional[AnalysisDB] = None,
+        write_behind: bool = True,
+        max_pending: int = 10_000,
+        bloom_capacity: int = 100_000,
+        bloom_fp_rate: float = 0.01,
+        bloom_bytes: Optional[int] = None,
+        use_bloom: bool = True,
     ):
-        self._cache = cache
-        self._local = local
-        self._analytics = analyze
+        self._cache = cache if cache is not None else CacheDB()
+        self._local = local if local is not None else LocalDB()
+        self._analytics = analyze if analyze is not None else AnalysisDB()
+        self._write_behind = write_behind
+        self._local_writer = TierWriter(self._local, max_pending)
+        self._analytics_writer = TierWriter(self._analytics, max_pending)
+        self.bloom_capacity = bloom_capacity
+        self.bloom_fp_rate = bloom_fp_rate
+        self.bloom_bytes = bloom_bytes
+        self.use_bloom = use_bloom
+        self._filters: List[Optional[BloomFilter]] = [None, None]
+        self._skipped = [0, 0]
+        # Held while a key is remembered and handed to its tier, and while a
+        # filter is rebuilt, so a rebuild never drops a key being written.
+        self._filter_lock = threading.RLock()
+        if use_bloom:
+            self.rebuild_filters()
 
     def set_context(self, context: Metadata) -> "StorageLayer":
         self._context = context
         return self
 
+    @property
+    def lower_tiers(self) -> List[Union[DatabaseAPI, TierWriter]]:
+        if self._write_behind:
+            return [self._local_writer, self._analytics_writer]
+        return [self._local, self._analytics]
+
+    def _new_filter(self, capacity: int) -> BloomFilter:
+        if self.bloom_bytes is not None:
+            scale = capacity / max(self.bloom_capacity, 1)
+            return BloomFilter.from_memory(int(self.bloom_bytes * scale),
+                                           capacity)
+        return BloomFilter(capacity, self.bloom_fp_rate)
+
+    def _tier_keys(self, index: int) -> List[Any]:
+        db = (self._local, self._analytics)[index]
+        writer = (self._local_writer, self._analytics_writer)[index]
+        # Pending keys first: a key applied after this snapshot is already
+        # in the tier when it is listed, while listing the tier first would
+        # miss the keys applied in between.
+        keys = writer.pending_keys()
+        keys.extend(db.cache)
+        # A pending key is usually in the tier already.
+        return list(dict.fromkeys(keys))
+
+    def _rebuild_filter(self, index: int, capacity: int) -> None:
+        with self._filter_lock:
+            keys = self._tier_keys(index)
+            bloom = self._new_filter(max(capacity, 2 * len(keys)))
+            bloom.update(keys)
+            self._filters[index] = bloom
+
+    def rebuild_filters(self) -> None:
+        """Rebuilds the filter of every lower tier from the keys it holds,
+        which drops the keys deleted since the last build."""
+        if not self.use_bloom:
+            return
+        for index in range(len(self._filters)):
+            self._rebuild_filter(index, self.bloom_capacity)
+
+    def _remember(self, index: int, key) -> None:
+        bloom = self._filters[index]
+        if bloom is None:
+            return
+        if bloom.add(key) and bloom.is_saturated:
+            # The rebuild is sized from the distinct keys of the tier, and
+            # the key may not have reached the tier yet.
+            self._rebuild_filter(index, self.bloom_capacity)
+            self._filters[index].add(key)
+
+    def _probe_tier(self, index: int, key) -> Any:
+        bloom = self._filters[index]
+        if bloom is not None and key not in bloom:
+            self._skipped[index] += 1
+            return MISSING
+        return self.lower_tiers[index].probe(key)
+
+    def filter_stats(self) -> Dict[str, Dict[str, Any]]:
+        """The size, fill and false-positive rates of the filters, with the
+        number of probes they saved."""
+        stats = {}
+        for name, bloom, skipped in zip(("local", "analytics"), self._filters,
+                                        self._skipped):
+            if bloom is not None:
+                stats[name] = {**bloom.stats(), "skipped_probes": skipped}
+        return stats
+
     def set(self, key, value):
         self._cache.set(key, value)
-        self._local.set(key, value)
-        self._analytics.set(key, value)
+        with self._filter_lock:
+            for index, tier in enumerate(self.lower_tiers):
+                self._remember(index, key)
+                tier.set(key, value)
+
+    def probe(self, key) -> Any:
+        value = self._cache.probe(key)
+        if value is not MISSING:
+            return value
+        for index, tier in enumerate(self.lower_tiers):
+            value = self._probe_tier(index, key)
+            if value is not MISSING:
+                self._cache.set(key, value)
+                with self._filter_lock:
+                    for above in range(index):
+                        self._remember(above, key)
+                        self.lower_tiers[above].set(key, value)
+                return value
+        return MISSING
 
     def get(self, key):
-        if not self.exists(key):
+        value = self.probe(key)
+        if value is MISSING:
             raise RuntimeError(f"Couldn't find key {key}")
-        if key in self._cache:
-            return self._cache.get(key)
-        elif key in self._local:
-            return self._local.get(key)
-        elif key in self._analytics:
-            return self._analytics.get(key)
+        return value
 
     def remove(self, key):
         if not self.exists(key):
             return False
-        self._cache.remove(key)
-        self._local.remove(key)
-        self._analytics.remove(key)
+        if self._cache.exists(key):
+            self._cache.remove(key)
+        for tier in self.lower_tiers:
+            if isinstance(tier, TierWriter) or tier.exists(key):
+                tier.delete(key)
         return True
 
+    def delete(self, key, **kwargs):
+        self.remove(key)
+
+    def apply_changeset(self, changes: ChangesetDict) -> None:
+        """Writes a changeset, where `DELETE_WRAPPED` values delete their key.
+
+        The lower tiers receive the changeset as one batch.
+        """
+        with self._filter_lock:
+            self._apply_changeset(changes)
+
+    def _apply_changeset(self, changes: ChangesetDict) -> None:
+        for key, value in changes.items():
+            if value is DELETE_WRAPPED:
+                if self._cache.exists(key):
+                    self._cache.remove(key)
+            else:
+                self._cache.set(key, value)
+                for index in range(len(self._filters)):
+                    self._remember(index, key)
+        if self._write_behind:
+            self._local_writer.put_many(changes)
+            self._analytics_writer.put_many(changes)
+            return
+        for tier in self.lower_tiers:
+            for key, value in changes.items():
+                if value is not DELETE_WRAPPED:
+                    tier.set(key, value)
+                elif tier.exists(key):
+                    tier.delete(key)
+
     def exists(self, key) -> bool:
         if self._cache.exists(key):
             return True
+        return any(
+            self._probe_tier(index, key) is not MISSING
+            for index in range(len(self.lower_tiers)))
 
-        if self._local.exists(key):
-            return True
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Waits until the lower tiers hold every write made so far, and
+        rolls the buffered rows of the analytics tier."""
+        if self._write_behind:
+            self._local_writer.flush(timeout)
+            self._analytics_writer.flush(timeout)
+        self._analytics.flush()
 
-        if self._analytics.exists(key):
-            return True
 
-        return False
-
-
-class ContextManager:
-
-    def __init__(self):
-        self._ctx_vars: Dict[str, Any] = {}
-        self.cxt = Context()
-
-    def copy(self) -> Context:
-        return copy_context()
-
-    def flattened(self):
-        #  if not isinstance(v, ContextVar)
-        return {k.name: v for k, v in self.copy().items()}
-
-    def set(self, key, value):
-        self._ctx_vars[key] = ContextVar(key).set(value)
-
-    def get(self, key):
-        if key in self._ctx_vars:
-            return self._ctx_vars[key].get()
-        log.warning("Work damn it!!!")
-
-    def delete(self, key):
-        if key in self._ctx_vars:
-            self._ctx_vars[key].reset()
-
-    def as_model(self):
-        return Metadata(**self.flattened())
-
-    def log_context(self):
-        meta = self.as_model()
-
-        debug(meta)
+class ContextManager(ContextControl):
+    """The context of a database handler. Shares its implementation with the
+    context of modules."""
 
 
 class SearchDB(DatabaseAPI):
+    """The search tier, which answers filtered queries over module records.
+
+    Values are kept by key like in the other tiers. Values that are
+    mappings with a `module_name` are also records of that table, and every
+    table maintains the secondary indexes declared on it with
+    `create_index`: hash indexes for equality and sorted indexes for ranges.
+    `find`, `find_unique` and `delete_many` use them to only look at the
+    records that can match.
+
+    Everything the tier holds lives in memory, with no bound: one copy of
+    every record (shared by the key and its table) plus an index entry per
+    indexed field. It is meant for the records of the running episodes of
+    searchable modules, so drop the ones of finished episodes with
+    `delete_many`.
+    """
 
     def __init__(self):
 
         self.cache = {}
+        self.tables: Dict[str, IndexedTable] = {}
+        self._record_ids = count()
+        self._lock = threading.RLock()
+
+    def table(self, module_name: str) -> IndexedTable:
+        with self._lock:
+            if module_name not in self.tables:
+                self.tables[module_name] = IndexedTable()
+            return self.tables[module_name]
+
+    def create_index(self,
+                     module_name: str,
+                     field: str,
+                     kind: str = "hash") -> None:
+        """Declares a `hash` or `sorted` index on a field of a table."""
+        with self._lock:
+            self.table(module_name).create_index(field, kind)
+
+    def insert(self,
+               module_name: str,
+               record: Mapping[str, Any],
+               key: Any = None) -> Any:
+        """Adds a record to a table and returns its key.
+
+        Records without a `key` get a new one, so that they are appended.
+        """
+        with self._lock:
+            if key is None:
+                key = ("record", next(self._record_ids))
+            self.table(module_name).insert(key, record)
+        return key
+
+    def find(self,
+             module_name: str,
+             filter: Mapping[str, Any] = {}) -> List[Dict[str, Any]]:
+        with self._lock:
+            if module_name not in self.tables:
+                return []
+            return self.tables[module_name].find(filter)
+
+    def find_unique(self,
+                    module_name: str,
+                    filter: Mapping[str, Any] = {}) -> Optional[Dict[str, Any]]:
+        """Gets the record that matches `filter`, or `None` when none does.
+        Raises a `ValueError` when several records match."""
+        records = self.find(module_name, filter)
+        if len(records) > 1:
+            raise ValueError(
+                f"{len(records)} records of {module_name} match {filter}")
+        return records[0] if records else None
+
+    def delete_many(self,
+                    module_name: str,
+                    filter: Mapping[str, Any] = {}) -> int:
+        """Removes the records that match `filter`, along with the keys
+        they were `set` under, and returns how many."""
+        with self._lock:
+            if module_name not in self.tables:
+                return 0
+            table = self.tables[module_name]
+            keys = table.keys_of(filter)
+            for key in keys:
+                table.remove(key)
+                self.cache.pop(key, None)
+            return len(keys)
 
     def set(self, key, value):
-        self.cache[key] = value
+        with self._lock:
+            previous = self.cache.get(key)
+            if isinstance(previous, Mapping) and "module_name" in previous:
+                self.table(previous["module_name"]).remove(key)
+            if isinstance(value, Mapping) and "module_name" in value:
+                value = self.table(value["module_name"]).insert(key, value)
+            self.cache[key] = value
 
     def get(self, key):
         return self.cache.get(key)
 
     def delete(self, key):
-        del self.cache[key]
+        with self._lock:
+            value = self.cache.pop(key)
+            if isinstance(value, Mapping) and "module_name" in value:
+                self.table(value["module_name"]).remove(key)
 
     def exists(self, key) -> bool:
         return key in self.cache
 
+    def probe(self, key) -> Any:
+        return self.cache.get(key, MISSING)
+
     def remove(self, key):
         self.delete(key)
 
 
+_SEARCH_DB: Optional[SearchDB] = None
+
+
+def search_db() -> SearchDB:
+    """Gets the search tier shared by the modules of the simulation.
+
+    Returns
+    -------
+    `SearchDB`
+        The search tier of the simulation.
+    """
+    global _SEARCH_DB
+    if _SEARCH_DB is None:
+        _SEARCH_DB = SearchDB()
+    return _SEARCH_DB
+
+
 class StorageModel(DatabaseAPI):
-    """Works like a journal. We keep track of dictionary changes then commit the changes to the database upon completion of the episode"""
+    """Works like a journal. We keep track of dictionary changes then commit the changes to the database upon completion of the episode
+
+    `record` opens a checkpoint, and checkpoints can be nested. Each one
+    remembers the values its writes replaced, so `discard` rolls back in
+    O(changes) and `commit` of an inner checkpoint only folds it into its
+    parent. Committing the root checkpoint (or calling `commit()` without
+    one) writes the final changeset to the storage layer in one batch.
+    """
 
     def __init__(self, eager=False) -> None:
 
         self.layed_storage = StorageLayer()
-        self.search = SearchDB()
-        self._current_values = {}
+        self.search = search_db()
+        # The final value of every key changed since the last commit.
+        # Deleted keys hold `DELETE_WRAPPED`.
+        self._current_values: ChangesetDict = {}
+        # The values replaced inside each open checkpoint. Keys that had no
+        # pending change before the checkpoint hold `REVERT_TO_WRAPPED`.
+        self._journal_data: "OrderedDict[JournalDBCheckpoint, ChangesetDict]" = OrderedDict()
         self._is_eager: bool = eager
 
     @property
@@ -282,96 +1166,270 @@ class StorageModel(DatabaseAPI):
         _ctx = copy_context()
         return _ctx
 
+    @property
+    def root_checkpoint(self) -> JournalDBCheckpoint:
+        return first(self._journal_data.keys())
+
+    @property
+    def last_checkpoint(self) -> JournalDBCheckpoint:
+        return next(reversed(self._journal_data.keys()))
+
+    @property
+    def is_flattened(self) -> bool:
+        """`True` when no checkpoint is open."""
+        return not self._journal_data
+
+    def has_checkpoint(self, checkpoint: JournalDBCheckpoint) -> bool:
+        return checkpoint in self._journal_data
+
+    def record(self,
+               custom_checkpoint: Optional[JournalDBCheckpoint] = None
+               ) -> JournalDBCheckpoint:
+        """Opens a new checkpoint and returns it."""
+        if custom_checkpoint is not None:
+            if custom_checkpoint in self._journal_data:
+                raise ValidationError(
+                    f"Tried to record with an existing checkpoint: {custom_checkpoint}"
+                )
+            checkpoint = custom_checkpoint
+        else:
+            checkpoint = get_next_checkpoint()
+        self._journal_data[checkpoint] = {}
+        return checkpoint
+
+    def _journal(self, key) -> None:
+        if self._journal_data:
+            changeset = self._journal_data[self.last_checkpoint]
+            if key not in changeset:
+                changeset[key] = self._current_values.get(
+                    key, REVERT_TO_WRAPPED)
+
     def set(
         self,
         name: str,
         value: str,
     ) -> None:
+        self._journal(name)
         self._current_values[name] = value
         self.eager_commit()
 
     def get(self, key: str) -> Optional[str]:
         if key in self._current_values:
-            return self._current_values[key]
+            value = self._current_values[key]
+            if value is DELETE_WRAPPED:
+                raise RuntimeError(f"Couldn't find key {key}")
+            return value
         return self.layed_storage.get(key)
 
     def exists(self, key: str) -> bool:
         if key in self._current_values:
-            return True
+            return self._current_values[key] is not DELETE_WRAPPED
         return self.layed_storage.exists(key)
 
     def delete(self, key, **kwargs):
-        return self.layed_storage.delete(key, **kwargs)
+        self._journal(key)
+        self._current_values[key] = DELETE_WRAPPED
+        self.eager_commit()
+
+    def discard(self, checkpoint: JournalDBCheckpoint) -> None:
+        """Rolls back every change made since `checkpoint` was recorded,
+        closing it and the checkpoints nested in it."""
+        if checkpoint not in self._journal_data:
+            raise ValidationError(f"No checkpoint {checkpoint} was found")
+        while self._journal_data:
+            checkpoint_id, changeset = self._journal_data.popitem()
+            for key, previous_value in changeset.items():
+                if previous_value is REVERT_TO_WRAPPED:
+                    self._current_values.pop(key, None)
+                else:
+                    self._current_values[key] = previous_value
+            if checkpoint_id == checkpoint:
+                break
+
+    def changeset(self) -> ChangesetDict:
+        """The final changes that the next root commit would write."""
+        return dict(self._current_values)
 
     def eager_commit(self):
         """Runs an eager commit if the model eagerly runs."""
-        if self._is_eager:
+        if self._is_eager and self.is_flattened:
             self.commit()
 
     def reset(self):
         self._current_values = {}
-
-    def commit(self):
-        """Commit values to the database"""
-        if len(self._current_values):
-            for key, value in self._current_values.items():
-                self.layed_storage.set(key, value)
+        self._journal_data = OrderedDict()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Commits the values and waits for every storage tier to hold them.
+        Use it as the barrier at the end of an episode."""
+        self.commit()
+        self.layed_storage.flush(timeout)
+
+    def commit(self, checkpoint: Optional[JournalDBCheckpoint] = None):
+        """Commit values to the database
+
+        Committing a nested checkpoint keeps its changes but folds its undo
+        information into the enclosing checkpoint. Committing the root
+        checkpoint, or passing no checkpoint, closes every checkpoint and
+        writes the final changeset to the storage layer.
+        """
+        if checkpoint is not None and checkpoint not in self._journal_data:
+            raise ValidationError(f"No checkpoint {checkpoint} was found")
+        if checkpoint is not None and checkpoint != self.root_checkpoint:
+            merged: ChangesetDict = {}
+            while True:
+                checkpoint_id, changeset = self._journal_data.popitem()
+                # Older checkpoints hold the older values, so they win.
+                merged.update(changeset)
+                if checkpoint_id == checkpoint:
+                    break
+            parent = self._journal_data[self.last_checkpoint]
+            for key, previous_value in merged.items():
+                parent.setdefault(key, previous_value)
+            return
+
+        self._journal_data.clear()
+        if self._current_values:
+            changes, self._current_values = self._current_values, {}
+            self.layed_storage.apply_changeset(changes)
 
 
 class Experiment:
-
-    def __init__(self, cache_location: str | Path = Path("/tmp/experiment")):
+    """Trial, episode and timestep counters of an experiment directory.
+
+    The counters live in memory, so reading them or stepping them is a
+    couple of attribute accesses. Increments are accumulated as deltas and
+    written to the diskcache in a single transaction every `flush_every`
+    steps, every `flush_interval` seconds or on `close`. Deltas are applied
+    with `Cache.incr`, so parallel workers sharing one directory add up
+    their counts instead of overwriting each other.
+
+    Attributes
+    ----------
+    cache_location : str or `Path`
+        The directory of the diskcache.
+    trials_per_episode : int
+        The number of trials that share an episode id.
+    flush_every : int
+        The number of steps between flushes. `0` only flushes on time or on
+        close.
+    flush_interval : float, optional
+        The number of seconds after which a step triggers a flush.
+    """
+
+    TRI_STR = "trial_num"
+    episode_str = "episode"
+    episode_index_str = "episode_index"
+    time_key = "timestep"
+
+    def __init__(self,
+                 cache_location: str | Path = Path("/tmp/experiment"),
+                 trials_per_episode: int = 5,
+                 flush_every: int = 100,
+                 flush_interval: Optional[float] = None):
         self.cache_path = Path(cache_location)
         self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.trials_per_episode = max(trials_per_episode, 1)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
 
         self.cache = Cache(str(self.cache_path))
-        self.TRI_STR = "trial_num"
-        self.episode_str = "episode"
-        self.time_key = "timestep"
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {self.TRI_STR: 0, self.time_key: 0}
+        self._steps_since_flush = 0
+        self._last_flush = time.monotonic()
+        self.sync()
+
+    def _sync_episode(self, trial: int) -> str:
+        # Runs inside of a transaction, so only one worker rolls the episode.
+        index = trial // self.trials_per_episode
+        episode = self.cache.get(self.episode_str)
+        if episode is None or self.cache.get(self.episode_index_str) != index:
+            if episode is None:
+                log.error("Episode not found")
+            episode = str(uuid.uuid4())
+            self.cache.set(self.episode_str, episode)
+            self.cache.set(self.episode_index_str, index)
+        return episode
+
+    def sync(self) -> None:
+        """Flushes the pending increments and reloads the shared counters,
+        all in one transaction."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {key: 0 for key in pending}
+            with self.cache.transact():
+                values = {
+                    key: self.cache.incr(key, delta, default=0)
+                    for key, delta in pending.items()
+                }
+                episode = self._sync_episode(values[self.TRI_STR])
+            self._trial = values[self.TRI_STR]
+            self._timestep = values[self.time_key]
+            self._episode = episode
+            self._steps_since_flush = 0
+            self._last_flush = time.monotonic()
+
+    flush = sync
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        """Adds `delta` to a counter in memory and returns its new value.
+
+        A trial that crosses into the next episode syncs right away, so the
+        episode id always comes from the shared trial count and every worker
+        agrees on it.
+        """
+        with self._lock:
+            self._pending[key] += delta
+            if key != self.TRI_STR:
+                self._timestep += delta
+                return self._timestep
+            previous = self._trial
+            self._trial += delta
+            rolled = (previous // self.trials_per_episode !=
+                      self._trial // self.trials_per_episode)
+        if rolled:
+            self.sync()
+        return self._trial
 
     @property
     def trial_count(self) -> int:
-        if self.TRI_STR not in self.cache:
-            self.cache.set(self.TRI_STR, 0)
-        return self.cache.get(self.TRI_STR, 0)
+        return self._trial
 
     @property
-    def episode(self):
-        is_skip = False
-        if self.episode_str not in self.cache:
-            self.cache[self.episode_str] = str(uuid.uuid4())
-            log.error("Episode not found")
-
-            is_skip = True
-
-        if ((self.trial_count % 5) == 0 or
-            (self.trial_count == 0)) and not is_skip:
-            self.cache[self.episode_str] = str(uuid.uuid4())
-        return self.cache[self.episode_str]
+    def episode(self) -> str:
+        return self._episode
 
     @property
-    def timestep(self):
-        _key = "timestep"
-        if self.time_key not in self.cache:
-            self.cache.set(self.time_key, 0)
-        return self.cache[self.time_key]
-
-    def incr_trial(self):
-        self.cache.set(self.TRI_STR, self.trial_count + 1)
-
-    def step_time(self):
-        self.cache.set(self.time_key, self.timestep + 1)
+    def timestep(self) -> int:
+        return self._timestep
+
+    def incr_trial(self) -> int:
+        return self.incr(self.TRI_STR)
+
+    def step_time(self) -> int:
+        return self.incr(self.time_key)
+
+    def maybe_flush(self) -> None:
+        """Flushes when `flush_every` steps or `flush_interval` seconds passed."""
+        self._steps_since_flush += 1
+        if self.flush_every and self._steps_since_flush >= self.flush_every:
+            self.sync()
+        elif (self.flush_interval is not None and
+              time.monotonic() - self._last_flush >= self.flush_interval):
+            self.sync()
+
+    def close(self) -> None:
+        self.sync()
+        self.cache.close()
 
     def __enter__(self):
-        self.cache = self.cache.__enter__()
-        trial = self.trial_count
         return self
 
     def __exit__(self, exc_type, exc_value, trace):
         self.incr_trial()
         self.step_time()
-        self.episode
-        self.cache.close()
+        self.maybe_flush()
 
 
 class BaseHandler(abc.ABC):
@@ -524,6 +1582,7 @@ async def main():
                     is_episode=True,
                     timestep=expr.timestep,
                 ))
+    experiment.close()
 
     # Get the last
     debug(
@@ -0,0 +1,49 @@
+import numpy as np
+
+from py_svm.synk.abcs.agent import Agent
+from py_svm.synk.abcs.behavior import Behavior
+from py_svm.synk.abcs.population import AgentPopulation
+
+
+class Trader(Agent):
+    cash: float = 0.0
+
+
+class Earn(Behavior):
+
+    def apply(self, population, mask):
+        population["cash"][mask] += 1.0
+
+
+class Spend(Behavior):
+
+    def act(self, agent):
+        agent.cash -= 0.5
+
+
+def test_behaviors_run_once_per_group_of_agents():
+    population = AgentPopulation(agent_class=Trader)
+    rows = population.add(4, cash=0.0)
+    earn, spend = Earn(), Spend()
+    population.attach(earn)
+    population.attach(spend, rows[2:])
+    population.remove(rows[3])
+
+    groups = population.behavior_groups()
+    assert [behaviors for behaviors, _ in groups] == [(earn, ), (earn, spend)]
+    np.testing.assert_array_equal(groups[1][1], [False, False, True, False])
+
+    population.step()
+    np.testing.assert_array_equal(population["cash"][rows[:3]],
+                                  [1.0, 1.0, 0.5])
+    assert earn.is_batched() and not spend.is_batched()
+
+
+def test_detach_regroups_the_agents():
+    population = AgentPopulation(agent_class=Trader)
+    rows = population.add(3)
+    earn = Earn()
+    population.attach(earn)
+    population.detach(earn, rows[:1])
+    population.step()
+    np.testing.assert_array_equal(population["cash"][rows], [0.0, 1.0, 1.0])
@@ -0,0 +1,62 @@
+from py_svm.synk.storage import MISSING, CacheDB, LocalDB, demote_to
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = CacheDB(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.exists("a") and not cache.exists("b")
+    assert cache.stats()["evictions"] == 1
+    assert cache.probe("b") is MISSING
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_fifo_ignores_reads_and_lfu_keeps_hot_entries():
+    fifo = CacheDB(max_entries=2, policy="fifo")
+    lfu = CacheDB(max_entries=2, policy="lfu")
+    for cache in (fifo, lfu):
+        cache.set("a", 1)
+        cache.set("b", 2)
+        for _ in range(3):
+            cache.get("a")
+        cache.set("c", 3)
+    assert not fifo.exists("a") and fifo.exists("b")
+    assert lfu.exists("a") and not lfu.exists("b")
+
+
+def test_byte_limits_and_ttl_demote_entries(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("py_svm.synk.storage.time.monotonic", lambda: clock[0])
+    lower = LocalDB()
+    cache = CacheDB(max_bytes=10, ttl=5, on_evict=demote_to(lower),
+                    sizeof=lambda key, value: 4)
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert cache.resident_bytes == 8
+    assert lower.get("a") == "A"
+
+    clock[0] = 6.0
+    assert not cache.exists("b")
+    assert cache.expirations == 1
+    assert lower.get("b") == "B"
+
+
+def test_writes_sweep_expired_entries_of_an_unbounded_cache(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("py_svm.synk.storage.time.monotonic", lambda: clock[0])
+    expired = []
+    cache = CacheDB(ttl=5, on_evict=lambda key, value: expired.append(key))
+    cache.set("a", 1)
+    clock[0] = 3.0
+    cache.set("b", 2)
+    clock[0] = 4.0
+    cache.set("a", 3)
+
+    clock[0] = 8.5
+    cache.set("c", 4)
+    assert expired == ["b"]
+    assert list(cache.cache) == ["a", "c"]
+    assert cache.expirations == 1
@@ -0,0 +1,44 @@
+import pickle
+
+import pytest
+
+from py_svm.synk.abcs.context import ContextControl
+
+
+def test_slots_and_extra_keys_get_and_set():
+    context = ContextControl()
+    context.set("episode", "e")
+    context.update(timestep=3, strategy="momentum")
+
+    assert context.get("episode") == "e"
+    assert context.get("strategy") == "momentum"
+    assert context.get("module_id", "none") == "none"
+    assert "timestep" in context and "module_id" not in context
+
+    context.delete("strategy")
+    context.delete("timestep")
+    assert context.flattened() == {"episode": "e"}
+
+
+def test_snapshots_are_immutable_and_cached_until_a_write():
+    context = ContextControl()
+    context.update(episode="e", strategy="momentum")
+    snapshot = context.snapshot()
+    assert context.snapshot() is snapshot
+
+    context.set("episode", "f")
+    assert snapshot["episode"] == "e"
+    assert context.snapshot()["episode"] == "f"
+    with pytest.raises(AttributeError):
+        snapshot.episode = "g"
+    with pytest.raises(KeyError):
+        snapshot["module_id"]
+
+
+def test_contexts_pickle_by_value():
+    context = ContextControl()
+    context.update(episode="e", timestep=1, strategy="momentum")
+    copy = pickle.loads(pickle.dumps(context))
+    assert copy.flattened() == context.flattened()
+    copy.set("timestep", 2)
+    assert context.get("timestep") == 1
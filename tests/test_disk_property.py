@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+
+import pytest
+
+from py_svm.synk.backends.disk_property import (CachedPropertyDatabase,
+                                                SQLitePropertyDatabase)
+
+
+def test_sqlite_properties_round_trip(tmp_path):
+    db = SQLitePropertyDatabase(str(tmp_path / "properties.db"))
+    db.save_node_property(1, "name", "O'Brien")
+    db.save_node_properties_many([(1, "age", "42"), (2, "name", "Ada")])
+    db.save_relationship_property(7, "weight", "0.5")
+
+    assert db.load_node_property(1, "name") == "O'Brien"
+    assert db.load_node_properties_many([1, 2, 3]) == {
+        1: {"name": "O'Brien", "age": "42"},
+        2: {"name": "Ada"},
+        3: {},
+    }
+    assert db.load_relationship_property(7, "weight") == "0.5"
+
+    db.delete_node_property(1, "age")
+    assert db.load_node_property(1, "age") is None
+    db.close()
+
+
+def test_sqlite_bulk_loads_chunk_past_the_parameter_limit(tmp_path):
+    db = SQLitePropertyDatabase(str(tmp_path / "properties.db"))
+    db.save_node_properties_many((node_id, "x", str(node_id))
+                                 for node_id in range(2500))
+    loaded = db.load_node_properties_many(range(2500))
+    assert len(loaded) == 2500
+    assert loaded[2499] == {"x": "2499"}
+    db.close()
+
+
+def test_sqlite_keeps_one_connection_per_thread(tmp_path):
+    db = SQLitePropertyDatabase(str(tmp_path / "properties.db"))
+    assert db.connection is db.connection
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(db.connection))
+    thread.start()
+    thread.join()
+    assert seen[0] is not db.connection
+    assert len(db._connections) == 2
+    db.close()
+    assert db._connections == []
+
+
+def test_cached_bulk_loads_return_every_node_past_the_cache_size(tmp_path):
+    db = SQLitePropertyDatabase(str(tmp_path / "properties.db"))
+    db.save_node_properties_many((node_id, "x", str(node_id))
+                                 for node_id in range(50))
+    cached = CachedPropertyDatabase(db, cache_size=10)
+    cached.save_node_property(3, "x", "dirty")
+    cached.delete_node_property(4, "x")
+
+    loaded = cached.load_node_properties_many(range(50))
+
+    assert len(loaded) == 50
+    assert loaded[3] == {"x": "dirty"}
+    assert loaded[4] == {}
+    assert loaded[49] == {"x": "49"}
+    assert len(cached._cache) == 10
+
+
+def test_cached_writes_are_buffered_until_flush(tmp_path):
+    db = SQLitePropertyDatabase(str(tmp_path / "properties.db"))
+    cached = CachedPropertyDatabase(db, max_dirty=100)
+    cached.save_node_property(1, "name", "Ada")
+    cached.save_relationship_property(2, "weight", "1")
+
+    assert cached.load_node_property(1, "name") == "Ada"
+    assert db.load_node_property(1, "name") is None
+    assert cached.dirty == 2
+
+    cached.flush()
+    assert cached.dirty == 0
+    assert db.load_node_property(1, "name") == "Ada"
+    assert db.load_relationship_property(2, "weight") == "1"
+
+    cached.invalidate()
+    assert cached.load_node_property(1, "name") == "Ada"
+    assert cached.misses == 1
+
+
+class FlakyDatabase(SQLitePropertyDatabase):
+    """Fails the next bulk save, and records what the cache reads meanwhile."""
+
+    fail = False
+    during_write = None
+    cached = None
+
+    def save_node_properties_many(self, properties):
+        if self.cached is not None:
+            self.cached.invalidate()
+            self.during_write = self.cached.load_node_property(1, "name")
+        if self.fail:
+            self.fail = False
+            raise sqlite3.OperationalError("disk I/O error")
+        super().save_node_properties_many(properties)
+
+
+def test_failed_flushes_keep_the_writes_buffered(tmp_path):
+    db = FlakyDatabase(str(tmp_path / "properties.db"))
+    db.save_node_property(1, "name", "old")
+    cached = CachedPropertyDatabase(db)
+    cached.save_node_property(1, "name", "new")
+    cached.delete_node_property(2, "name")
+    db.cached = cached
+
+    db.fail = True
+    with pytest.raises(sqlite3.OperationalError):
+        cached.flush()
+    assert cached.dirty == 2
+    # The evicted key is read from the write in flight, not from disk.
+    assert db.during_write == "new"
+
+    cached.flush()
+    assert cached.dirty == 0
+    assert db.load_node_property(1, "name") == "new"
+
+
+def test_flushed_deletes_are_batched(tmp_path):
+    db = SQLitePropertyDatabase(str(tmp_path / "properties.db"))
+    db.save_node_properties_many((node_id, "x", "1") for node_id in range(5))
+    db.save_relationship_property(9, "w", "1")
+    cached = CachedPropertyDatabase(db)
+    for node_id in range(4):
+        cached.delete_node_property(node_id, "x")
+    cached.delete_relationship_property(9, "w")
+
+    batches = []
+    execute_many = db.execute_many
+
+    def record(query, rows):
+        rows = list(rows)
+        batches.append((query.split()[0], len(rows)))
+        execute_many(query, rows)
+
+    db.execute_many = record
+    cached.flush()
+
+    assert batches == [("DELETE", 4), ("DELETE", 1)]
+    assert db.load_node_properties_many(range(5)) == {
+        0: {}, 1: {}, 2: {}, 3: {}, 4: {"x": "1"}}
+    assert db.load_relationship_property(9, "w") is None
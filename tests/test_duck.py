@@ -0,0 +1,185 @@
+import warnings
+from typing import List, Optional
+
+import pyarrow as pa
+from pydantic import BaseModel
+
+from py_svm.synk.backends.duck import (STORAGE_SCHEMA, DuckStorage,
+                                       decode_values, fetch_table,
+                                       pivot_values,
+                                       typed_values, value_str, value_type)
+
+
+def test_step_batch_appends_every_write_at_once():
+    db = DuckStorage()
+    with db.batch() as batch:
+        for timestamp in range(3):
+            batch.set_balance("e", "0xa", 10.0 + timestamp, timestamp)
+            batch.set_value("e", "0xa", "count", timestamp, timestamp)
+            batch.set_value("e", "0xa", "name", "it's", timestamp)
+        assert len(batch) == 9
+    assert len(batch) == 0
+
+    assert db.get_balance("e", "0xa", 2) == 12.0
+    assert db.conn.execute("SELECT count(*) FROM storage").fetchone() == (6, )
+    assert db.get_value("e", "0xa", "name", 2) == "it's"
+
+
+def test_parameterised_writes_round_trip_values():
+    db = DuckStorage()
+    db.set_value("e", "0xa", "flag", True, 1)
+    db.set_values([("e", "0xa", "price", 1.5, 1),
+                   ("e", "0xa", "meta", {"side": "bid"}, 1),
+                   ("e", "0xb", "price", 2.5, 1)])
+
+    assert db.get_value("e", "0xa", "flag", 1) is True
+    assert db.get_value("e", "0xa", "price", 1) == 1.5
+    assert db.get_value("e", "0xa", "meta", 1) == {"side": "bid"}
+    assert db.get_value("e", "0xa", "price", 0) is None
+
+
+class Position(BaseModel):
+    symbol: str
+    size: float
+
+
+class Trader(BaseModel):
+    cash: float = 0.0
+    active: bool = True
+    tags: List[str] = []
+    position: Optional[Position] = None
+
+
+def test_typed_tables_have_a_column_per_field():
+    db = DuckStorage()
+    table = db.typed_table(Trader)
+    assert table.name == "traders"
+    assert table.columns == {
+        "episode": "VARCHAR",
+        "module_id": "VARCHAR",
+        "timestep": "BIGINT",
+        "cash": "DOUBLE",
+        "active": "BOOLEAN",
+        "tags": "VARCHAR[]",
+        "position": 'STRUCT("symbol" VARCHAR, "size" DOUBLE)',
+    }
+
+    table.insert(Trader(cash=5.0, tags=["a"],
+                        position=Position(symbol="X", size=2.0)), 1, "e", 0)
+    table.insert_many([{"cash": 6.0}, {"cash": 7.0}], [1, 2], "e", 1)
+    latest = table.latest(1, "e")
+    assert latest["cash"] == 6.0 and latest["timestep"] == 1
+    assert table.latest(1, "e", timestep=0)["position"] == {
+        "symbol": "X", "size": 2.0}
+    assert table.history(1, "e").column("cash").to_pylist() == [5.0, 6.0]
+
+
+def test_typed_tables_migrate_new_fields():
+    db = DuckStorage()
+    db.typed_table(Trader).insert(Trader(cash=1.0), 1, "e", 0)
+
+    class Trader2(Trader):
+        score: int = 0
+
+    Trader2.__name__ = "Trader"
+    table = db.typed_table(Trader2)
+    assert table.existing_columns()["score"] == "BIGINT"
+    assert table.migrate() == []
+    assert table.latest(1, "e")["score"] is None
+
+
+def storage_table(rows):
+    return pa.Table.from_pylist([{
+        "episode": "e",
+        "address": "0xa",
+        "slot": slot,
+        "value": value_str(value),
+        "vtype": value_type(value),
+        "timestamp": timestamp,
+    } for slot, value, timestamp in rows], schema=STORAGE_SCHEMA)
+
+
+def test_values_decode_into_one_typed_column_per_vtype():
+    table = storage_table([("price", 1.5, 0), ("open", True, 0),
+                           ("name", "x", 1), ("meta", {"a": 1}, 1),
+                           ("gone", None, 2)])
+    decoded = decode_values(table)
+    assert decoded.column("numeric").to_pylist() == [1.5, None, None, None,
+                                                     None]
+    assert decoded.column("boolean").to_pylist() == [None, True, None, None,
+                                                     None]
+    assert decoded.schema.field("numeric").type == pa.float64()
+    assert "value" not in decoded.column_names
+    assert typed_values(table) == [1.5, True, "x", {"a": 1}, None]
+
+
+def test_pivot_has_a_typed_column_per_slot():
+    table = storage_table([("price", 1.0, 0), ("price", 2.0, 0),
+                           ("price", 3.0, 2), ("name", "x", 1),
+                           ("mixed", 1, 0), ("mixed", "y", 2)])
+    pivoted = pivot_values(table)
+    assert pivoted.column("timestamp").to_pylist() == [0, 1, 2]
+    assert pivoted.column("price").to_pylist() == [2.0, None, 3.0]
+    assert pivoted.column("name").to_pylist() == [None, "x", None]
+    assert pivoted.column("mixed").to_pylist() == ["1", None, "y"]
+
+
+def test_state_at_rebuilds_every_slot_as_of_a_timestamp():
+    db = DuckStorage()
+    db.set_values([("e", "0xa", "price", 1.0, 0), ("e", "0xa", "price", 2.0, 5),
+                   ("e", "0xa", "name", "x", 3), ("e", "0xb", "price", 9.0, 1),
+                   ("f", "0xa", "price", 7.0, 0)])
+
+    assert db.state_at("e", "0xa", 4) == {"price": 1.0, "name": "x"}
+    assert db.state_at("e", "0xa", 5) == {"price": 2.0, "name": "x"}
+    assert db.state_at("e", "0xa", -1) == {}
+    assert db.state_at_many("e", ["0xa", "0xb", "0xc"], 2) == {
+        "0xa": {"price": 1.0},
+        "0xb": {"price": 9.0},
+        "0xc": {},
+    }
+
+
+def test_keyset_pages_cover_every_row_once_across_ties():
+    db = DuckStorage()
+    # Two writes share every timestamp, so pages split inside of ties.
+    db.set_values([("e", "0xa", f"s{i % 2}", i, i // 2) for i in range(10)])
+    for t in range(10):
+        db.set_balance("e", "0xa", float(t), t // 3)
+
+    pages = list(db.history_pages("e", "0xa", page_size=3))
+    assert [page.num_rows for page in pages] == [3, 3, 3, 1]
+    rows = [row for page in pages for row in page.to_pylist()]
+    assert sorted(int(row["value"]) for row in rows) == list(range(10))
+    keys = [(row["timestamp"], row["slot"]) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert db.get_history("e", "0xa", page_size=3).num_rows == 10
+
+    balances = [row for page in db.balance_pages("e", "0xa", page_size=3)
+                for row in page.to_pylist()]
+    assert sorted(float(row["balance"]) for row in balances) == [
+        float(t) for t in range(10)]
+    assert [row["timestamp"] for row in balances] == sorted(
+        (t // 3 for t in range(10)), reverse=True)
+    assert db.get_history("e", "0xb").num_rows == 0
+
+
+def test_typed_history_pivots_slots_into_columns():
+    db = DuckStorage()
+    db.set_values([("e", "0xa", "price", 1.5, 0), ("e", "0xa", "name", "x", 0),
+                   ("e", "0xa", "price", 2.5, 1)])
+
+    pivot = db.typed_history("e", "0xa", pivot=True)
+    rows = sorted(pivot.to_pylist(), key=lambda row: row["timestamp"])
+    assert [row["price"] for row in rows] == [1.5, 2.5]
+    assert rows[0]["name"] == "x"
+
+
+def test_reads_use_the_current_arrow_api():
+    db = DuckStorage()
+    db.set_values([("e", "0xa", "price", 1.0, 0)])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        assert db.state_at("e", "0xa", 0) == {"price": 1.0}
+        assert isinstance(fetch_table(db.conn.execute("SELECT 1 AS a")),
+                          pa.Table)
@@ -0,0 +1,50 @@
+import uuid
+
+from py_svm.synk import ids
+from py_svm.synk.ids import IdAllocator, allocating, allocator, next_id
+
+
+def test_allocator_hands_out_dense_ids_and_stable_uuids():
+    namespace = uuid.uuid4()
+    first = IdAllocator(namespace=namespace)
+    assert first.allocate() == 0
+    assert first.allocate_many(3).tolist() == [1, 2, 3]
+    assert len(first) == 4
+
+    exported = first.uuid(2)
+    assert first.from_uuid(exported) == 2
+    assert IdAllocator(namespace=namespace).uuid(2) == exported
+    assert first.uuid_table().column("id").to_pylist() == [0, 1, 2, 3]
+
+
+def test_simulations_own_their_allocators():
+    outside = allocator()
+    left, right = IdAllocator(), IdAllocator()
+    with allocating(left):
+        assert [next_id(), next_id()] == [0, 1]
+        with allocating(right):
+            assert next_id() == 0
+        assert next_id() == 2
+    assert allocator() is outside
+    assert len(right) == 1
+
+
+def test_reset_restarts_the_current_allocator():
+    with allocating(IdAllocator()) as current:
+        next_id()
+        next_id()
+        ids.reset()
+        assert len(current) == 0
+        assert next_id() == 0
+
+
+def test_successors_continue_after_live_ids():
+    first = IdAllocator()
+    lock = first._lock
+    first.allocate_many(3)
+    second = first.successor()
+    assert second.namespace == first.namespace
+    assert second.allocate() == 3
+    assert first.allocate() == 3
+    first.reset()
+    assert first._lock is lock
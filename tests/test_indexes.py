@@ -0,0 +1,88 @@
+import pytest
+
+from py_svm.synk import storage
+from py_svm.synk.abcs import actions
+from py_svm.synk.abcs.agent import Agent
+from py_svm.synk.indexes import IndexedTable, sort_key
+from py_svm.synk.storage import SearchDB
+
+
+class Engine:
+
+    def execute(self, query):
+        return None
+
+
+class Quote(Agent):
+    __searchable__ = True
+
+
+class Tick(Agent):
+    pass
+
+
+def test_sort_keys_only_compare_values_of_one_kind():
+    values = [None, "b", 2.5, b"x", True, -1, "a", 0]
+    ordered = [key[2] for key in sorted(map(sort_key, values))]
+    assert ordered == [0, -1, 0, True, 2.5, "a", "b", b"x"]
+
+
+def test_sorted_index_handles_mixed_types():
+    table = IndexedTable({"price": "sorted"})
+    prices = [3, None, "cheap", 1.5, 7, None, {"bid": 1}, 10]
+    for key, price in enumerate(prices):
+        table.insert(key, {"price": price})
+
+    assert table.keys_of({"price": {">=": 3}}) == [0, 4, 7]
+    assert table.keys_of({"price": {"<": 3}}) == [3]
+    assert table.keys_of({"price": None}) == [1, 5]
+    assert table.keys_of({"price": {">": "a"}}) == [2]
+    assert table.keys_of({"price": {"==": {"bid": 1}}}) == [6]
+
+    table.remove(0)
+    table.remove(6)
+    table.remove(5)
+    assert table.keys_of({"price": {">=": 3}}) == [4, 7]
+    assert table.keys_of({"price": None}) == [1]
+
+
+def test_search_db_finds_records_through_indexes():
+    search = SearchDB()
+    search.create_index("trader", "timestep", "sorted")
+    search.create_index("trader", "episode")
+    for timestep in range(6):
+        search.set(("trader", timestep), {
+            "module_name": "trader",
+            "episode": "e" if timestep % 2 else "f",
+            "timestep": timestep,
+        })
+
+    found = search.find("trader", {"episode": "e", "timestep": {">": 1}})
+    assert [record["timestep"] for record in found] == [3, 5]
+    assert search.get(("trader", 3)) is search.tables["trader"].records[
+        ("trader", 3)]
+
+    found[0]["timestep"] = 100
+    assert search.find("trader", {"timestep": 100}) == []
+
+    assert search.delete_many("trader", {"episode": "f"}) == 3
+    assert len(search.tables["trader"]) == 3
+    assert not search.exists(("trader", 0))
+    assert search.exists(("trader", 1))
+
+
+def test_only_searchable_modules_mirror_their_saves(monkeypatch):
+    monkeypatch.setattr(actions, "ACTIVE_ENGINE", Engine())
+    monkeypatch.setattr(storage, "_SEARCH_DB", SearchDB())
+    quote = Quote(episode="e")
+    tick = Tick(episode="e")
+
+    quote.save_many([{"price": 1.0}, {"price": 2.0}])
+    tick.save_many([{"price": 1.0}])
+
+    assert [record["price"] for record in quote.find({"price": {">": 1}})
+            ] == [2.0]
+    assert quote.delete_many() == 2
+    assert list(storage.search_db().tables) == ["quotes"]
+    with pytest.raises(ValueError):
+        tick.find()
@@ -0,0 +1,62 @@
+from py_svm.synk.keys import (SortedDict, pack_key, unpack_key, storage_key,
+                              storage_prefix, latest_as_of)
+from py_svm.synk.storage import LocalDB
+
+
+def test_pack_key_orders_like_tuples():
+    keys = [(-5, "a", -1.5), (-1, "b", 0.0), (0, "", 2.5), (0, "a\x00b", 1.0),
+            (0, "ab", -3.0), (3, "", 0.0)]
+    packed = [pack_key(*key) for key in keys]
+    assert packed == sorted(packed)
+    assert [unpack_key(key) for key in packed] == keys
+
+
+def test_sorted_dict_scans_prefixes_after_writes_and_deletes():
+    db = SortedDict()
+    for module_id in range(3):
+        for timestep in range(3):
+            db[storage_key("e", "agent", module_id, "cash", timestep)] = timestep
+    del db[storage_key("e", "agent", 1, "cash", 1)]
+    db[storage_key("e", "agent", 1, "cash", 7)] = 7
+
+    start = storage_prefix("e", "agent", 1)
+    end = storage_prefix("e", "agent", 2)
+    assert [value for _, value in db.scan(start, end)] == [0, 2, 7]
+    assert [value for _, value in db.reverse_scan(start, end)] == [7, 2, 0]
+
+
+def test_sorted_dict_inserts_only_queue_keys():
+    db = LocalDB()
+    for index in range(1000):
+        db.set(pack_key("e", index), index)
+    cache = db.cache
+    assert len(cache._queued) == 1000 and cache._sorted == []
+
+    assert sum(1 for _ in db.scan(("e", ))) == 1000
+    assert cache._queued == [] and len(cache._sorted) == 1000
+
+    # New keys wait for the next scan, which merges them in one pass.
+    db.set(pack_key("e", -1), -1)
+    assert len(cache._queued) == 1 and len(cache._sorted) == 1000
+    assert next(db.scan(("e", )))[1] == -1
+
+
+def test_tuple_bounds_are_packed():
+    db = LocalDB()
+    for module_id in range(3):
+        db.set(storage_key("e", "agent", module_id, "cash", 0), module_id)
+    db.set(("e", "agent"), "pickled")
+
+    assert [value for _, value in db.scan(("e", "agent", 1))] == [1]
+    assert [value for _, value in db.scan(start=("e", "agent", 1),
+                                          end=("e", "agent", 3))] == [1, 2]
+
+
+def test_latest_as_of_seeks_the_local_tier():
+    db = LocalDB()
+    for timestep in (1, 4, 9):
+        db.set(storage_key("e", "agent", 0, "cash", timestep), timestep * 10)
+    assert latest_as_of(db, "e", "agent", 0, "cash", 5) == (4, 40)
+    assert latest_as_of(db, "e", "agent", 0, "cash", 0) == (None, None)
+    assert [value for _, value in db.scan_prefix(
+        storage_prefix("e", "agent", 0))] == [10, 40, 90]
@@ -0,0 +1,36 @@
+from py_svm.synk.lsm import LogStructuredStore
+
+
+def test_segments_keep_the_newest_value_of_every_key(tmp_path):
+    with LogStructuredStore(tmp_path, memtable_size=256,
+                            background=False) as store:
+        for round_ in range(3):
+            for index in range(50):
+                store[f"key-{index:02d}".encode()] = (round_, index)
+        del store[b"key-07"]
+        store.wait()
+        assert store.segments >= 2
+
+        assert store[b"key-03"] == (2, 3)
+        assert b"key-07" not in store
+        assert len(store) == 49
+        keys = [key for key, _ in store.scan(b"key-10", b"key-13")]
+        assert keys == [b"key-10", b"key-11", b"key-12"]
+        assert next(store.reverse_scan())[0] == b"key-49"
+
+        store.compact()
+        assert store.segments == 1
+        assert store.get(b"key-07") is None
+        assert store[b"key-49"] == (2, 49)
+
+
+def test_the_store_survives_a_reopen(tmp_path):
+    with LogStructuredStore(tmp_path) as store:
+        store[b"flushed"] = 1
+        store.compact()
+        store[b"logged"] = 2
+        store.delete(b"flushed")
+    with LogStructuredStore(tmp_path) as store:
+        assert store.get(b"logged") == 2
+        assert b"flushed" not in store
+        assert list(store.scan_prefix(b"log")) == [(b"logged", 2)]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from py_svm.synk.abcs.agent import Agent
+from py_svm.synk.abcs.mailbox import NO_PAYLOAD, Mailbox
+
+
+def test_messages_are_readable_after_delivery_in_send_order():
+    mailbox = Mailbox(capacity=2)
+    bid = mailbox.message_type("bid")
+    mailbox.send(0, 2, "bid", value=1.0)
+    mailbox.send(1, 3, "ask", value=2.0)
+    mailbox.send(4, 2, "ask", value=3.0)
+    mailbox.send_many([5, 6], 2, "bid", values=[4.0, 5.0])
+    assert mailbox.pending == 5
+    assert len(mailbox.inbox(2)) == 0
+
+    assert mailbox.deliver() == 5
+    inbox = mailbox.inbox(2)
+    assert inbox.senders.tolist() == [0, 4, 5, 6]
+    assert inbox.values.tolist() == [1.0, 3.0, 4.0, 5.0]
+    assert inbox.of_type(bid).senders.tolist() == [0, 5, 6]
+    assert mailbox.type_name(inbox.types[1]) == "ask"
+    assert mailbox.pending == 0
+    assert mailbox.steps == 1
+
+
+def test_counts_and_inboxes_gather_many_recipients():
+    mailbox = Mailbox()
+    mailbox.broadcast(9, [3, 1, 3, 7], "ping", value=0.5)
+    mailbox.deliver()
+
+    np.testing.assert_array_equal(mailbox.counts([1, 2, 3, 7]), [1, 0, 2, 1])
+    messages, offsets = mailbox.inboxes([3, 2, 1])
+    assert offsets.tolist() == [0, 2, 2, 3]
+    assert messages.senders.tolist() == [9, 9, 9]
+    assert len(mailbox.inbox(4)) == 0
+
+
+def test_attached_objects_live_for_one_delivery():
+    mailbox = Mailbox()
+    ref = mailbox.attach({"order": 1})
+    mailbox.send(0, 1, payload=ref)
+    mailbox.send(0, 1)
+    mailbox.deliver()
+
+    payloads = mailbox.inbox(1).payloads.tolist()
+    assert mailbox.payload(payloads[0]) == {"order": 1}
+    assert payloads[1] == NO_PAYLOAD
+    assert mailbox.payload(payloads[1]) is None
+
+    # An empty delivery drops the previous inboxes.
+    assert mailbox.deliver() == 0
+    assert len(mailbox.inbox(1)) == 0
+    assert mailbox.counts([1]).tolist() == [0]
+    assert mailbox.inboxes([1, 2])[1].tolist() == [0, 0, 0]
+
+
+def test_send_many_maps_named_kinds_to_codes():
+    mailbox = Mailbox()
+    mailbox.send_many([0, 1, 2], 5, ["bid", "ask", "bid"])
+    mailbox.deliver()
+
+    types = mailbox.inbox(5).types
+    assert [mailbox.type_name(code) for code in types] == ["bid", "ask", "bid"]
+
+
+def test_modules_find_the_mailbox_resources():
+    mailbox = Mailbox()
+    assert any(found is mailbox for found in Agent().mailboxes)
+
+
+def test_env_step_delivers_the_mailboxes():
+    main = pytest.importorskip("py_svm.synk.main")
+    from py_svm.synk.abcs.equipment import Action
+
+    env = main.AgentEnv()
+    mailbox = Mailbox()
+    env.reset()
+    mailbox.send(0, 1, "bid", value=2.0)
+    assert len(mailbox.inbox(1)) == 0
+
+    env.step(Action(name="action", value=0.5, timestep=1, episode="e"))
+
+    assert mailbox.inbox(1).values.tolist() == [2.0]
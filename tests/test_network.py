@@ -0,0 +1,77 @@
+import numpy as np
+
+from py_svm.synk.abcs.network import Network
+
+
+def test_undirected_edges_are_stored_in_both_rows():
+    network = Network()
+    network.add_edges([0, 0, 2], [1, 2, 3], [1.0, 2.0, 3.0])
+
+    np.testing.assert_array_equal(network.neighbors(0), [1, 2])
+    np.testing.assert_array_equal(network.neighbors(3), [2])
+    np.testing.assert_array_equal(network.edge_weights(2), [2.0, 3.0])
+    assert network.num_edges == 6
+    assert network.has_edge(3, 2)
+    np.testing.assert_array_equal(network.degree(), [2, 1, 2, 1])
+
+
+def test_deletes_apply_after_the_inserts_before_them():
+    network = Network(directed=True)
+    network.add_edges([0, 1], [1, 2])
+    network.remove_edges([0, 1], [1, 2])
+    network.add_edge(0, 1, 5.0)
+    network.remove_edge(7, 8)
+    assert network.staged == 6
+
+    sources, targets, weights = network.edges()
+    assert list(zip(sources.tolist(), targets.tolist(),
+                    weights.tolist())) == [(0, 1, 5.0)]
+    assert network.staged == 0
+    assert network.num_nodes == 3
+
+    network.remove_edge(1, 0)
+    assert network.has_edge(0, 1)
+
+
+def test_neighbors_many_gathers_rows_with_offsets():
+    network = Network(directed=True)
+    network.add_nodes(5)
+    network.add_edges([0, 0, 3, 4], [1, 4, 0, 2])
+
+    neighbors, offsets = network.neighbors_many([3, 1, 0])
+    np.testing.assert_array_equal(neighbors, [0, 1, 4])
+    np.testing.assert_array_equal(offsets, [0, 1, 1, 3])
+    np.testing.assert_array_equal(network.in_degree([0, 4]), [1, 1])
+    assert len(network.neighbors(99)) == 0
+
+
+def test_networkx_round_trip():
+    network = Network()
+    network.add_edges([0, 1], [1, 2], [0.5, 1.5])
+    graph = network.to_networkx()
+    assert graph[1][2]["weight"] == 1.5
+
+    copy = Network.from_networkx(graph)
+    np.testing.assert_array_equal(copy.indptr, network.indptr)
+    np.testing.assert_array_equal(copy.indices, network.indices)
+
+
+def test_has_edges_checks_both_ends_of_every_pair():
+    network = Network(directed=True)
+    network.add_edges([1, 2], [0, 2])
+
+    assert network.has_edge(1, 0)
+    assert network.has_edge(2, 2)
+    # 0 * 3 + 3 is the key of (1, 0), but 3 isn't a node.
+    assert not network.has_edge(0, 3)
+    assert network.has_edges([2, 1, 0, -1, 2], [2, 2, 0, 0, -1]).tolist() == [
+        True, False, False, False, False]
+
+    rng = np.random.default_rng(1)
+    sources, targets = rng.integers(0, 50, (2, 400))
+    dense = Network(directed=True)
+    dense.add_edges(sources, targets)
+    edges = set(zip(sources.tolist(), targets.tolist()))
+    queries = rng.integers(-2, 52, (2, 2000))
+    assert dense.has_edges(*queries).tolist() == [
+        pair in edges for pair in zip(*queries.tolist())]
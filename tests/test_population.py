@@ -0,0 +1,74 @@
+from typing import Dict, List
+
+import numpy as np
+from pydantic import Field
+
+from py_svm.synk.abcs.agent import Agent
+from py_svm.synk.abcs.population import AgentPopulation
+from py_svm.synk.ids import IdAllocator, allocating
+
+
+class Trader(Agent):
+    cash: float = 0.0
+    active: bool = True
+
+
+class Holder(Agent):
+    orders: List[int] = []
+    limits: Dict[str, float] = Field(default_factory=dict)
+
+
+class RecordingPopulation(AgentPopulation):
+
+    def save_many(self, data):
+        self.saved = data
+        return data
+
+
+def test_rows_live_in_columns():
+    population = AgentPopulation(agent_class=Trader, capacity=2)
+    rows = population.add(5, cash=10.0)
+    population["cash"][rows[::2]] += 1.0
+    population.remove(rows[1])
+
+    assert len(population) == 4
+    np.testing.assert_array_equal(population.rows_of(population.ids[rows[2:]]),
+                                  rows[2:])
+    assert population.row(int(rows[0])).cash == 11.0
+
+
+def test_save_leaves_out_the_row_column():
+    population = RecordingPopulation(agent_class=Trader)
+    rows = population.add(3, cash=5.0)
+    population.remove(rows[0])
+
+    population.save(alter={"tag": "t"})
+
+    assert [set(record) for record in population.saved] == [
+        {"entity_id", "cash", "active", "tag"}
+    ] * 2
+    assert [record["entity_id"] for record in population.saved
+           ] == population.ids[rows[1:]].tolist()
+
+
+def test_ids_keep_growing_across_a_cleared_episode():
+    population = AgentPopulation(agent_class=Trader)
+    with allocating(IdAllocator()) as ids:
+        population.add(3)
+        population.clear()
+        with allocating(ids.successor()):
+            population.add(3)
+
+    assert len(population) == 3
+    assert population.ids.tolist() == [3, 4, 5]
+    np.testing.assert_array_equal(population.rows_of([4]), [1])
+
+
+def test_mutable_defaults_are_fresh_per_row():
+    population = AgentPopulation(agent_class=Holder)
+    rows = population.add(3)
+    population.row(int(rows[0])).orders.append(1)
+    population.row(int(rows[1])).limits["cash"] = 2.0
+
+    assert population["orders"].tolist() == [[1], [], []]
+    assert population["limits"].tolist() == [{}, {"cash": 2.0}, {}]
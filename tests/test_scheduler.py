@@ -0,0 +1,90 @@
+import numpy as np
+
+from py_svm.synk.abcs.base import ModuleBase
+from py_svm.synk.abcs.scheduler import AgentBuffer, StagedActivation
+
+
+class Agent:
+
+    def __init__(self, entity_id, schedule=None, removes=None):
+        self.entity_id = entity_id
+        self.schedule = schedule
+        self.removes = removes
+        self.stages = []
+
+    def s1(self):
+        self.stages.append("s1")
+        if self.removes is not None:
+            self.schedule.remove(self.removes)
+
+    def s2(self):
+        self.stages.append("s2")
+
+
+def test_staged_activation_keeps_slots_across_stages():
+    schedule = StagedActivation(stage_list=("s1", "s2"))
+    agents = [Agent(entity_id, schedule) for entity_id in range(10)]
+    for agent in agents:
+        schedule.add(agent)
+    for agent in agents[:4]:
+        schedule.remove(agent)
+    agents[4].removes = agents[5]
+
+    schedule.step()
+
+    ran = [agent.entity_id for agent in agents if "s2" in agent.stages]
+    assert ran == [4, 6, 7, 8, 9]
+    assert schedule.get_agent_count() == 5
+    assert schedule.steps == 1
+
+
+def test_iteration_sees_removes_after_the_buffer_grows():
+    buffer = AgentBuffer(capacity=2)
+    first, second = Agent(0), Agent(1)
+    buffer.add(first)
+    buffer.add(second)
+    seen = []
+    for agent in buffer.iterate(buffer.order()):
+        seen.append(agent.entity_id)
+        if agent is first:
+            buffer.add(Agent(2))
+            buffer.remove(second)
+    assert seen == [0]
+    assert buffer.capacity == 4
+    assert [agent.entity_id for agent in buffer.agents()] == [0, 2]
+
+
+def test_buffer_compacts_once_the_step_is_over():
+    buffer = AgentBuffer()
+    agents = [Agent(entity_id) for entity_id in range(4)]
+    for agent in agents:
+        buffer.add(agent)
+    with buffer.running():
+        slots = buffer.order()
+        for agent in agents[:3]:
+            buffer.remove(agent)
+        assert buffer._size == 4
+        assert [agent.entity_id for agent in buffer.iterate(slots)] == [3]
+    assert buffer._size == 1
+    np.testing.assert_array_equal(buffer.order(), [0])
+
+
+def test_subclasses_inherit_a_copy_of_the_hook_tables():
+
+    def double(module, result):
+        return result * 2
+
+    class Parent(ModuleBase):
+        pass
+
+    Parent._step_hooks["double"] = double
+
+    class Child(Parent):
+        pass
+
+    assert Child._step_hooks == {"double": double}
+    assert Child._step_hooks is not Parent._step_hooks
+    assert "double" not in ModuleBase._step_hooks
+
+    Child._step_hooks["again"] = double
+    assert "again" not in Parent._step_hooks
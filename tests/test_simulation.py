@@ -0,0 +1,80 @@
+import pytest
+from eth_utils import ValidationError
+
+from py_svm.synk.abcs.agent import Agent
+from py_svm.synk.simulation import Simulation
+from py_svm.synk.storage import StorageModel
+
+
+class Trader(Agent):
+    cash: float = 0.0
+
+
+@pytest.fixture
+def simulation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    simulation = Simulation(StorageModel())
+    yield simulation
+    simulation.storage.flush()
+
+
+def test_forks_share_state_until_they_write(simulation):
+    simulation.set(b"price", 1)
+    left, right = simulation.fork_many(2)
+    left.set(b"price", 2)
+    right.delete(b"price")
+
+    assert simulation.get(b"price") == 1
+    assert left.get(b"price") == 2
+    assert not right.exists(b"price")
+    assert right.changes is not simulation.changes
+
+
+def test_adopting_a_fork_and_committing(simulation):
+    simulation.set(b"price", 1)
+    branch = simulation.fork()
+    branch.set(b"price", 3)
+    branch.timestep = 5
+
+    with pytest.raises(ValidationError):
+        branch.commit()
+    with pytest.raises(ValidationError):
+        simulation.commit()
+
+    simulation.adopt(branch)
+    simulation.commit()
+
+    assert simulation.changes == {}
+    assert simulation.timestep == 5
+    assert simulation.storage.get(b"price") == 3
+
+
+def test_adopting_one_fork_discards_its_siblings(simulation):
+    simulation.set(b"price", 1)
+    forks = simulation.fork_many(3)
+    forks[1].set(b"price", 2)
+
+    with pytest.raises(ValidationError):
+        simulation.commit()
+    simulation.adopt(forks[1])
+    assert simulation.forks == []
+    simulation.commit()
+    assert simulation.storage.get(b"price") == 2
+
+    with pytest.raises(ValidationError):
+        simulation.adopt(forks[0])
+    branch = simulation.fork()
+    simulation.discard(branch)
+    simulation.commit()
+
+
+def test_modules_of_one_class_keep_their_own_state(simulation):
+    first, second = Trader(cash=1.0), Trader(cash=2.0)
+    simulation.save_module(first)
+    simulation.save_module(second)
+    branch = simulation.fork()
+    first.cash = second.cash = 0.0
+
+    branch.load_module(first)
+    branch.load_module(second)
+    assert (first.cash, second.cash) == (1.0, 2.0)
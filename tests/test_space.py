@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from py_svm.synk.abcs.space import Grid, Space
+
+
+def brute_force(positions, center, radius, shape=None):
+    delta = np.abs(positions - center)
+    if shape is not None:
+        delta = np.minimum(delta, np.asarray(shape) - delta)
+    return set(np.flatnonzero(np.sqrt((delta**2).sum(axis=1)) <= radius).tolist())
+
+
+@pytest.mark.parametrize("torus", [False, True])
+def test_neighbors_match_brute_force(torus):
+    rng = np.random.default_rng(3)
+    space = Space(shape=(1.0, 2.0), cell_size=0.07, torus=torus)
+    positions = rng.random((300, 2)) * [1.0, 2.0]
+    space.place(range(300), positions)
+
+    agents = np.arange(0, 300, 7)
+    found, distances, offsets = space.neighbors(agents, 0.15)
+    for i, agent in enumerate(agents):
+        expected = brute_force(positions, positions[agent], 0.15,
+                               (1.0, 2.0) if torus else None) - {agent}
+        window = slice(offsets[i], offsets[i + 1])
+        assert set(found[window].tolist()) == expected
+        assert (distances[window] <= 0.15).all()
+    np.testing.assert_array_equal(space.neighbor_count(agents, 0.15),
+                                  np.diff(offsets))
+
+
+def test_torus_distances_wrap_around_the_edges():
+    space = Space(shape=(1.0, 1.0), cell_size=0.1, torus=True)
+    space.place([0, 1], [[0.02, 0.5], [0.98, 0.5]])
+
+    found, distances, _ = space.neighbors([0], 0.05)
+    assert found.tolist() == [1]
+    assert distances[0] == pytest.approx(0.04)
+    np.testing.assert_allclose(space.position([1]), [[0.98, 0.5]])
+    with pytest.raises(ValueError):
+        Space().place([2], [[1.5, 0.5]])
+
+
+def test_move_and_remove_update_the_hash():
+    space = Space(shape=(1.0, 1.0), cell_size=0.1)
+    space.place([5, 6, 7], [[0.1, 0.1], [0.12, 0.1], [0.9, 0.9]])
+    assert space.neighbors([5], 0.05)[0].tolist() == [6]
+
+    # A move inside of the same cell, then one across cells.
+    space.move([6], [[0.11, 0.11]])
+    assert space.neighbors([5], 0.05)[0].tolist() == [6]
+    space.move([7], [[0.1, 0.14]])
+    assert sorted(space.neighbors([5], 0.05)[0].tolist()) == [6, 7]
+
+    space.remove([6])
+    assert len(space) == 2
+    assert space.neighbors([5], 0.05)[0].tolist() == [7]
+    with pytest.raises(KeyError):
+        space.position([6])
+
+
+def test_knn_returns_the_nearest_first_padded():
+    rng = np.random.default_rng(5)
+    space = Space(shape=(1.0, 1.0), cell_size=0.05)
+    positions = rng.random((200, 2))
+    space.place(range(200), positions)
+
+    points = rng.random((10, 2))
+    ids, distances = space.knn(points, 4)
+    for point, row, row_distances in zip(points, ids, distances):
+        expected = np.sqrt(((positions - point)**2).sum(axis=1))
+        np.testing.assert_allclose(row_distances, np.sort(expected)[:4])
+        np.testing.assert_allclose(expected[row], row_distances)
+
+    few = Space(shape=(1.0, 1.0))
+    few.place([0, 1], [[0.1, 0.1], [0.9, 0.9]])
+    ids, distances = few.knn([[0.0, 0.0]], 3)
+    assert ids.tolist() == [[0, 1, -1]]
+    assert distances[0, 2] == np.inf
+
+
+def test_grid_cells_and_moore_neighbourhood():
+    grid = Grid(shape=(5, 5))
+    grid.place([0, 1, 2], [[2, 2], [3, 3], [4.6, 0.2]])
+
+    assert grid.cell_agents([4, 0]).tolist() == [2]
+    assert grid.cell_agents([0, 0]).tolist() == []
+    assert grid.is_empty([[2, 2], [1, 1], [4, 0]]).tolist() == [False, True,
+                                                                 False]
+    assert grid.neighbors([0], 1)[0].tolist() == [1]
+    von_neumann = Grid(shape=(5, 5), metric="manhattan")
+    von_neumann.place([0, 1, 2], [[2, 2], [3, 3], [2, 3]])
+    assert von_neumann.neighbors([0], 1)[0].tolist() == [2]
+    with pytest.raises(ValueError):
+        grid.place([3], [[5, 0]])
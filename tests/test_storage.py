@@ -0,0 +1,211 @@
+import threading
+
+import pytest
+from eth_utils import ValidationError
+
+from py_svm.synk.storage import (DELETE_WRAPPED, MISSING, AnalysisDB,
+                                  CacheDB, Experiment, LocalDB, StorageLayer,
+                                  StorageModel, TierWriter)
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = StorageModel()
+    yield model
+    model.flush()
+
+
+def test_commit_of_an_empty_journal_is_a_no_op(model):
+    model.commit()
+    assert model.is_flattened
+    assert model.changeset() == {}
+
+
+def test_commit_of_an_unknown_checkpoint_raises(model):
+    with pytest.raises(ValidationError):
+        model.commit(12345)
+
+
+def test_nested_checkpoints_commit_and_discard(model):
+    root = model.record()
+    model.set(b"a", b"1")
+    inner = model.record()
+    model.set(b"a", b"2")
+    model.set(b"b", b"3")
+    model.commit(inner)
+    assert model.changeset() == {b"a": b"2", b"b": b"3"}
+
+    model.discard(root)
+    assert model.changeset() == {}
+    assert model.is_flattened
+
+    model.set(b"c", b"4")
+    model.commit()
+    assert model.changeset() == {}
+    assert model.get(b"c") == b"4"
+
+
+def test_episodes_follow_the_shared_trial_count(tmp_path):
+    experiment = Experiment(tmp_path / "experiment",
+                            trials_per_episode=5,
+                            flush_every=3)
+    episodes = {}
+    for _ in range(12):
+        episodes.setdefault(experiment.trial_count // 5,
+                            set()).add(experiment.episode)
+        with experiment:
+            pass
+    experiment.close()
+
+    assert sorted(episodes) == [0, 1, 2]
+    assert all(len(ids) == 1 for ids in episodes.values())
+    assert len(set.union(*episodes.values())) == 3
+
+
+def test_workers_sharing_a_directory_agree_on_the_episode(tmp_path):
+    first = Experiment(tmp_path / "experiment", trials_per_episode=2,
+                       flush_every=0)
+    second = Experiment(tmp_path / "experiment", trials_per_episode=2,
+                        flush_every=0)
+    first.incr_trial()
+    second.incr_trial()
+    first.sync()
+    second.sync()
+    first.sync()
+    assert first.trial_count == second.trial_count == 2
+    assert first.episode == second.episode
+    first.close()
+    second.close()
+
+
+def test_analysis_db_keeps_a_bounded_number_of_values_in_memory(tmp_path):
+    db = AnalysisDB(tmp_path / "analysis", cache_size=10)
+    for index in range(100):
+        db.set(f"key-{index}".encode(), index)
+
+    assert len(db.hot.cache) == 10
+    assert len(db) == 100
+    assert db.get(b"key-3") == 3
+    assert db.probe(b"key-missing") is MISSING
+
+    db.delete(b"key-3")
+    assert not db.exists(b"key-3")
+    db.close()
+
+
+def test_analysis_db_datasets_are_empty_before_the_first_roll(tmp_path):
+    for db in (AnalysisDB(), AnalysisDB(tmp_path / "analysis")):
+        assert db.dataset("agent", "trader").count_rows() == 0
+        assert db.query("agent", "trader", episode="e").num_rows == 0
+
+        db.set(b"row", {"module_type": "agent", "module_name": "trader",
+                        "episode": "e", "timestep": 1, "cash": 2.0})
+        table = db.query("agent", "trader", episode="e")
+        assert table.column("cash").to_pylist() == [2.0]
+        db.close()
+
+
+def test_filter_rebuilds_never_drop_keys_being_written():
+    layer = StorageLayer(bloom_capacity=64)
+    keys = [f"key-{index}".encode() for index in range(5000)]
+    done = threading.Event()
+
+    def rebuild():
+        while not done.is_set():
+            layer.rebuild_filters()
+
+    rebuilder = threading.Thread(target=rebuild)
+    rebuilder.start()
+    try:
+        for start in range(0, len(keys), 50):
+            layer.apply_changeset({key: key for key in keys[start:start + 50]})
+    finally:
+        done.set()
+        rebuilder.join()
+    layer.flush()
+
+    for bloom in layer._filters:
+        assert all(key in bloom for key in keys)
+    layer.rebuild_filters()
+    assert all(key in layer._filters[0] for key in keys)
+
+
+def test_rewriting_hot_keys_never_grows_the_filters():
+    layer = StorageLayer(bloom_capacity=100)
+    keys = [f"hot-{index}".encode() for index in range(10)]
+    for step in range(2000):
+        layer.set(keys[step % 10], step)
+    layer.flush()
+
+    for stats in layer.filter_stats().values():
+        assert stats["capacity"] == 100
+        assert stats["count"] == 10
+
+    for index in range(150):
+        layer.set(f"cold-{index}".encode(), index)
+    layer.flush()
+    stats = layer.filter_stats()["local"]
+    # Rebuilt once, sized from the distinct keys of the tier.
+    assert 100 < stats["capacity"] <= 2 * 160
+    assert stats["count"] == 160
+    assert all(key in layer._filters[0] for key in keys)
+
+
+def test_storage_layer_writes_behind_and_promotes_reads():
+    local = LocalDB()
+    layer = StorageLayer(cache=CacheDB(max_entries=2), local=local)
+    for index in range(4):
+        layer.set(f"key-{index}".encode(), index)
+    layer.flush()
+
+    assert local.get(b"key-0") == 0
+    assert not layer._cache.exists(b"key-0")
+    assert layer.get(b"key-0") == 0
+    assert layer._cache.exists(b"key-0")
+    assert layer.probe(b"key-missing") is MISSING
+
+    layer.remove(b"key-1")
+    layer.flush()
+    assert not layer.exists(b"key-1")
+    assert not local.exists(b"key-1")
+
+
+def test_pending_writes_are_readable_before_they_are_applied():
+    layer = StorageLayer(cache=CacheDB(max_entries=1))
+    layer.apply_changeset({b"a": 1, b"b": 2})
+    assert layer.get(b"a") == 1
+    layer.apply_changeset({b"a": DELETE_WRAPPED})
+    layer.flush()
+    assert layer.probe(b"a") is MISSING
+    assert layer.get(b"b") == 2
+
+
+class FailingDB(LocalDB):
+    """Fails to write `b"bad"` once `gate` opens."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def set(self, key, value):
+        if key == b"bad":
+            self.gate.wait()
+            raise OSError("disk full")
+        super().set(key, value)
+
+
+def test_failed_tier_writes_clear_their_pending_keys():
+    db = FailingDB()
+    writer = TierWriter(db)
+    writer.put_many({b"a": 1, b"bad": 2})
+    writer.put_many({b"b": 3})
+    db.gate.set()
+    with pytest.raises(RuntimeError):
+        writer.flush()
+
+    assert writer.pending_keys() == []
+    assert writer.probe(b"b") is MISSING
+    writer.put(b"b", 4)
+    writer.flush()
+    assert writer.probe(b"b") == 4